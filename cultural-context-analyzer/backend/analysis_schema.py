@@ -0,0 +1,187 @@
+"""
+Cultural Analysis Schema
+
+Pydantic models for the analysis sections Gemini generates. The fields of
+`CulturalAnalysis` mirror the analysis fields of `AnalysisResponse` in
+main.py and drive both the Gemini structured-output response schema and the
+per-section validation of model output.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
+
+
+class SectionModel(BaseModel):
+    # Gemini occasionally emits years or numbers where strings are expected
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+
+class Coordinates(SectionModel):
+    lat: float
+    lng: float
+
+
+class TimelineEvent(SectionModel):
+    year: str
+    title: str
+    description: str = ""
+    significance: str = ""
+
+
+class GeographicLocation(SectionModel):
+    name: str
+    coordinates: Optional[Coordinates] = None
+    significance: str = ""
+    modern_name: str = ""
+
+
+class KeyConcept(SectionModel):
+    term: str
+    definition: str
+    context: str = ""
+    modern_parallel: str = ""
+
+
+class ExternalResources(SectionModel):
+    timeline_links: List[str] = []
+    map_links: List[str] = []
+    further_reading: List[str] = []
+
+
+class CulturalAnalysis(SectionModel):
+    """Analysis sections returned by Gemini (see AnalysisResponse in main.py)"""
+    cultural_origin: str
+    cross_cultural_connections: str
+    modern_analogy: str
+    timeline_events: List[TimelineEvent] = []
+    geographic_locations: List[GeographicLocation] = []
+    key_concepts: List[KeyConcept] = []
+    external_resources: ExternalResources = ExternalResources()
+
+
+# All analysis sections, in prompt order
+ANALYSIS_SECTIONS = list(CulturalAnalysis.model_fields.keys())
+
+# Sections every analysis must contain
+REQUIRED_SECTIONS = [
+    name for name, field in CulturalAnalysis.model_fields.items() if field.is_required()
+]
+
+# Values used when an optional section is not relevant to the text
+SECTION_DEFAULTS: Dict[str, Any] = {
+    "timeline_events": [],
+    "geographic_locations": [],
+    "key_concepts": [],
+    "external_resources": {},
+}
+
+# Values returned for sections a client did not request
+UNREQUESTED_SECTION_VALUES: Dict[str, Any] = {
+    "cultural_origin": "",
+    "cross_cultural_connections": "",
+    "modern_analogy": "",
+    **SECTION_DEFAULTS,
+}
+
+# Analysis result status, stored under the "status" key of analysis dicts.
+# Only successful analyses may be written to the long-lived analysis cache.
+ANALYSIS_STATUS_OK = "ok"
+ANALYSIS_STATUS_BLOCKED = "blocked"   # Safety filters blocked the input or the response was empty
+ANALYSIS_STATUS_INVALID = "invalid"   # Model output could not be parsed or repaired
+ANALYSIS_STATUS_ERROR = "error"       # API or network failure
+
+_section_validators = {
+    name: TypeAdapter(field.annotation)
+    for name, field in CulturalAnalysis.model_fields.items()
+}
+
+_item_validators = {
+    "timeline_events": TypeAdapter(TimelineEvent),
+    "geographic_locations": TypeAdapter(GeographicLocation),
+    "key_concepts": TypeAdapter(KeyConcept),
+}
+
+# Keys understood by Gemini's OpenAPI-subset response schema
+_GEMINI_SCHEMA_KEYS = {"type", "properties", "items", "required", "description", "enum", "nullable", "format"}
+
+
+def _to_gemini_schema(schema: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a pydantic JSON schema node to the subset Gemini accepts"""
+    if "$ref" in schema:
+        return _to_gemini_schema(defs[schema["$ref"].split("/")[-1]], defs)
+
+    # Optional[X] is emitted as anyOf [X, null]
+    if "anyOf" in schema:
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+        converted = _to_gemini_schema(options[0], defs)
+        if len(options) < len(schema["anyOf"]):
+            converted["nullable"] = True
+        return converted
+
+    converted = {key: value for key, value in schema.items() if key in _GEMINI_SCHEMA_KEYS}
+
+    if "properties" in converted:
+        converted["properties"] = {
+            name: _to_gemini_schema(prop, defs) for name, prop in converted["properties"].items()
+        }
+    if "items" in converted:
+        converted["items"] = _to_gemini_schema(converted["items"], defs)
+
+    return converted
+
+
+def build_response_schema(sections: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Build a Gemini response schema for the requested analysis sections
+
+    Args:
+        sections: Sections to include (default: all sections)
+
+    Returns:
+        Response schema dict for generation_config["response_schema"]
+    """
+    json_schema = CulturalAnalysis.model_json_schema()
+    schema = _to_gemini_schema(json_schema, json_schema.get("$defs", {}))
+
+    selected = sections or ANALYSIS_SECTIONS
+    schema["properties"] = {name: schema["properties"][name] for name in selected}
+    schema["required"] = [name for name in selected if name in REQUIRED_SECTIONS]
+
+    return schema
+
+
+def validate_section(section: str, value: Any, drop_invalid_items: bool = False) -> Tuple[bool, Any]:
+    """
+    Validate a single analysis section
+
+    Args:
+        section: Section name
+        value: Parsed JSON value for the section
+        drop_invalid_items: For list sections, drop invalid items (e.g. the
+            incomplete last item of a truncated array) instead of rejecting
+            the whole section
+
+    Returns:
+        (is_valid, value) - the value is normalized to plain JSON types when valid
+    """
+    validator = _section_validators.get(section)
+    if validator is None:
+        return False, value
+
+    try:
+        validated = validator.validate_python(value)
+        return True, validator.dump_python(validated, mode="json")
+    except ValidationError:
+        pass
+
+    if drop_invalid_items and isinstance(value, list) and section in _item_validators:
+        item_validator = _item_validators[section]
+        items = []
+        for item in value:
+            try:
+                items.append(item_validator.dump_python(item_validator.validate_python(item), mode="json"))
+            except ValidationError:
+                continue
+        return True, items
+
+    return False, value
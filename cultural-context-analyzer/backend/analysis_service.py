@@ -0,0 +1,850 @@
+"""
+Cultural Analysis Orchestration
+
+Coordinates the analysis caches and the Gemini service for the analyze
+endpoints:
+- Short-TTL in-memory negative cache for inputs blocked by safety filters
+- Supabase persistent analysis cache (21-day soft / 30-day hard TTL) for successful analyses,
+  looked up by normalized text hash and, failing that, through an in-memory
+  MinHash/LSH index of near-duplicate texts
+- Gemini API on a miss
+- Section-selective analysis: clients may request a subset of the sections.
+  Sections generated for such requests are cached individually, so a later
+  request for more sections only generates the missing ones
+- Map-reduce analysis for long documents: the text is split into chunks that
+  are analyzed (and cached) independently, then merged
+- Image analysis, either as OCR followed by text analysis or as a single
+  multimodal request that returns both (IMAGE_ANALYSIS_SINGLE_CALL)
+- Versioned cache entries: every analysis is stored with the fingerprint of
+  the prompt/model configuration that produced it. After a prompt or model
+  change, old entries are still served but regenerated in the background
+  (a bounded number at a time), and entries nobody asks for are evicted
+  gradually instead of in one wipe
+- Stale-while-revalidate: entries older than the soft TTL are served at once
+  while a background refresh regenerates them; only entries past the hard
+  TTL are misses
+- Stampede protection: concurrent misses and refreshes for the same text
+  share a single in-flight Gemini request (single-flight per key)
+- Results that a caller's latency budget routed to a cheaper model tier are
+  returned but not cached, so they are never served as the canonical analysis
+
+Only analyses with status "ok" are written to the persistent cache, so a
+transient failure is never served back as a cache hit.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from analysis_schema import (
+    ANALYSIS_SECTIONS, ANALYSIS_STATUS_OK, ANALYSIS_STATUS_BLOCKED, ANALYSIS_STATUS_ERROR,
+    REQUIRED_SECTIONS, UNREQUESTED_SECTION_VALUES
+)
+from database import (
+    evict_stale_analysis_versions, generate_text_hash, get_cached_analysis, get_cached_analysis_by_hash,
+    get_cached_sections, get_recent_cached_texts, save_analysis_cache, save_section_cache
+)
+from gemini_service import gemini_service, failure_result, AnalysisBlockedError, BLOCKED_RESULT
+from memory_cache import TTLCache
+from metrics import metrics
+from near_duplicate_index import MinHashLSH
+from ocr_service import ocr_service
+
+
+# Sentence boundaries, including Devanagari danda and CJK full stop
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?।。])\s+')
+
+# Headings such as "Chapter 3", "Part II" or "Act 1" always start a new chunk
+HEADING_PATTERN = re.compile(r'^\s*(chapter|part|act|book|section|canto)\b', re.IGNORECASE)
+
+# A paragraph whose hash is divisible by this ends a chunk (once it is big enough),
+# so boundaries depend on local content and an edit only shifts nearby chunks
+CHUNK_BOUNDARY_MODULUS = 4
+
+
+def _split_long_paragraph(paragraph: str, max_chars: int) -> List[str]:
+    """Split an oversized paragraph on sentence boundaries"""
+    pieces: List[str] = []
+    current = ""
+    for sentence in SENTENCE_BOUNDARY.split(paragraph):
+        while len(sentence) > max_chars:
+            # A single run-on "sentence" longer than a chunk: hard split on whitespace
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(text: str, max_chars: int = 3000, min_chars: int = 1000) -> List[str]:
+    """
+    Split a long document into semantically coherent chunks
+    
+    Chunks are built from whole paragraphs (oversized paragraphs are split on
+    sentence boundaries). A new chunk starts at headings, when the next
+    paragraph would overflow max_chars, or after a content-defined boundary
+    paragraph once the chunk has min_chars. Because boundaries are mostly
+    determined by the paragraphs themselves, editing one chapter leaves the
+    other chunks - and their cache entries - unchanged.
+    
+    Args:
+        text: Document text
+        max_chars: Maximum characters per chunk
+        min_chars: Minimum characters before a content-defined boundary may end a chunk
+    
+    Returns:
+        List of chunk texts in document order
+    """
+    paragraphs: List[str] = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > max_chars:
+            paragraphs.extend(_split_long_paragraph(paragraph, max_chars))
+        else:
+            paragraphs.append(paragraph)
+    
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    
+    for paragraph in paragraphs:
+        starts_section = bool(HEADING_PATTERN.match(paragraph))
+        if current and (starts_section or size + len(paragraph) + 2 > max_chars):
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        
+        current.append(paragraph)
+        size += len(paragraph) + 2
+        
+        digest = int(hashlib.md5(paragraph.encode('utf-8')).hexdigest(), 16)
+        if size >= min_chars and digest % CHUNK_BOUNDARY_MODULUS == 0:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+    
+    if current:
+        chunks.append("\n\n".join(current))
+    
+    return chunks
+
+
+def _dedupe_key(*values: Any) -> Tuple[str, ...]:
+    """Normalize values (case, punctuation, whitespace) for deduplication"""
+    return tuple(re.sub(r'\W+', ' ', str(value or '')).strip().casefold() for value in values)
+
+
+def _year_sort_key(event: Dict[str, Any]) -> float:
+    """Sort key for timeline events; BCE years are negative, unknown years last"""
+    year = str(event.get("year", ""))
+    match = re.search(r'\d+', year)
+    if not match:
+        return float('inf')
+    value = int(match.group())
+    return -value if re.search(r'\b(BC|BCE)\b', year, re.IGNORECASE) else value
+
+
+def merge_chunk_analyses(analyses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge the structured sections of chunk analyses with deduplication
+    
+    Timeline events are deduplicated on (year, title) and sorted
+    chronologically, locations on name, key concepts on term, and external
+    resource links on URL. First occurrence wins.
+    
+    Args:
+        analyses: Chunk analyses in document order
+    
+    Returns:
+        Dictionary with the merged list/resource sections
+    """
+    merge_rules = {
+        "timeline_events": lambda item: _dedupe_key(item.get("year"), item.get("title")),
+        "geographic_locations": lambda item: _dedupe_key(item.get("name")),
+        "key_concepts": lambda item: _dedupe_key(item.get("term")),
+    }
+    
+    merged: Dict[str, Any] = {}
+    for section, key_for in merge_rules.items():
+        seen = set()
+        items = []
+        for analysis in analyses:
+            for item in analysis.get(section) or []:
+                key = key_for(item)
+                if key in seen:
+                    continue
+                seen.add(key)
+                items.append(item)
+        merged[section] = items
+    
+    merged["timeline_events"].sort(key=_year_sort_key)
+    
+    resources: Dict[str, List[str]] = {}
+    for analysis in analyses:
+        for kind, links in (analysis.get("external_resources") or {}).items():
+            bucket = resources.setdefault(kind, [])
+            for link in links or []:
+                if link not in bucket:
+                    bucket.append(link)
+    merged["external_resources"] = resources
+    
+    return merged
+
+
+class AnalysisService:
+    """Service that serves cultural analyses from cache or Gemini"""
+    
+    def __init__(self):
+        # Blocked inputs are remembered briefly to absorb retry storms
+        self.negative_cache = TTLCache(
+            maxsize=int(os.getenv("ANALYSIS_NEGATIVE_CACHE_SIZE", "1000")),
+            ttl_seconds=float(os.getenv("ANALYSIS_NEGATIVE_CACHE_TTL_SECONDS", "600")),
+            name="analysis.negative_cache"
+        )
+        
+        # Near-duplicate cache hits. Only texts up to the length stored in
+        # analysis_cache.original_text are indexed, so the index can be rebuilt
+        # from Supabase after a restart
+        self.near_duplicate_enabled = os.getenv("NEAR_DUPLICATE_CACHE", "true").lower() == "true"
+        self.near_duplicate_max_chars = 5000
+        self.near_duplicates = MinHashLSH(
+            threshold=float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9")),
+            max_entries=int(os.getenv("NEAR_DUPLICATE_INDEX_SIZE", "50000"))
+        )
+        
+        # Long-document (map-reduce) mode
+        self.long_document_threshold = int(os.getenv("LONG_DOCUMENT_THRESHOLD_CHARS", "6000"))
+        self.chunk_max_chars = int(os.getenv("LONG_DOCUMENT_CHUNK_CHARS", "3000"))
+        self.chunk_concurrency = int(os.getenv("LONG_DOCUMENT_MAX_CONCURRENCY", "4"))
+        
+        # Image analysis: one multimodal request instead of OCR + analysis
+        self.image_single_call = os.getenv("IMAGE_ANALYSIS_SINGLE_CALL", "false").lower() == "true"
+        
+        # Entries older than the soft TTL are served while refreshed; past the hard TTL they are misses
+        self.soft_ttl_days = float(os.getenv("ANALYSIS_CACHE_SOFT_TTL_DAYS", "21"))
+        self.hard_ttl_days = int(os.getenv("ANALYSIS_CACHE_HARD_TTL_DAYS", "30"))
+        
+        # Background regeneration of stale or outdated-version entries
+        self.refresh_concurrency = int(os.getenv("ANALYSIS_REFRESH_CONCURRENCY", "2"))
+        self.refresh_max_pending = int(os.getenv("ANALYSIS_REFRESH_MAX_PENDING", "100"))
+        self._refresh_semaphore: Optional[asyncio.Semaphore] = None
+        self._refreshing: Set[Tuple[str, ...]] = set()
+        
+        # In-flight generations by (text_hash, sections...) - shared by concurrent misses and refreshes
+        self._inflight: Dict[Tuple[str, ...], "asyncio.Future"] = {}
+        
+        # Gradual eviction of outdated entries nobody requests (opt-in, and only
+        # of entries older than the minimum age)
+        self.version_eviction_enabled = os.getenv("ANALYSIS_VERSION_EVICTION", "false").lower() == "true"
+        self.version_eviction_min_age_days = int(os.getenv("ANALYSIS_VERSION_EVICTION_MIN_AGE_DAYS", "7"))
+        self.version_eviction_interval = float(os.getenv("ANALYSIS_VERSION_EVICTION_INTERVAL_SECONDS", "900"))
+        self.version_eviction_batch = int(os.getenv("ANALYSIS_VERSION_EVICTION_BATCH", "100"))
+    
+    def record_result(self, text: str, language: str, analysis_result: Dict[str, Any]):
+        """
+        Store a fresh Gemini result in the appropriate cache
+        
+        Successful analyses go to the persistent Supabase cache, blocked ones
+        to the short-lived negative cache. Other failures are not cached.
+        
+        Args:
+            text: Analyzed text
+            language: Language code
+            analysis_result: Result from gemini_service
+        """
+        status = analysis_result.get("status")
+        
+        if status == ANALYSIS_STATUS_OK:
+            print(f"💾 Saving to Supabase cache...")
+            saved = save_analysis_cache(text, language, analysis_result, prompt_version=gemini_service.prompt_version)
+            if saved and self._near_duplicate_eligible(text):
+                self.near_duplicates.add(generate_text_hash(text, language), text, language)
+        elif status == ANALYSIS_STATUS_BLOCKED:
+            print(f"🚫 Remembering blocked input in negative cache")
+            self.negative_cache.set(generate_text_hash(text, language), analysis_result)
+        else:
+            print(f"⏭️  Not caching failed analysis (status: {status})")
+    
+    def _near_duplicate_eligible(self, text: str) -> bool:
+        return self.near_duplicate_enabled and len(text) <= self.near_duplicate_max_chars
+    
+    def get_cached(self, text: str, language: str, current_only: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached analysis for the text or a near-duplicate of it
+        
+        Args:
+            text: Text to analyze
+            language: Language code
+            current_only: Treat stale or outdated-version entries as misses
+                (instead of serving them and refreshing in the background)
+        
+        Returns:
+            Cached analysis or None on a miss
+        """
+        print(f"🔍 Checking Supabase cache...")
+        cached_result = get_cached_analysis(text, language, days=self.hard_ttl_days)
+        if cached_result:
+            # Evaluate both checks so that both are counted
+            outdated = self._is_outdated(cached_result)
+            if self._is_stale(cached_result) or outdated:
+                if current_only:
+                    return None
+                self._schedule_refresh(text, language)
+            return cached_result
+        if not self._near_duplicate_eligible(text):
+            return None
+        
+        match = self.near_duplicates.query(text, language)
+        if match is None:
+            return None
+        
+        text_hash, similarity = match
+        cached_result = get_cached_analysis_by_hash(text_hash, language, days=self.hard_ttl_days)
+        if cached_result is None:
+            # Entry expired or was cleared - stop matching against it
+            self.near_duplicates.remove(text_hash)
+            return None
+        
+        # Only counted: an outdated near-duplicate is refreshed when its own text is requested
+        outdated = self._is_outdated(cached_result)
+        if current_only and (self._is_stale(cached_result) or outdated):
+            return None
+        
+        print(f"🎯 Near-duplicate cache HIT (similarity {similarity:.2f})")
+        metrics.increment("analysis.near_duplicate_hits")
+        return cached_result
+    
+    def _is_outdated(self, cached_result: Dict[str, Any]) -> bool:
+        """Whether a cached analysis was generated with another prompt/model configuration"""
+        if cached_result.get("prompt_version") == gemini_service.prompt_version:
+            return False
+        metrics.increment("analysis.outdated_version_hits")
+        return True
+    
+    def _is_stale(self, cached_result: Dict[str, Any]) -> bool:
+        """Whether a cached analysis is past the soft TTL (but, being served, within the hard TTL)"""
+        try:
+            created_at = datetime.fromisoformat(str(cached_result.get("created_at")).replace("Z", "+00:00"))
+        except ValueError:
+            return False
+        age_days = (datetime.utcnow() - created_at.replace(tzinfo=None)).total_seconds() / 86400
+        if age_days < self.soft_ttl_days:
+            return False
+        metrics.increment("analysis.stale_hits")
+        return True
+    
+    def _start_flight(self, key: Tuple[str, ...], operation: Awaitable[Dict[str, Any]]) -> "asyncio.Future":
+        """Run a generation as the in-flight request for its key"""
+        future = asyncio.ensure_future(operation)
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return future
+    
+    async def _single_flight(
+        self,
+        key: Tuple[str, ...],
+        generate: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Join the in-flight generation for a key, or start it
+        
+        The shared future is shielded, so a client that disconnects does not
+        cancel the generation for the others.
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._start_flight(key, generate())
+        else:
+            print(f"🤝 Joining in-flight analysis for the same text")
+            metrics.increment("analysis.coalesced_misses")
+        return dict(await asyncio.shield(future))
+    
+    @staticmethod
+    def _generation_key(text_hash: str, sections: List[str], budget_routed: bool = False) -> Tuple[str, ...]:
+        """In-flight key of a generation; budget-routed ones are not shared with canonical requests"""
+        return (text_hash, *sections, "budget_routed") if budget_routed else (text_hash, *sections)
+    
+    @staticmethod
+    def _full_analysis_key(text_hash: str) -> Tuple[str, ...]:
+        """In-flight key of a complete analysis - shared by misses, long documents and refreshes"""
+        return (text_hash, *ANALYSIS_SECTIONS)
+    
+    def _schedule_refresh(self, text: str, language: str):
+        """Regenerate a cached analysis in the background (at most once per text at a time)"""
+        key = self._full_analysis_key(generate_text_hash(text, language))
+        if key in self._inflight:
+            metrics.increment("analysis.refreshes_deduplicated")
+            return
+        if len(self._refreshing) >= self.refresh_max_pending:
+            metrics.increment("analysis.refreshes_skipped")
+            return
+        
+        metrics.increment("analysis.refreshes_scheduled")
+        self._refreshing.add(key)
+        future = self._start_flight(key, self._refresh(text, language))
+        future.add_done_callback(lambda _: self._refreshing.discard(key))
+    
+    async def _refresh(self, text: str, language: str) -> Dict[str, Any]:
+        """Regenerate an analysis and overwrite its cache entry if the new one succeeds"""
+        if self._refresh_semaphore is None:
+            self._refresh_semaphore = asyncio.Semaphore(self.refresh_concurrency)
+        
+        async with self._refresh_semaphore:
+            print(f"♻️ Refreshing cached analysis in the background...")
+            started = time.monotonic()
+            try:
+                if len(text) > self.long_document_threshold:
+                    analysis_result = await self.analyze_long_document(text, language)
+                else:
+                    analysis_result = await gemini_service.analyze_cultural_context(text=text, language=language)
+            except Exception as e:
+                print(f"⚠️ Background refresh failed: {e}")
+                analysis_result = failure_result(
+                    ANALYSIS_STATUS_ERROR,
+                    f"Error: {str(e)}",
+                    "Analysis failed.",
+                    "Please try again."
+                )
+            metrics.observe("analysis.refresh_latency", time.monotonic() - started)
+            
+            # A failed refresh keeps serving the old entry
+            if analysis_result.get("status") == ANALYSIS_STATUS_OK:
+                metrics.increment("analysis.refreshes")
+                self.record_result(text, language, analysis_result)
+            else:
+                metrics.increment("analysis.refresh_failures")
+            return analysis_result
+    
+    async def evict_outdated_versions(self):
+        """
+        Delete outdated cache entries in small batches, forever (started on startup)
+        
+        Does nothing unless ANALYSIS_VERSION_EVICTION is enabled. The first
+        batch is deleted one interval after startup, not at boot.
+        """
+        if not self.version_eviction_enabled:
+            return
+        while True:
+            await asyncio.sleep(self.version_eviction_interval)
+            await asyncio.to_thread(
+                evict_stale_analysis_versions,
+                gemini_service.prompt_version,
+                self.version_eviction_batch,
+                self.version_eviction_min_age_days
+            )
+    
+    def prewarm_near_duplicate_index(self, limit: int = 5000):
+        """Index the texts of recent analysis cache entries (called on startup)"""
+        if not self.near_duplicate_enabled:
+            return
+        
+        rows = get_recent_cached_texts(limit)
+        # Oldest first, so the index evicts the oldest entries if it is full
+        for row in reversed(rows):
+            if row.get("original_text") and self._near_duplicate_eligible(row["original_text"]):
+                self.near_duplicates.add(row["text_hash"], row["original_text"], row["language"])
+        print(f"✅ Near-duplicate index loaded with {len(self.near_duplicates)} cached texts")
+    
+    async def get_or_create_analysis(
+        self,
+        text: str,
+        language: str,
+        long_document: Optional[bool] = None,
+        sections: Optional[List[str]] = None,
+        latency_budget_ms: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Get a cultural analysis from cache, or generate it with Gemini
+        
+        Args:
+            text: Text to analyze
+            language: Language code
+            long_document: Force (True) or disable (False) map-reduce analysis;
+                by default texts longer than LONG_DOCUMENT_THRESHOLD_CHARS use it
+            sections: Sections to return (default: all). Sections that were not
+                requested are returned empty
+            latency_budget_ms: Caller's latency budget; a tight budget routes a
+                cache miss to a faster model tier
+        
+        Returns:
+            Analysis dictionary tagged with a "status"
+        """
+        if long_document is None:
+            long_document = len(text) > self.long_document_threshold
+        
+        return await self._get_or_create(text, language, long_document, sections, latency_budget_ms)
+    
+    async def analyze_image(
+        self,
+        image_data: bytes,
+        language: str,
+        mime_type: str = "image/jpeg",
+        single_call: Optional[bool] = None
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        Extract the text of an image and analyze it
+        
+        A cached OCR result is always preferred, so a repeat image needs at
+        most the (usually cached) text analysis. On an OCR miss, single-call
+        mode extracts and analyzes in one multimodal request and stores the
+        extracted text and the analysis in their caches.
+        
+        Args:
+            image_data: Uploaded image bytes
+            language: Language code
+            mime_type: MIME type of the upload
+            single_call: Use one multimodal request (default: IMAGE_ANALYSIS_SINGLE_CALL)
+        
+        Returns:
+            (ocr_result, analysis) - analysis is None if no usable text was extracted
+        """
+        if single_call is None:
+            single_call = self.image_single_call
+        
+        ocr_result = await asyncio.to_thread(ocr_service.get_cached, image_data) if single_call else None
+        
+        if ocr_result is None and single_call:
+            metrics.increment("analysis.single_call_images")
+            combined = await gemini_service.analyze_image_with_context(
+                image_data, language=language, mime_type=mime_type
+            )
+            ocr_result, analysis = combined["ocr"], combined["analysis"]
+            if not ocr_result.get("success"):
+                return ocr_result, None
+            
+            await asyncio.to_thread(ocr_service.save, image_data, ocr_result)
+            self.record_result(ocr_result["text"], language, analysis)
+            return ocr_result, analysis
+        
+        if ocr_result is None:
+            ocr_result = await ocr_service.extract_text(image_data, mime_type=mime_type)
+        if not ocr_result.get("success"):
+            return ocr_result, None
+        
+        analysis = await self.get_or_create_analysis(ocr_result["text"], language)
+        return ocr_result, analysis
+    
+    @staticmethod
+    def _requested_sections(sections: Optional[List[str]]) -> List[str]:
+        """Requested sections in canonical order (all sections by default)"""
+        return [section for section in ANALYSIS_SECTIONS if section in (sections or ANALYSIS_SECTIONS)]
+    
+    @staticmethod
+    def _select_sections(analysis: Dict[str, Any], requested: List[str]) -> Dict[str, Any]:
+        """Blank out the sections a client did not request"""
+        if len(requested) == len(ANALYSIS_SECTIONS):
+            return analysis
+        selected = dict(analysis)
+        for section, empty_value in UNREQUESTED_SECTION_VALUES.items():
+            if section not in requested:
+                selected[section] = empty_value
+        return selected
+    
+    def _store_sections(
+        self,
+        text: str,
+        language: str,
+        cached_sections: Dict[str, Any],
+        generated: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Cache freshly generated sections and combine them with the cached ones
+        
+        A combination that covers every section is stored as a complete
+        analysis; otherwise the new sections go to the per-section cache.
+        """
+        sections = {**cached_sections, **generated}
+        analysis = {**sections, "status": ANALYSIS_STATUS_OK}
+        
+        if all(section in sections for section in ANALYSIS_SECTIONS):
+            self.record_result(text, language, analysis)
+        else:
+            save_section_cache(
+                generate_text_hash(text, language), language, generated, prompt_version=gemini_service.prompt_version
+            )
+        
+        return analysis
+    
+    async def _get_or_create(
+        self,
+        text: str,
+        language: str,
+        long_document: bool = False,
+        sections: Optional[List[str]] = None,
+        latency_budget_ms: Optional[int] = None,
+        current_only: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Serve from the negative/persistent caches, generating on a miss
+        
+        With current_only, stale or outdated-version cache entries are
+        regenerated instead of served (used for chunks whose merge is cached).
+        """
+        requested = self._requested_sections(sections)
+        text_hash = generate_text_hash(text, language)
+        
+        blocked = self.negative_cache.get(text_hash)
+        if blocked:
+            print(f"🚫 Negative cache HIT - input was recently blocked")
+            return dict(blocked)
+        
+        # Check Supabase persistent cache first
+        cached_result = self.get_cached(text, language, current_only=current_only)
+        
+        if cached_result:
+            print(f"🎯 Cache HIT! Skipping Gemini API call...")
+            return self._select_sections(cached_result, requested)
+        
+        if long_document:
+            # Map-reduce always produces (and caches) the complete analysis
+            async def generate_long_document() -> Dict[str, Any]:
+                analysis_result = await self.analyze_long_document(text, language)
+                self.record_result(text, language, analysis_result)
+                return analysis_result
+            
+            analysis_result = await self._single_flight(self._full_analysis_key(text_hash), generate_long_document)
+            return self._select_sections(analysis_result, requested)
+        
+        cached_sections = get_cached_sections(
+            text_hash, language, requested, prompt_version=gemini_service.prompt_version
+        )
+        missing = [section for section in requested if section not in cached_sections]
+        if cached_sections:
+            print(f"🎯 Section cache HIT for {len(cached_sections)} of {len(requested)} section(s)")
+            metrics.increment("analysis.section_cache_hits", len(cached_sections))
+        
+        if not missing:
+            return self._select_sections({**cached_sections, "status": ANALYSIS_STATUS_OK}, requested)
+        
+        budget_routed = gemini_service.router.is_budget_routed(len(text), missing, latency_budget_ms)
+        
+        async def generate_missing() -> Dict[str, Any]:
+            print(f"❌ Cache MISS. Calling Gemini API for {len(missing)} section(s)...")
+            metrics.increment("analysis.sections_generated", len(missing))
+            analysis_result = await gemini_service.analyze_cultural_context(
+                text=text,
+                language=language,
+                sections=missing,
+                latency_budget_ms=latency_budget_ms
+            )
+            
+            if analysis_result.get("status") != ANALYSIS_STATUS_OK:
+                self.record_result(text, language, analysis_result)
+                return analysis_result
+            
+            generated = {section: analysis_result[section] for section in missing if section in analysis_result}
+            if budget_routed:
+                metrics.increment("analysis.budget_routed_uncached")
+                return {**cached_sections, **generated, "status": ANALYSIS_STATUS_OK}
+            return self._store_sections(text, language, cached_sections, generated)
+        
+        analysis_result = await self._single_flight(self._generation_key(text_hash, missing, budget_routed), generate_missing)
+        if analysis_result.get("status") != ANALYSIS_STATUS_OK:
+            return analysis_result
+        return self._select_sections(analysis_result, requested)
+    
+    async def analyze_long_document(self, text: str, language: str) -> Dict[str, Any]:
+        """
+        Map-reduce analysis of a long document
+        
+        Map: chunks are analyzed concurrently (at most
+        LONG_DOCUMENT_MAX_CONCURRENCY at a time), each cached under its own
+        hash so an edit to one chapter only re-analyzes that chunk. Stale or
+        outdated-version chunk entries are regenerated rather than reused, since
+        the merge is cached as a current analysis.
+        Reduce: timelines, locations, concepts and resources are merged with
+        deduplication, and one small Gemini call merges the narrative fields.
+        
+        Args:
+            text: Document text
+            language: Language code
+        
+        Returns:
+            Merged analysis dictionary tagged with a "status"
+        """
+        chunks = split_into_chunks(text, max_chars=self.chunk_max_chars, min_chars=self.chunk_max_chars // 3)
+        if len(chunks) <= 1:
+            return await gemini_service.analyze_cultural_context(text=text, language=language)
+        
+        print(f"📚 Long document: analyzing {len(chunks)} chunks (max {self.chunk_concurrency} concurrent)")
+        metrics.increment("analysis.long_documents")
+        metrics.increment("analysis.long_document_chunks", len(chunks))
+        
+        semaphore = asyncio.Semaphore(self.chunk_concurrency)
+        
+        async def analyze_chunk(chunk: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._get_or_create(chunk, language, current_only=True)
+        
+        chunk_results = await asyncio.gather(*(analyze_chunk(chunk) for chunk in chunks))
+        
+        succeeded = [result for result in chunk_results if result.get("status") == ANALYSIS_STATUS_OK]
+        if not succeeded:
+            # Every chunk failed - surface the first failure as-is
+            return chunk_results[0]
+        
+        merged = merge_chunk_analyses(succeeded)
+        
+        if len(succeeded) == 1:
+            narratives = {section: succeeded[0][section] for section in REQUIRED_SECTIONS}
+        else:
+            try:
+                narratives = await gemini_service.merge_narrative_sections(succeeded, language)
+            except Exception as e:
+                print(f"⚠️ Narrative merge failed: {e}")
+                narratives = {}
+            
+            # Fall back to joining the chunk narratives for anything the reduce call missed
+            for section in REQUIRED_SECTIONS:
+                if section not in narratives:
+                    narratives[section] = "\n\n".join(
+                        dict.fromkeys(result[section] for result in succeeded if result.get(section))
+                    )
+        
+        merged.update(narratives)
+        
+        # A partial merge is returned to the user but must not be cached as the full analysis
+        if len(succeeded) < len(chunk_results):
+            print(f"⚠️ {len(chunk_results) - len(succeeded)} of {len(chunk_results)} chunks failed")
+            merged["status"] = ANALYSIS_STATUS_ERROR
+        else:
+            merged["status"] = ANALYSIS_STATUS_OK
+        
+        return merged
+    
+    async def stream_analysis(
+        self,
+        text: str,
+        language: str,
+        sections: Optional[List[str]] = None,
+        latency_budget_ms: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream analysis sections from cache or Gemini
+        
+        Cached sections are yielded at once. Streamed Gemini results are
+        cached once complete.
+        
+        Args:
+            text: Text to analyze
+            language: Language code
+            sections: Sections to produce (default: all); only these are yielded
+            latency_budget_ms: Caller's latency budget, used for model routing
+        
+        Yields:
+            (section, value) tuples
+        
+        Raises:
+            AnalysisBlockedError: If the input is (or was recently) blocked
+            ValueError: If required sections could not be produced
+        """
+        requested = self._requested_sections(sections)
+        
+        if len(text) > self.long_document_threshold:
+            # Long documents are merged from chunk analyses, so sections arrive together
+            analysis_result = await self.get_or_create_analysis(text, language, long_document=True)
+            status = analysis_result.get("status")
+            if status == ANALYSIS_STATUS_BLOCKED:
+                raise AnalysisBlockedError("Input was blocked by safety filters")
+            if status != ANALYSIS_STATUS_OK:
+                # Failure placeholders (or a partial merge) must not be streamed as sections
+                raise ValueError(f"Long document analysis failed (status: {status})")
+            for section in requested:
+                yield section, analysis_result.get(section, UNREQUESTED_SECTION_VALUES[section])
+            return
+        
+        text_hash = generate_text_hash(text, language)
+        if self.negative_cache.get(text_hash):
+            print(f"🚫 Negative cache HIT - input was recently blocked")
+            raise AnalysisBlockedError("Input was recently blocked by safety filters")
+        
+        cached_result = self.get_cached(text, language)
+        
+        if cached_result:
+            print(f"🎯 Cache HIT! Skipping Gemini API call...")
+            for section in requested:
+                yield section, cached_result[section]
+            return
+        
+        cached_sections = get_cached_sections(
+            text_hash, language, requested, prompt_version=gemini_service.prompt_version
+        )
+        for section, value in cached_sections.items():
+            yield section, value
+        
+        missing = [section for section in requested if section not in cached_sections]
+        if not missing:
+            return
+        
+        budget_routed = gemini_service.router.is_budget_routed(len(text), missing, latency_budget_ms)
+        key = self._generation_key(text_hash, missing, budget_routed)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Another request is generating these sections - wait for it instead of opening a second stream
+            print(f"🤝 Joining in-flight analysis for the same text")
+            metrics.increment("analysis.coalesced_misses")
+            analysis_result = await asyncio.shield(inflight)
+            if analysis_result.get("status") == ANALYSIS_STATUS_BLOCKED:
+                raise AnalysisBlockedError("Input was blocked by safety filters")
+            if analysis_result.get("status") != ANALYSIS_STATUS_OK:
+                raise ValueError("Concurrent analysis of the same text failed")
+            for section in missing:
+                yield section, analysis_result[section]
+            return
+        
+        # Concurrent requests for the same sections get the complete result once the stream ends
+        leader: "asyncio.Future" = asyncio.get_running_loop().create_future()
+        self._inflight[key] = leader
+        outcome = failure_result(
+            ANALYSIS_STATUS_ERROR,
+            "Error: analysis stream ended early",
+            "Analysis failed.",
+            "Please try again."
+        )
+        
+        print(f"❌ Cache MISS. Streaming {len(missing)} section(s) from Gemini API...")
+        metrics.increment("analysis.sections_generated", len(missing))
+        generated: Dict[str, Any] = {}
+        try:
+            async for section, value in gemini_service.stream_cultural_context(
+                text, language, sections=missing, latency_budget_ms=latency_budget_ms
+            ):
+                generated[section] = value
+                yield section, value
+            
+            # Optional sections the model left out are empty, as in analyze_cultural_context
+            for section in missing:
+                if section not in generated:
+                    generated[section] = UNREQUESTED_SECTION_VALUES[section]
+                    yield section, generated[section]
+            
+            if budget_routed:
+                metrics.increment("analysis.budget_routed_uncached")
+                outcome = {**cached_sections, **generated, "status": ANALYSIS_STATUS_OK}
+            else:
+                outcome = self._store_sections(text, language, cached_sections, generated)
+        except AnalysisBlockedError:
+            self.negative_cache.set(text_hash, dict(BLOCKED_RESULT))
+            outcome = dict(BLOCKED_RESULT)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            leader.set_result(outcome)
+
+
+# Singleton instance
+analysis_service = AnalysisService()
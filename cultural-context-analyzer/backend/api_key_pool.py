@@ -0,0 +1,249 @@
+"""
+Pool of Gemini API keys
+
+Each key has its own quota, so spreading requests over several keys (e.g.
+during peak classroom usage) raises the service's throughput. Every key gets
+its own API client; requests pick a key either least-loaded (fewest
+requests in flight) or round-robin. Requests and tokens are counted per key,
+and a key that answers with a quota error (429 / RESOURCE_EXHAUSTED) is
+skipped until its cooldown has passed.
+
+Configure with a comma-separated list:
+    GEMINI_API_KEYS=key-one,key-two,key-three
+A single GEMINI_API_KEY works as a pool of one.
+
+google-generativeai has no public way to give a GenerativeModel its own
+client: the per-key client is set on the model's _async_client attribute.
+The SDK is pinned in requirements.txt, and PooledModel checks on creation
+that the attribute still exists, failing at startup rather than silently
+sending every request with the default key.
+"""
+
+import itertools
+import os
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from metrics import metrics
+
+QUOTA_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+)
+
+KEY_SELECTION_STRATEGIES = ("least_loaded", "round_robin")
+
+
+class APIKeySlot:
+    """One API key with its client and usage accounting"""
+
+    def __init__(self, key_id: str, api_key: str):
+        """
+        Args:
+            key_id: Name used in logs and metrics (never the key itself)
+            api_key: Gemini API key
+        """
+        self.key_id = key_id
+        self.api_key = api_key
+        self.in_flight = 0
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.quota_errors = 0
+        self.cooldown_until = 0.0
+        self.client = None
+
+    def cooling_down(self, now: float) -> bool:
+        return self.cooldown_until > now
+
+
+class APIKeyPool:
+    """Select an API key per request and track per-key usage"""
+
+    def __init__(
+        self,
+        api_keys: List[str],
+        strategy: str = "least_loaded",
+        cooldown_seconds: float = 60.0
+    ):
+        """
+        Args:
+            api_keys: Gemini API keys
+            strategy: "least_loaded" or "round_robin"
+            cooldown_seconds: How long a key is skipped after a quota error
+        """
+        if strategy not in KEY_SELECTION_STRATEGIES:
+            raise ValueError(f"Unknown key selection strategy: {strategy}")
+
+        self.slots = [APIKeySlot(f"key{index}", key) for index, key in enumerate(api_keys, start=1)]
+        self.strategy = strategy
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._round_robin = itertools.cycle(range(len(self.slots))) if self.slots else None
+        # Streamed responses -> key slot, until their usage has been recorded
+        self._streams: "weakref.WeakKeyDictionary[Any, APIKeySlot]" = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_env(cls) -> "APIKeyPool":
+        """Build the pool from GEMINI_API_KEYS (or GEMINI_API_KEY) and GEMINI_KEY_* settings"""
+        keys = [key.strip() for key in os.getenv("GEMINI_API_KEYS", "").split(",") if key.strip()]
+        if not keys and os.getenv("GEMINI_API_KEY"):
+            keys = [os.getenv("GEMINI_API_KEY", "")]
+
+        return cls(
+            keys,
+            strategy=os.getenv("GEMINI_KEY_STRATEGY", "least_loaded"),
+            cooldown_seconds=float(os.getenv("GEMINI_KEY_COOLDOWN_SECONDS", "60"))
+        )
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def available_count(self) -> int:
+        """Number of keys not cooling down"""
+        now = time.monotonic()
+        return sum(1 for slot in self.slots if not slot.cooling_down(now))
+
+    def acquire(self) -> APIKeySlot:
+        """
+        Pick a key for a request and count it as in flight
+
+        Keys cooling down are skipped; if all of them are, the one whose
+        cooldown ends first is used rather than failing the request.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = [slot for slot in self.slots if not slot.cooling_down(now)]
+            if not available:
+                slot = min(self.slots, key=lambda candidate: candidate.cooldown_until)
+            elif self.strategy == "round_robin":
+                while True:
+                    slot = self.slots[next(self._round_robin)]  # type: ignore
+                    if slot in available:
+                        break
+            else:
+                slot = min(available, key=lambda candidate: (candidate.in_flight, candidate.requests))
+
+            slot.in_flight += 1
+            slot.requests += 1
+
+        metrics.increment(f"gemini.key.{slot.key_id}.requests")
+        return slot
+
+    def release(self, slot: APIKeySlot, error: Optional[BaseException] = None):
+        """Mark a request as finished; quota errors start the key's cooldown"""
+        with self._lock:
+            slot.in_flight -= 1
+            if isinstance(error, QUOTA_ERRORS):
+                slot.quota_errors += 1
+                slot.cooldown_until = time.monotonic() + self.cooldown_seconds
+
+        if isinstance(error, QUOTA_ERRORS):
+            metrics.increment(f"gemini.key.{slot.key_id}.quota_errors")
+            print(f"⏸️ Gemini {slot.key_id} hit its quota, cooling down for {self.cooldown_seconds:.0f}s")
+
+    def record_usage(self, slot: APIKeySlot, response):
+        """Add a response's token counts to its key"""
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+
+        with self._lock:
+            slot.input_tokens += input_tokens
+            slot.output_tokens += output_tokens
+        metrics.increment(f"gemini.key.{slot.key_id}.input_tokens", input_tokens)
+        metrics.increment(f"gemini.key.{slot.key_id}.output_tokens", output_tokens)
+
+    def track_stream(self, slot: APIKeySlot, response):
+        """Remember which key serves a stream; its usage is known only once consumed"""
+        self._streams[response] = slot
+
+    def record_stream_usage(self, response):
+        """Record token usage of a fully consumed streamed response"""
+        slot = self._streams.pop(response, None)
+        if slot is not None:
+            self.record_usage(slot, response)
+
+    def client_for(self, slot: APIKeySlot):
+        """Async Gemini client bound to the slot's key, created on first use"""
+        if slot.client is None:
+            slot.client = glm.GenerativeServiceAsyncClient(client_options={"api_key": slot.api_key})
+        return slot.client
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Per-key usage and cooldown state"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": slot.key_id,
+                    "in_flight": slot.in_flight,
+                    "requests": slot.requests,
+                    "input_tokens": slot.input_tokens,
+                    "output_tokens": slot.output_tokens,
+                    "quota_errors": slot.quota_errors,
+                    "cooldown_remaining": round(max(0.0, slot.cooldown_until - now), 1),
+                }
+                for slot in self.slots
+            ]
+
+
+class PooledModel:
+    """
+    A Gemini model whose requests are spread over an APIKeyPool
+
+    Drop-in for GenerativeModel.generate_content_async: each call picks a
+    key, so a retry after a quota error goes to a different key.
+    """
+
+    def __init__(self, model_name: str, pool: APIKeyPool):
+        """
+        Args:
+            model_name: Gemini model name
+            pool: Keys to spread requests over
+        """
+        self.model_name = model_name
+        self.pool = pool
+        self._models: Dict[str, Any] = {}
+
+        if not hasattr(genai.GenerativeModel(model_name), "_async_client"):  # type: ignore
+            raise RuntimeError(
+                f"google-generativeai {genai.__version__} has no GenerativeModel._async_client; "
+                "per-key clients cannot be set. Install the version pinned in requirements.txt."
+            )
+
+    def _model_for(self, slot: APIKeySlot):
+        if slot.key_id not in self._models:
+            model = genai.GenerativeModel(self.model_name)  # type: ignore
+            model._async_client = self.pool.client_for(slot)
+            self._models[slot.key_id] = model
+        return self._models[slot.key_id]
+
+    async def generate_content_async(self, contents, generation_config=None, stream: bool = False, **kwargs):
+        slot = self.pool.acquire()
+        error: Optional[BaseException] = None
+        try:
+            response = await self._model_for(slot).generate_content_async(
+                contents,
+                generation_config=generation_config,
+                stream=stream,
+                **kwargs
+            )
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # Streams release their key once open, like the concurrency semaphore
+            self.pool.release(slot, error)
+
+        if stream:
+            self.pool.track_stream(slot, response)
+        else:
+            self.pool.record_usage(slot, response)
+        return response
@@ -0,0 +1,111 @@
+"""
+Analysis cache replay benchmark
+
+Replays a log of analyze requests in order against simulated analysis caches
+and reports the hit rate of each cache key strategy:
+- legacy: text.strip().lower() hash (before canonical normalization)
+- normalized: generate_text_hash (NFKC, punctuation folding, whitespace collapsing)
+- near-duplicate: normalized hash, then the MinHash/LSH near-duplicate index
+
+Every miss is treated as a successful analysis that gets cached, as in
+production. Requests come from a JSONL file with {"text": ..., "language": ...}
+per line, or from the analyses history table in Supabase.
+
+Usage (from backend/):
+    python benchmarks/cache_replay_benchmark.py requests.jsonl [--threshold 0.9]
+    python benchmarks/cache_replay_benchmark.py --from-supabase [--limit 5000]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from near_duplicate_index import MinHashLSH  # noqa: E402
+from text_normalization import normalize_text  # noqa: E402
+
+# Same limit as AnalysisService.near_duplicate_max_chars
+NEAR_DUPLICATE_MAX_CHARS = 5000
+
+
+def load_requests(args) -> List[Tuple[str, str]]:
+    if args.from_supabase:
+        from database import supabase
+        response = supabase.table('analyses')\
+            .select('input_text, language')\
+            .order('created_at')\
+            .limit(args.limit)\
+            .execute()
+        return [(row['input_text'], row.get('language') or 'en') for row in response.data or []]
+
+    requests = []
+    with open(args.log_file, encoding="utf-8") as log:
+        for line in log:
+            if line.strip():
+                entry = json.loads(line)
+                requests.append((entry["text"], entry.get("language") or "en"))
+    return requests
+
+
+def key(text: str, language: str) -> str:
+    return hashlib.sha256(f"{text}|{language}".encode("utf-8")).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log_file", type=Path, nargs="?")
+    parser.add_argument("--from-supabase", action="store_true", help="Replay the analyses history table")
+    parser.add_argument("--limit", type=int, default=5000)
+    parser.add_argument("--threshold", type=float, default=0.9, help="Near-duplicate similarity threshold")
+    args = parser.parse_args()
+
+    if not args.from_supabase and args.log_file is None:
+        parser.error("Provide a log file or --from-supabase")
+
+    requests = load_requests(args)
+    if not requests:
+        print("No requests to replay")
+        return
+
+    legacy, normalized = set(), set()
+    index = MinHashLSH(threshold=args.threshold)
+    hits = {"legacy": 0, "normalized": 0, "near-duplicate": 0}
+    lookup_seconds = 0.0
+
+    for text, language in requests:
+        legacy_key = key(text.strip().lower(), language)
+        hits["legacy"] += legacy_key in legacy
+        legacy.add(legacy_key)
+
+        normalized_key = key(normalize_text(text), language)
+        if normalized_key in normalized:
+            hits["normalized"] += 1
+            hits["near-duplicate"] += 1
+            continue
+        normalized.add(normalized_key)
+
+        if len(text) <= NEAR_DUPLICATE_MAX_CHARS:
+            started = time.perf_counter()
+            match = index.query(text, language)
+            lookup_seconds += time.perf_counter() - started
+            if match is not None:
+                hits["near-duplicate"] += 1
+                continue
+            index.add(normalized_key, text, language)
+
+    total = len(requests)
+    print(f"Replayed {total} requests (threshold {args.threshold})\n")
+    for strategy, count in hits.items():
+        uplift = (count - hits["legacy"]) / total * 100
+        print(f"  {strategy:15} hit rate {count / total * 100:6.2f}%  ({count} hits, {uplift:+.2f} pts vs legacy)")
+    print(f"\n  mean near-duplicate lookup {lookup_seconds / total * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Entity cache round-trip benchmark
+
+Compares per-entity cache access (one get_cached_entity query and one
+save_entity_cache upsert per entity, as before) against the bulk path used by
+analyze_text_with_entities (one get_cached_entities query and one
+save_entity_cache_bulk upsert per request). Reports Supabase round trips and
+wall time for a cold request (every entity is a miss and gets written) and a
+warm request (every entity is a hit).
+
+Runs against the configured Supabase project. The benchmark rows are named
+"__benchmark__ ..." and deleted afterwards.
+
+Usage (from backend/):
+    python benchmarks/entity_cache_roundtrip_benchmark.py [--entities 10] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import (  # noqa: E402
+    get_cached_entities,
+    get_cached_entity,
+    save_entity_cache,
+    save_entity_cache_bulk,
+    supabase,
+)
+from metrics import metrics  # noqa: E402
+
+ROUND_TRIPS = "supabase.entity_cache.round_trips"
+BENCHMARK_PREFIX = "__benchmark__"
+
+
+def round_trips() -> float:
+    return metrics.snapshot()["counters"].get(ROUND_TRIPS, 0)
+
+
+def build_entities(count: int, run: int):
+    entity_types = ["PERSON", "GPE", "ORG", "WORK_OF_ART"]
+    return [
+        (f"{BENCHMARK_PREFIX} {run} entity {index}", entity_types[index % len(entity_types)])
+        for index in range(count)
+    ]
+
+
+def record(entity_name: str, entity_type: str):
+    return {
+        "entity_name": entity_name,
+        "entity_type": entity_type,
+        "summary": f"Benchmark summary for {entity_name}",
+        "url": None,
+        "categories": [],
+        "cultural_significance": "general",
+        "wikidata": None,
+        "source": "Benchmark",
+        "created_at": datetime.utcnow().isoformat()
+    }
+
+
+def per_entity_request(entities):
+    """Pre-change path: look each entity up, write each miss"""
+    for entity_name, entity_type in entities:
+        if not get_cached_entity(entity_name, entity_type):
+            save_entity_cache(record(entity_name, entity_type))
+
+
+def bulk_request(entities):
+    """Bulk path: one lookup, one upsert for the misses"""
+    cached = get_cached_entities(entities)
+    save_entity_cache_bulk([record(name, entity_type) for name, entity_type in entities if (name, entity_type) not in cached])
+
+
+def measure(request, entities):
+    trips_before = round_trips()
+    started = time.perf_counter()
+    request(entities)
+    return round_trips() - trips_before, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=10, help="Entities per simulated request")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    try:
+        for run in range(args.repeat):
+            for name, request in (("per-entity", per_entity_request), ("bulk", bulk_request)):
+                entities = build_entities(args.entities, f"{run}-{name}")
+                for phase in ("cold", "warm"):
+                    trips, elapsed = measure(request, entities)
+                    totals = results.setdefault((name, phase), [0.0, 0.0])
+                    totals[0] += trips
+                    totals[1] += elapsed
+    finally:
+        supabase.table('entity_cache').delete().like('entity_name', f"{BENCHMARK_PREFIX}%").execute()
+
+    print(f"{args.entities} entities per request, averaged over {args.repeat} runs\n")
+    print(f"{'path':<12} {'request':<6} {'round trips':>12} {'ms':>9}")
+    for (name, phase), (trips, elapsed) in results.items():
+        print(f"{name:<12} {phase:<6} {trips / args.repeat:12.1f} {elapsed / args.repeat * 1000:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
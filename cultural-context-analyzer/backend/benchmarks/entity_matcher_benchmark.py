@@ -0,0 +1,138 @@
+"""
+Entity matcher benchmark
+
+Compares full NER against the dictionary fast path used for short texts
+(phrase matcher over known entity names, NER only on the remaining spans).
+For each text size it reports latency per text for both, the share of
+characters the fast path still sent to NER, and the fast path's recall and
+precision against full NER (same span and label).
+
+The dictionary is either the entity names in entity_cache (--from-supabase)
+or a random fraction of the entities full NER finds in the corpus itself
+(--known-fraction), which simulates how much of incoming text is already
+cached.
+
+Usage (from backend/):
+    python benchmarks/entity_matcher_benchmark.py [--text-file corpus.txt] [--sizes 100 300 1000]
+        [--texts 300] [--known-fraction 0.8] [--from-supabase]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entity_matcher import EntityPhraseMatcher  # noqa: E402
+from metrics import metrics  # noqa: E402
+from nlp_service import ENTITY_MATCHER_MAX_PATTERNS, SPACY_MODEL, load_spacy_pipeline  # noqa: E402
+
+SAMPLE_PASSAGE = (
+    "Mahatma Gandhi led the Salt March from Sabarmati to Dandi in 1930. "
+    "Jawaharlal Nehru later spoke of India's tryst with destiny in New Delhi. "
+    "In Kolkata, Rabindranath Tagore founded Visva-Bharati, and the Mahabharata "
+    "was retold on stage by Peter Brook in Paris. Shakespeare's Hamlet was "
+    "translated into Bengali, and the Taj Mahal in Agra drew visitors from Japan. "
+)
+
+
+def build_text(passage: str, size: int) -> str:
+    """Repeat the passage until it is at least `size` characters long, then cut on a space"""
+    text = passage * (size // len(passage) + 1)
+    return text[:size].rsplit(" ", 1)[0]
+
+
+def entity_set(candidates):
+    return {(start, end, label) for _, label, start, end in candidates}
+
+
+def timed(function, texts):
+    """Results and per-text latencies in milliseconds"""
+    results, latencies = [], []
+    for text in texts:
+        started = time.perf_counter()
+        results.append(function(text))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return results, latencies
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=SPACY_MODEL)
+    parser.add_argument("--text-file", help="Corpus to cut texts from instead of the built-in sample")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 300, 1000], help="Text sizes in characters")
+    parser.add_argument("--texts", type=int, default=300, help="Texts per size")
+    parser.add_argument("--known-fraction", type=float, default=0.8, help="Share of corpus entities in the dictionary")
+    parser.add_argument("--from-supabase", action="store_true", help="Use the entity names in entity_cache")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    passage = SAMPLE_PASSAGE
+    if args.text_file:
+        with open(args.text_file, encoding="utf-8") as handle:
+            passage = " ".join(handle.read().split()) + " "
+
+    nlp = load_spacy_pipeline(args.model)
+    nlp.max_length = max(args.sizes) + 1
+
+    corpus = {
+        size: [build_text(passage[offset % len(passage):] + passage, size) for offset in range(0, args.texts * 7, 7)]
+        for size in args.sizes
+    }
+
+    def full_ner(text):
+        return [(ent.text, ent.label_, ent.start_char, ent.end_char) for ent in nlp(text).ents]
+
+    matcher = EntityPhraseMatcher(nlp, max_patterns=ENTITY_MATCHER_MAX_PATTERNS)
+    if args.from_supabase:
+        from database import get_cached_entity_names
+
+        matcher.add((row["entity_name"], row["entity_type"]) for row in get_cached_entity_names(matcher.max_patterns))
+        print(f"dictionary: {len(matcher)} names from entity_cache\n")
+    else:
+        known = sorted({
+            (text, label)
+            for texts in corpus.values()
+            for candidates in map(full_ner, texts)
+            for text, label, _, _ in candidates
+        })
+        known = random.Random(args.seed).sample(known, int(len(known) * args.known_fraction))
+        matcher.add(known)
+        print(f"dictionary: {len(matcher)} names ({args.known_fraction:.0%} of the corpus entities)\n")
+
+    print(
+        f"{'chars':>6} {'NER ms':>8} {'p95':>7} {'fast ms':>8} {'p95':>7} {'speedup':>8} "
+        f"{'NER share':>10} {'recall':>7} {'precision':>10}"
+    )
+    for size, texts in corpus.items():
+        full_ner(texts[0])  # warm-up
+        truth, ner_latencies = timed(full_ner, texts)
+
+        ner_chars = metrics.get("nlp.matcher.ner_chars")
+        total_chars = metrics.get("nlp.matcher.total_chars")
+        fast, fast_latencies = timed(matcher.extract, texts)
+        ner_share = (metrics.get("nlp.matcher.ner_chars") - ner_chars) / max(1, metrics.get("nlp.matcher.total_chars") - total_chars)
+
+        found = sum(len(entity_set(expected) & entity_set(got)) for expected, got in zip(truth, fast))
+        expected_total = sum(len(entity_set(expected)) for expected in truth)
+        got_total = sum(len(entity_set(got)) for got in fast)
+
+        ner_mean = statistics.mean(ner_latencies)
+        fast_mean = statistics.mean(fast_latencies)
+        print(
+            f"{size:6d} {ner_mean:8.2f} {percentile(ner_latencies, 95):7.2f} "
+            f"{fast_mean:8.2f} {percentile(fast_latencies, 95):7.2f} {ner_mean / fast_mean:7.1f}x "
+            f"{ner_share:10.0%} {found / max(1, expected_total):7.1%} {found / max(1, got_total):10.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
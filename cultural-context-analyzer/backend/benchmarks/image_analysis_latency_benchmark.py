@@ -0,0 +1,83 @@
+"""
+Image analysis latency benchmark
+
+Compares the two ways /api/analyze/image can use Gemini for every image in
+a local directory, bypassing all caches:
+- two-step: Gemini Vision OCR, then cultural analysis of the extracted text
+- single-call: one multimodal request returning extracted text and analysis
+
+Usage (from backend/, with GEMINI_API_KEY set):
+    python benchmarks/image_analysis_latency_benchmark.py path/to/images [--language en] [--runs 3]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini_service import gemini_service  # noqa: E402
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff", ".bmp"}
+
+
+async def two_step(image_data: bytes, language: str) -> bool:
+    ocr = await gemini_service.extract_text_from_image(image_data)
+    if not ocr.get("success"):
+        return False
+    analysis = await gemini_service.analyze_cultural_context(ocr["text"], language)
+    return analysis.get("status") == "ok"
+
+
+async def single_call(image_data: bytes, language: str) -> bool:
+    result = await gemini_service.analyze_image_with_context(image_data, language=language)
+    return bool(result["analysis"]) and result["analysis"].get("status") == "ok"
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"mean {statistics.mean(ordered):6.2f}s  p50 {statistics.median(ordered):6.2f}s  p95 {p95:6.2f}s"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir", type=Path)
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per image and mode")
+    args = parser.parse_args()
+
+    images = sorted(p for p in args.image_dir.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not images:
+        print(f"No images found in {args.image_dir}")
+        return
+
+    modes = {"two-step": two_step, "single-call": single_call}
+    latencies = {mode: [] for mode in modes}
+    failures = {mode: 0 for mode in modes}
+
+    print(f"{'image':30} {'mode':12} {'latency s':>10} {'ok':>4}")
+    for path in images:
+        image_data = path.read_bytes()
+        for _ in range(args.runs):
+            # Alternate the order so neither mode benefits from warm connections
+            for mode, run in modes.items():
+                started = time.perf_counter()
+                ok = await run(image_data, args.language)
+                elapsed = time.perf_counter() - started
+                latencies[mode].append(elapsed)
+                failures[mode] += 0 if ok else 1
+                print(f"{path.name[:30]:30} {mode:12} {elapsed:10.2f} {'yes' if ok else 'no':>4}")
+            modes = dict(reversed(list(modes.items())))
+
+    print("\nSummary")
+    for mode, values in latencies.items():
+        print(f"  {mode:12} {summarize(values)}  failures {failures[mode]}/{len(values)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+OCR preprocessing benchmark
+
+Compares Gemini Vision OCR on the original upload against the preprocessed
+image (EXIF orientation, grayscale, downscale, adaptive re-encode) for every
+image in a local directory. Reports bytes sent, OCR latency and, when a
+ground-truth transcript `<image name>.txt` sits next to the image, text
+accuracy (difflib similarity ratio).
+
+Usage (from backend/, with GEMINI_API_KEY set):
+    python benchmarks/ocr_preprocessing_benchmark.py path/to/images [--max-long-edge 2048]
+"""
+
+import argparse
+import asyncio
+import difflib
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+
+from gemini_service import gemini_service  # noqa: E402
+from image_preprocessing import preprocess_image_for_ocr  # noqa: E402
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff", ".bmp"}
+
+
+def accuracy(extracted: str, truth_path: Path):
+    """Similarity between extracted text and the ground-truth transcript, if present"""
+    if not truth_path.exists():
+        return None
+    truth = " ".join(truth_path.read_text(encoding="utf-8").split())
+    return difflib.SequenceMatcher(None, " ".join(extracted.split()), truth).ratio()
+
+
+async def run_mode(image_data: bytes, preprocess: bool, max_long_edge: int):
+    if preprocess:
+        data, mime_type, _ = preprocess_image_for_ocr(image_data, max_long_edge=max_long_edge)
+    else:
+        data = image_data
+        mime_type = Image.MIME.get(Image.open(io.BytesIO(image_data)).format or "", "image/jpeg")
+
+    started = time.perf_counter()
+    result = await gemini_service.extract_text_from_image(data, mime_type=mime_type, preprocess=False)
+    return len(data), time.perf_counter() - started, result.get("text", "")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir", type=Path)
+    parser.add_argument("--max-long-edge", type=int, default=2048)
+    args = parser.parse_args()
+
+    images = sorted(p for p in args.image_dir.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not images:
+        print(f"No images found in {args.image_dir}")
+        return
+
+    totals = {mode: {"bytes": 0, "latency": 0.0, "accuracy": []} for mode in ("original", "preprocessed")}
+
+    print(f"{'image':30} {'mode':13} {'KB sent':>9} {'latency s':>10} {'accuracy':>9}")
+    for path in images:
+        image_data = path.read_bytes()
+        for mode, preprocess in (("original", False), ("preprocessed", True)):
+            sent, latency, text = await run_mode(image_data, preprocess, args.max_long_edge)
+            score = accuracy(text, path.with_suffix(".txt"))
+            totals[mode]["bytes"] += sent
+            totals[mode]["latency"] += latency
+            if score is not None:
+                totals[mode]["accuracy"].append(score)
+            score_text = f"{score:.3f}" if score is not None else "-"
+            print(f"{path.name[:30]:30} {mode:13} {sent / 1024:9.0f} {latency:10.2f} {score_text:>9}")
+
+    print("\nSummary")
+    for mode, total in totals.items():
+        scores = total["accuracy"]
+        mean_accuracy = f"{sum(scores) / len(scores):.3f}" if scores else "-"
+        print(
+            f"  {mode:13} total {total['bytes'] / 1024 / 1024:.1f} MB, "
+            f"mean latency {total['latency'] / len(images):.2f}s, mean accuracy {mean_accuracy}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
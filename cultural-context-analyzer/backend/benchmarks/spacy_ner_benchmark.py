@@ -0,0 +1,104 @@
+"""
+spaCy NER pipeline benchmark
+
+Compares the full pipeline against the NER-only pipeline used by the NLP
+service (tagger, parser, attribute ruler and lemmatizer excluded) on texts of
+different sizes. Reports tokens per second for both and checks that they
+find the same entities. Then compares one-at-a-time processing against
+batched nlp.pipe (as in extract_entities_batch) on many short texts.
+
+Texts are built by repeating a sample passage, or taken from a file.
+
+Usage (from backend/):
+    python benchmarks/spacy_ner_benchmark.py [--text-file passage.txt] [--sizes 200 2000 20000] [--repeat 20]
+        [--batch-docs 500] [--batch-size 64] [--n-process 1]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nlp_service import SPACY_BATCH_SIZE, SPACY_MODEL, load_spacy_pipeline  # noqa: E402
+
+SAMPLE_PASSAGE = (
+    "In 1498 Vasco da Gama reached Calicut, opening the sea route from Portugal to India. "
+    "The Mughal emperor Akbar later built Fatehpur Sikri near Agra, where scholars debated "
+    "in the Ibadat Khana. Centuries afterwards, Rabindranath Tagore wrote Gitanjali in Bengali "
+    "and became the first non-European to win the Nobel Prize in Literature. "
+)
+
+
+def build_text(passage: str, size: int) -> str:
+    """Repeat the passage until it is at least `size` characters long, then cut on a space"""
+    text = passage * (size // len(passage) + 1)
+    return text[:size].rsplit(" ", 1)[0]
+
+
+def entities(nlp, text: str):
+    return [(ent.text, ent.label_, ent.start_char) for ent in nlp(text).ents]
+
+
+def tokens_per_second(nlp, text: str, repeat: int) -> float:
+    nlp(text)  # warm-up
+    started = time.perf_counter()
+    tokens = 0
+    for _ in range(repeat):
+        tokens += len(nlp(text))
+    return tokens / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=SPACY_MODEL)
+    parser.add_argument("--text-file", help="Passage to repeat instead of the built-in sample")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 2000, 20000], help="Text sizes in characters")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--batch-docs", type=int, default=500, help="Short texts for the batching comparison")
+    parser.add_argument("--batch-size", type=int, default=SPACY_BATCH_SIZE)
+    parser.add_argument("--n-process", type=int, default=1)
+    args = parser.parse_args()
+
+    passage = SAMPLE_PASSAGE
+    if args.text_file:
+        with open(args.text_file, encoding="utf-8") as handle:
+            passage = handle.read()
+
+    full = load_spacy_pipeline(args.model, ner_only=False)
+    ner_only = load_spacy_pipeline(args.model, ner_only=True)
+    full.max_length = ner_only.max_length = max(args.sizes) + 1
+    print(f"full pipeline:     {', '.join(full.pipe_names)}")
+    print(f"NER-only pipeline: {', '.join(ner_only.pipe_names)}\n")
+
+    print(f"{'chars':>8} {'full tok/s':>12} {'NER-only tok/s':>15} {'speedup':>8} {'same entities':>14}")
+    for size in args.sizes:
+        text = build_text(passage, size)
+        full_rate = tokens_per_second(full, text, args.repeat)
+        ner_rate = tokens_per_second(ner_only, text, args.repeat)
+        same = entities(full, text) == entities(ner_only, text)
+        print(f"{len(text):8d} {full_rate:12.0f} {ner_rate:15.0f} {ner_rate / full_rate:7.1f}x {str(same):>14}")
+
+    texts = [build_text(passage[offset % len(passage):] + passage, 200) for offset in range(args.batch_docs)]
+    started = time.perf_counter()
+    sequential = [[ent.text for ent in ner_only(text).ents] for text in texts]
+    sequential_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batched = [
+        [ent.text for ent in doc.ents]
+        for doc in ner_only.pipe(texts, batch_size=args.batch_size, n_process=args.n_process)
+    ]
+    batched_time = time.perf_counter() - started
+
+    print(f"\n{len(texts)} short texts (NER-only pipeline)")
+    print(f"  one at a time: {len(texts) / sequential_time:8.0f} docs/s")
+    print(
+        f"  nlp.pipe:      {len(texts) / batched_time:8.0f} docs/s "
+        f"(batch_size={args.batch_size}, n_process={args.n_process}, same entities: {sequential == batched})"
+    )
+
+
+if __name__ == "__main__":
+    main()
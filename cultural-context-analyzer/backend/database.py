@@ -2,9 +2,13 @@ from datetime import datetime
 from dotenv import load_dotenv
 import os
 from supabase import create_client, Client
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import hashlib
 
+from analysis_schema import ANALYSIS_STATUS_OK
+from metrics import metrics
+from text_normalization import normalize_text
+
 # Load environment variables
 load_dotenv()
 
@@ -123,6 +127,7 @@ def get_cached_entity(entity_name: str, entity_type: str) -> Optional[Dict[str,
         Cached entity data or None if not found
     """
     try:
+        metrics.increment("supabase.entity_cache.round_trips")
         response = supabase.table('entity_cache').select('*').eq('entity_name', entity_name).eq('entity_type', entity_type).execute()
         return response.data[0] if response.data else None
     except Exception as e:
@@ -142,6 +147,7 @@ def save_entity_cache(entity_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     try:
         # Use upsert to handle duplicates gracefully
+        metrics.increment("supabase.entity_cache.round_trips")
         response = supabase.table('entity_cache').upsert(entity_data, on_conflict='entity_name,entity_type').execute()
         return response.data[0] if response.data else None
     except Exception as e:
@@ -149,6 +155,274 @@ def save_entity_cache(entity_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         return None
 
 
+def get_cached_entities(entities: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """
+    Get cached data for several entities in one query
+    
+    Args:
+        entities: (entity_name, entity_type) pairs
+    
+    Returns:
+        Dictionary of (entity_name, entity_type) -> cached entity data, for the entities found
+    """
+    if not entities:
+        return {}
+    
+    try:
+        metrics.increment("supabase.entity_cache.round_trips")
+        response = supabase.table('entity_cache')\
+            .select('*')\
+            .in_('entity_name', sorted({name for name, _ in entities}))\
+            .in_('entity_type', sorted({entity_type for _, entity_type in entities}))\
+            .execute()
+        
+        # The query matches the cross product of names and types - keep the requested pairs
+        wanted = set(entities)
+        return {
+            (row['entity_name'], row['entity_type']): row
+            for row in response.data or []
+            if (row['entity_name'], row['entity_type']) in wanted
+        }
+    except Exception as e:
+        print(f"❌ Error fetching cached entities: {e}")
+        return {}
+
+
+def save_entity_cache_bulk(entities: List[Dict[str, Any]]) -> int:
+    """
+    Save several entity enrichments in one upsert
+    
+    Args:
+        entities: Entity records (as for save_entity_cache)
+    
+    Returns:
+        Number of records written (0 on error)
+    """
+    # One row per key - Postgres rejects an upsert that touches the same row twice
+    rows = list({(entity['entity_name'], entity['entity_type']): entity for entity in entities}.values())
+    if not rows:
+        return 0
+    
+    try:
+        metrics.increment("supabase.entity_cache.round_trips")
+        supabase.table('entity_cache').upsert(rows, on_conflict='entity_name,entity_type').execute()
+        return len(rows)
+    except Exception as e:
+        print(f"❌ Error caching entities: {e}")
+        return 0
+
+
+def get_cached_entity_by_wikidata_id(wikidata_id: str, entity_type: str) -> Optional[Dict[str, Any]]:
+    """
+    Get the cached entity with a Wikidata QID (whatever name it was stored under)
+    
+    Args:
+        wikidata_id: Wikidata QID (e.g. "Q1001")
+        entity_type: Type of entity
+    
+    Returns:
+        Cached entity data or None
+    """
+    try:
+        metrics.increment("supabase.entity_cache.round_trips")
+        response = supabase.table('entity_cache')\
+            .select('*')\
+            .eq('wikidata_id', wikidata_id)\
+            .eq('entity_type', entity_type)\
+            .limit(1)\
+            .execute()
+        return response.data[0] if response.data else None
+    except Exception as e:
+        print(f"❌ Error fetching cached entity by QID: {e}")
+        return None
+
+
+def get_entity_aliases(aliases: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """
+    Resolve canonical entity aliases to their cached entity names in one query
+    
+    Args:
+        aliases: (alias, entity_type) pairs
+    
+    Returns:
+        Dictionary of (alias, entity_type) -> alias row (entity_name, wikidata_id), for the aliases found
+    """
+    if not aliases:
+        return {}
+    
+    try:
+        metrics.increment("supabase.entity_cache.round_trips")
+        response = supabase.table('entity_aliases')\
+            .select('*')\
+            .in_('alias', sorted({alias for alias, _ in aliases}))\
+            .in_('entity_type', sorted({entity_type for _, entity_type in aliases}))\
+            .execute()
+        
+        wanted = set(aliases)
+        return {
+            (row['alias'], row['entity_type']): row
+            for row in response.data or []
+            if (row['alias'], row['entity_type']) in wanted
+        }
+    except Exception as e:
+        print(f"❌ Error fetching entity aliases: {e}")
+        return {}
+
+
+def save_entity_aliases(aliases: List[Dict[str, Any]]) -> int:
+    """
+    Save entity aliases in one upsert
+    
+    Args:
+        aliases: Rows with alias, entity_type, entity_name and wikidata_id
+    
+    Returns:
+        Number of aliases written (0 on error)
+    """
+    rows = list({(alias['alias'], alias['entity_type']): alias for alias in aliases}.values())
+    if not rows:
+        return 0
+    
+    try:
+        metrics.increment("supabase.entity_cache.round_trips")
+        supabase.table('entity_aliases').upsert(rows, on_conflict='alias,entity_type').execute()
+        return len(rows)
+    except Exception as e:
+        print(f"❌ Error saving entity aliases: {e}")
+        return 0
+
+
+def get_negative_entities(aliases: List[Tuple[str, str]], hours: int = 24) -> List[Tuple[str, str]]:
+    """
+    Find entities recently looked up without results, in one query
+    
+    Args:
+        aliases: (alias, entity_type) pairs
+        hours: Negative entries older than this are ignored
+    
+    Returns:
+        The (alias, entity_type) pairs with a recent negative entry
+    """
+    if not aliases:
+        return []
+    
+    try:
+        from datetime import timedelta
+        cutoff_date = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+        
+        metrics.increment("supabase.entity_cache.round_trips")
+        response = supabase.table('entity_negative_cache')\
+            .select('alias, entity_type')\
+            .in_('alias', sorted({alias for alias, _ in aliases}))\
+            .in_('entity_type', sorted({entity_type for _, entity_type in aliases}))\
+            .gt('created_at', cutoff_date)\
+            .execute()
+        
+        wanted = set(aliases)
+        return [
+            (row['alias'], row['entity_type'])
+            for row in response.data or []
+            if (row['alias'], row['entity_type']) in wanted
+        ]
+    except Exception as e:
+        print(f"❌ Error fetching negative entity cache: {e}")
+        return []
+
+
+def save_negative_entities(aliases: List[Tuple[str, str]]) -> int:
+    """
+    Remember entities that no knowledge source knows, in one upsert
+    
+    Args:
+        aliases: (alias, entity_type) pairs
+    
+    Returns:
+        Number of entries written (0 on error)
+    """
+    created_at = datetime.utcnow().isoformat()
+    rows = [
+        {'alias': alias, 'entity_type': entity_type, 'created_at': created_at}
+        for alias, entity_type in set(aliases)
+    ]
+    if not rows:
+        return 0
+    
+    try:
+        metrics.increment("supabase.entity_cache.round_trips")
+        supabase.table('entity_negative_cache').upsert(rows, on_conflict='alias,entity_type').execute()
+        return len(rows)
+    except Exception as e:
+        print(f"❌ Error saving negative entity cache: {e}")
+        return 0
+
+
+def clear_old_negative_entities(hours: int = 24):
+    """
+    Delete expired negative entity cache entries
+    
+    Args:
+        hours: Age after which entries expire
+    """
+    try:
+        from datetime import timedelta
+        cutoff_date = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+        
+        supabase.table('entity_negative_cache').delete().lt('created_at', cutoff_date).execute()
+    except Exception as e:
+        print(f"❌ Error clearing negative entity cache: {e}")
+
+
+def get_cached_extraction(text_hash: str, model_version: str, max_enrich: int) -> Optional[Dict[str, Any]]:
+    """
+    Get the cached entity analysis of a text
+    
+    Args:
+        text_hash: Hash of the exact text
+        model_version: spaCy model version the entities were extracted with
+        max_enrich: Number of entities that were enriched
+    
+    Returns:
+        Dictionary with entities, result (None if incomplete) and enriched_at, or None
+    """
+    try:
+        response = supabase.table('entity_extraction_cache')\
+            .select('entities, result, enriched_at')\
+            .eq('text_hash', text_hash)\
+            .eq('model_version', model_version)\
+            .eq('max_enrich', max_enrich)\
+            .execute()
+        return response.data[0] if response.data else None
+    except Exception as e:
+        print(f"❌ Error fetching cached entity extraction: {e}")
+        return None
+
+
+def save_extraction_cache(text_hash: str, model_version: str, max_enrich: int, extraction: Dict[str, Any]) -> bool:
+    """
+    Save the entity analysis of a text
+    
+    Args:
+        text_hash: Hash of the exact text
+        model_version: spaCy model version the entities were extracted with
+        max_enrich: Number of entities that were enriched
+        extraction: Dictionary with entities, result and enriched_at
+    
+    Returns:
+        True if saved
+    """
+    try:
+        supabase.table('entity_extraction_cache').upsert({
+            'text_hash': text_hash,
+            'model_version': model_version,
+            'max_enrich': max_enrich,
+            **extraction
+        }, on_conflict='text_hash,model_version,max_enrich').execute()
+        return True
+    except Exception as e:
+        print(f"❌ Error caching entity extraction: {e}")
+        return False
+
+
 def get_all_cached_entities(limit: int = 100) -> List[Dict[str, Any]]:
     """
     Get all cached entities
@@ -184,8 +458,92 @@ def clear_old_entity_cache(days_old: int = 30):
         print(f"❌ Error clearing old cache: {e}")
 
 
+def get_top_cached_entities(limit: int = 500) -> List[Dict[str, Any]]:
+    """
+    Get the most frequently used cached entities (for pre-warming in-memory caches)
+    
+    Args:
+        limit: Maximum number of entities to return
+    
+    Returns:
+        Cached entities, most used first
+    """
+    try:
+        response = supabase.table('entity_cache')\
+            .select('*')\
+            .order('hit_count', desc=True)\
+            .limit(limit)\
+            .execute()
+        return response.data if response.data else []
+    except Exception as e:
+        print(f"❌ Error fetching most used entities: {e}")
+        return []
+
+
+def get_cached_entity_names(limit: int = 20000, page_size: int = 1000) -> List[Dict[str, Any]]:
+    """
+    Get the names and types of cached entities, most used first
+    
+    Args:
+        limit: Maximum number of entities
+        page_size: Rows per request (Supabase caps the rows of one response)
+    
+    Returns:
+        Rows with entity_name and entity_type
+    """
+    rows: List[Dict[str, Any]] = []
+    try:
+        while len(rows) < limit:
+            start = len(rows)
+            end = min(start + page_size, limit) - 1
+            response = supabase.table('entity_cache')\
+                .select('entity_name, entity_type')\
+                .order('hit_count', desc=True)\
+                .order('entity_name')\
+                .range(start, end)\
+                .execute()
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < end - start + 1:
+                break
+        return rows
+    except Exception as e:
+        print(f"❌ Error fetching cached entity names: {e}")
+        return rows
+
+
+def increment_entity_hits(hits: Dict[Tuple[str, str], int]) -> bool:
+    """
+    Add usage counts to cached entities in one call
+    
+    Args:
+        hits: (entity_name, entity_type) -> number of uses since the last call
+    
+    Returns:
+        True if the counts were saved
+    """
+    if not hits:
+        return True
+    
+    try:
+        keys = list(hits)
+        supabase.rpc('increment_entity_hits', {
+            'entity_names': [name for name, _ in keys],
+            'entity_types': [entity_type for _, entity_type in keys],
+            'hits': [hits[key] for key in keys]
+        }).execute()
+        return True
+    except Exception as e:
+        print(f"❌ Error saving entity hit counts: {e}")
+        return False
+
+
 # Analysis Cache Functions (for Gemini API response caching)
 
+# Fall back to the pre-normalization hash on analysis cache misses; can be
+# disabled once entries cached before normalization have expired (30 days)
+LEGACY_HASH_FALLBACK = os.getenv("ANALYSIS_CACHE_LEGACY_HASH_FALLBACK", "true").lower() == "true"
+
 def generate_text_hash(text: str, language: str) -> str:
     """
     Generate a consistent hash for text + language combination
@@ -197,30 +555,82 @@ def generate_text_hash(text: str, language: str) -> str:
     Returns:
         SHA-256 hash string
     """
-    # Normalize text: lowercase, strip whitespace
-    normalized_text = text.strip().lower()
+    # Normalize text: NFKC, folded punctuation, collapsed whitespace, case-folded
+    normalized_text = normalize_text(text)
     # Combine text and language for unique hash
     hash_input = f"{normalized_text}|{language}"
     return hashlib.sha256(hash_input.encode('utf-8')).hexdigest()
 
 
-def get_cached_analysis(text: str, language: str) -> Optional[Dict[str, Any]]:
+def generate_legacy_text_hash(text: str, language: str) -> str:
+    """
+    Hash of text + language as computed before canonical normalization
+    (strip and lowercase only), under which older analysis_cache rows are stored
+    """
+    hash_input = f"{text.strip().lower()}|{language}"
+    return hashlib.sha256(hash_input.encode('utf-8')).hexdigest()
+
+
+def get_cached_analysis(text: str, language: str, days: int = 30) -> Optional[Dict[str, Any]]:
     """
     Get cached Gemini analysis result
     
+    Entries cached before canonical normalization are keyed by the legacy
+    hash. For texts where the two hashes differ, a miss falls back to the
+    legacy key (while ANALYSIS_CACHE_LEGACY_HASH_FALLBACK is enabled) and a
+    legacy hit is re-keyed to the canonical hash, so existing entries stay
+    warm instead of all being regenerated at once.
+    
     Args:
         text: Input text
         language: Language code
+        days: Hard TTL in days
     
     Returns:
         Cached analysis data or None if not found/expired
     """
+    text_hash = generate_text_hash(text, language)
+    cached = get_cached_analysis_by_hash(text_hash, language, days)
+    if cached is not None or not LEGACY_HASH_FALLBACK:
+        return cached
+    
+    legacy_hash = generate_legacy_text_hash(text, language)
+    if legacy_hash == text_hash:
+        return None
+    
+    cached = get_cached_analysis_by_hash(legacy_hash, language, days)
+    if cached is not None:
+        metrics.increment("analysis_cache.legacy_hash_hits")
+        try:
+            supabase.table('analysis_cache')\
+                .update({'text_hash': text_hash})\
+                .eq('text_hash', legacy_hash)\
+                .eq('language', language)\
+                .execute()
+            print(f"🔑 Re-keyed legacy cache entry {legacy_hash[:16]}... -> {text_hash[:16]}...")
+        except Exception as e:
+            # e.g. a concurrent request already cached the canonical key
+            print(f"⚠️ Error re-keying legacy cache entry: {e}")
+    return cached
+
+
+def get_cached_analysis_by_hash(text_hash: str, language: str, days: int = 30) -> Optional[Dict[str, Any]]:
+    """
+    Get cached Gemini analysis result by text hash
+    
+    Args:
+        text_hash: Hash from generate_text_hash (e.g. of a near-duplicate text)
+        language: Language code
+        days: Hard TTL in days - older entries are never served
+    
+    Returns:
+        Cached analysis data (including the prompt_version it was generated
+        with and its created_at) or None if not found/expired
+    """
     try:
-        text_hash = generate_text_hash(text, language)
-        
-        # Query cache with TTL check (30 days)
+        # Query cache with TTL check
         from datetime import timedelta
-        cutoff_date = (datetime.utcnow() - timedelta(days=30)).isoformat()
+        cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
         
         response = supabase.table('analysis_cache')\
             .select('*')\
@@ -241,6 +651,9 @@ def get_cached_analysis(text: str, language: str) -> Optional[Dict[str, Any]]:
             print(f"🎯 Cache HIT for text_hash: {text_hash[:16]}... (Hit count: {cached_entry.get('hit_count', 0) + 1})")
             
             return {
+                'status': ANALYSIS_STATUS_OK,
+                'prompt_version': cached_entry.get('prompt_version'),
+                'created_at': cached_entry.get('created_at'),
                 'cultural_origin': cached_entry['cultural_origin'],
                 'cross_cultural_connections': cached_entry['cross_cultural_connections'],
                 'modern_analogy': cached_entry['modern_analogy'],
@@ -258,7 +671,12 @@ def get_cached_analysis(text: str, language: str) -> Optional[Dict[str, Any]]:
         return None  # Fail gracefully, don't block the request
 
 
-def save_analysis_cache(text: str, language: str, analysis_result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+def save_analysis_cache(
+    text: str,
+    language: str,
+    analysis_result: Dict[str, Any],
+    prompt_version: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
     """
     Save Gemini analysis result to cache
     
@@ -266,10 +684,17 @@ def save_analysis_cache(text: str, language: str, analysis_result: Dict[str, Any
         text: Original input text
         language: Language code
         analysis_result: Analysis data from Gemini
+        prompt_version: Fingerprint of the prompt/model configuration that produced it
     
     Returns:
-        Cached record or None on error
+        Cached record or None on error (or if the analysis did not succeed)
     """
+    # Never persist failure placeholders - they would be served for 30 days
+    status = analysis_result.get('status', ANALYSIS_STATUS_OK)
+    if status != ANALYSIS_STATUS_OK:
+        print(f"⏭️  Not caching analysis with status '{status}'")
+        return None
+    
     try:
         text_hash = generate_text_hash(text, language)
         
@@ -284,6 +709,7 @@ def save_analysis_cache(text: str, language: str, analysis_result: Dict[str, Any
             'geographic_locations': analysis_result.get('geographic_locations', []),
             'key_concepts': analysis_result.get('key_concepts', []),
             'external_resources': analysis_result.get('external_resources', {}),
+            'prompt_version': prompt_version or 'legacy',
             'hit_count': 0,
             'created_at': datetime.utcnow().isoformat(),
             'last_accessed': datetime.utcnow().isoformat()
@@ -366,6 +792,243 @@ def cleanup_expired_cache(days_old: int = 30) -> int:
         return 0
 
 
+def get_cached_sections(
+    text_hash: str,
+    language: str,
+    sections: List[str],
+    days: int = 30,
+    prompt_version: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Get individually cached analysis sections
+    
+    Args:
+        text_hash: Hash from generate_text_hash
+        language: Language code
+        sections: Section names to look up
+        days: TTL in days
+        prompt_version: Only return sections generated with this prompt version
+    
+    Returns:
+        Dictionary of section -> value for the sections found
+    """
+    try:
+        from datetime import timedelta
+        cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
+        
+        query = supabase.table('analysis_section_cache')\
+            .select('section, value')\
+            .eq('text_hash', text_hash)\
+            .eq('language', language)\
+            .in_('section', sections)\
+            .gt('created_at', cutoff_date)
+        if prompt_version:
+            query = query.eq('prompt_version', prompt_version)
+        response = query.execute()
+        return {row['section']: row['value'] for row in response.data or []}
+    except Exception as e:
+        print(f"⚠️ Error checking section cache: {e}")
+        return {}
+
+
+def save_section_cache(
+    text_hash: str,
+    language: str,
+    sections: Dict[str, Any],
+    prompt_version: Optional[str] = None
+) -> bool:
+    """
+    Cache analysis sections individually (for section-selective requests)
+    
+    Args:
+        text_hash: Hash from generate_text_hash
+        language: Language code
+        sections: Dictionary of section -> value
+        prompt_version: Fingerprint of the prompt/model configuration that produced them
+    
+    Returns:
+        True if saved
+    """
+    if not sections:
+        return False
+    
+    try:
+        now = datetime.utcnow().isoformat()
+        rows = [
+            {
+                'text_hash': text_hash,
+                'language': language,
+                'section': section,
+                'value': value,
+                'prompt_version': prompt_version or 'legacy',
+                'created_at': now,
+            }
+            for section, value in sections.items()
+        ]
+        supabase.table('analysis_section_cache')\
+            .upsert(rows, on_conflict='text_hash,language,section')\
+            .execute()
+        print(f"💾 Cached {len(rows)} section(s) for text_hash: {text_hash[:16]}...")
+        return True
+    except Exception as e:
+        print(f"⚠️ Error saving to section cache: {e}")
+        return False
+
+
+def evict_stale_analysis_versions(prompt_version: str, batch_size: int = 100, min_age_days: int = 7) -> int:
+    """
+    Delete a batch of cached analyses generated with an outdated prompt version
+    
+    Called periodically so that old entries are removed gradually (oldest
+    first) instead of in one wipe. Only entries older than min_age_days are
+    deleted, so that a configuration change that is rolled back (or flips the
+    version back and forth) does not cost the recent entries.
+    
+    Args:
+        prompt_version: Current prompt version (entries with it are kept)
+        batch_size: Maximum number of analysis_cache rows to delete
+        min_age_days: Minimum age of deleted entries in days
+    
+    Returns:
+        Number of deleted analysis_cache rows
+    """
+    try:
+        from datetime import timedelta
+        cutoff_date = (datetime.utcnow() - timedelta(days=min_age_days)).isoformat()
+        
+        response = supabase.table('analysis_cache')\
+            .select('id')\
+            .neq('prompt_version', prompt_version)\
+            .lt('created_at', cutoff_date)\
+            .order('created_at')\
+            .limit(batch_size)\
+            .execute()
+        ids = [row['id'] for row in response.data or []]
+        if ids:
+            supabase.table('analysis_cache').delete().in_('id', ids).execute()
+        
+        # Sections are tiny and only served for the current version - drop them outright
+        supabase.table('analysis_section_cache')\
+            .delete()\
+            .neq('prompt_version', prompt_version)\
+            .lt('created_at', cutoff_date)\
+            .execute()
+        
+        if ids:
+            print(f"🧹 Evicted {len(ids)} analyses cached with an outdated prompt version")
+        return len(ids)
+    except Exception as e:
+        print(f"⚠️ Error evicting outdated analysis cache entries: {e}")
+        return 0
+
+
+def get_recent_cached_texts(limit: int = 5000, days: int = 30) -> List[Dict[str, Any]]:
+    """
+    Get the original texts of recent analysis cache entries
+    
+    Used to rebuild the in-memory near-duplicate index on startup.
+    
+    Args:
+        limit: Maximum number of entries
+        days: TTL in days
+    
+    Returns:
+        List of dicts with text_hash, language and original_text (newest first)
+    """
+    try:
+        from datetime import timedelta
+        cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
+        
+        response = supabase.table('analysis_cache')\
+            .select('text_hash, language, original_text')\
+            .gt('created_at', cutoff_date)\
+            .order('created_at', desc=True)\
+            .limit(limit)\
+            .execute()
+        return response.data or []
+    except Exception as e:
+        print(f"⚠️ Error loading cached texts: {e}")
+        return []
+
+
+# OCR Cache Functions (for Gemini Vision text extraction)
+
+def get_cached_ocr(image_hash: str, days: int = 30) -> Optional[Dict[str, Any]]:
+    """
+    Get cached OCR result by content hash of the image bytes
+    
+    Args:
+        image_hash: SHA-256 of the uploaded image bytes
+        days: TTL in days
+    
+    Returns:
+        Cached OCR record or None if not found/expired
+    """
+    try:
+        from datetime import timedelta
+        cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
+        
+        response = supabase.table('ocr_cache')\
+            .select('*')\
+            .eq('image_hash', image_hash)\
+            .gt('created_at', cutoff_date)\
+            .limit(1)\
+            .execute()
+        return response.data[0] if response.data else None
+    except Exception as e:
+        print(f"⚠️ Error checking OCR cache: {e}")
+        return None
+
+
+def get_cached_ocr_by_phash(perceptual_hash: str, max_distance: int, days: int = 30) -> Optional[Dict[str, Any]]:
+    """
+    Get the cached OCR result of the most similar image (re-encoded, resized
+    or re-photographed copies)
+    
+    The Hamming distance between perceptual hashes is computed in Postgres by
+    the match_ocr_perceptual_hash function (see supabase_cache_tables.sql).
+    
+    Args:
+        perceptual_hash: Difference hash as a hex string
+        max_distance: Maximum number of differing bits
+        days: TTL in days
+    
+    Returns:
+        Cached OCR record (with its "distance") or None if there is no close enough entry
+    """
+    try:
+        from datetime import timedelta
+        cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
+        
+        response = supabase.rpc('match_ocr_perceptual_hash', {
+            'query_hash': perceptual_hash,
+            'max_distance': max_distance,
+            'cutoff': cutoff_date,
+        }).execute()
+        return response.data[0] if response.data else None
+    except Exception as e:
+        print(f"⚠️ Error checking OCR cache: {e}")
+        return None
+
+
+def save_ocr_cache(ocr_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Save OCR result to cache
+    
+    Args:
+        ocr_data: Dictionary with image_hash, perceptual_hash, text and metadata
+    
+    Returns:
+        Cached record or None on error
+    """
+    try:
+        response = supabase.table('ocr_cache').upsert(ocr_data, on_conflict='image_hash').execute()
+        return response.data[0] if response.data else None
+    except Exception as e:
+        print(f"⚠️ Error saving to OCR cache: {e}")
+        return None
+
+
 # User Authentication Functions
 
 def create_user(user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -0,0 +1,56 @@
+"""
+Entity canonicalization for enrichment cache keys
+
+spaCy reports entities by their surface form, so "Gandhi", "gandhi",
+"Gandhi's" or "the Beatles" and "Beatles" would each get their own entity
+cache entry and knowledge-source lookup. canonical_entity_name maps surface
+forms that differ only in case, punctuation, possessives or a leading
+article to one alias.
+
+Surface forms that differ in wording ("Mahatma Gandhi", "M. K. Gandhi") are
+unified by their Wikidata QID instead: the NLP service resolves the QID
+before the knowledge-source fan-out, reuses the cached record with that QID
+if there is one, and stores the alias in the entity_aliases table so the
+next occurrence hits the cache directly.
+"""
+
+import re
+from typing import Tuple
+
+from text_normalization import normalize_text
+
+# "gandhi's" -> "gandhi", "jesus'" -> "jesus"
+POSSESSIVE = re.compile(r"(?<=\w)'s\b|(?<=s)'(?=\s|$)")
+
+# Dots, commas, quotes etc. ("m.k. gandhi" -> "m k gandhi"); hyphens are kept
+PUNCTUATION = re.compile(r"[^\w\s-]+")
+
+WHITESPACE = re.compile(r"\s+")
+
+LEADING_ARTICLE = re.compile(r"^(?:the|a|an) (?=\S)")
+
+
+def canonical_entity_name(text: str) -> str:
+    """
+    Canonical alias of an entity's surface form
+
+    Normalizes Unicode, punctuation, whitespace and case (as normalize_text),
+    then strips possessives, remaining punctuation and a leading article.
+
+    Args:
+        text: Entity text as detected
+
+    Returns:
+        Canonical alias (the input normalized if nothing would be left)
+    """
+    normalized = normalize_text(text)
+    alias = POSSESSIVE.sub("", normalized)
+    alias = PUNCTUATION.sub(" ", alias)
+    alias = WHITESPACE.sub(" ", alias).strip()
+    alias = LEADING_ARTICLE.sub("", alias)
+    return alias or normalized
+
+
+def alias_key(entity_text: str, entity_type: str) -> Tuple[str, str]:
+    """Cache key of a detected entity: (canonical alias, entity type)"""
+    return canonical_entity_name(entity_text), entity_type
@@ -0,0 +1,112 @@
+"""
+Dictionary fast path for entity extraction
+
+Most entities in incoming texts have been seen (and enriched) before. A spaCy
+PhraseMatcher compiled from the entity names in entity_cache finds those
+with tokenization only. The statistical NER model then runs only on the
+stretches of text between dictionary matches that could still contain a name
+(a capitalized word), instead of on the whole text.
+
+Patterns are added incrementally as new entities are cached; PhraseMatcher
+compiles each pattern on insertion, so nothing is rebuilt.
+"""
+
+import threading
+from typing import Iterable, List, Set, Tuple
+
+from spacy.matcher import PhraseMatcher
+from spacy.tokens import Span
+from spacy.util import filter_spans
+
+from metrics import metrics
+
+# (text, label, start_char, end_char)
+EntityCandidate = Tuple[str, str, int, int]
+
+
+class EntityPhraseMatcher:
+    """Phrase matcher over known entity names, with NER for the unmatched text"""
+
+    def __init__(self, nlp, max_patterns: int = 20000):
+        """
+        Args:
+            nlp: Loaded spaCy pipeline (its tokenizer builds the patterns)
+            max_patterns: Maximum number of (name, type) patterns
+        """
+        self.nlp = nlp
+        self.max_patterns = max_patterns
+        # Case-insensitive, so "GANDHI" and "Mahatma gandhi" match too
+        self.matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+        self._patterns: Set[Tuple[str, str]] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def add(self, names: Iterable[Tuple[str, str]]) -> int:
+        """
+        Add entity names to the dictionary
+
+        Args:
+            names: (entity name, entity type) pairs
+
+        Returns:
+            Number of new patterns
+        """
+        new_patterns = {}
+        with self._lock:
+            for name, label in names:
+                key = (name.strip().lower(), label)
+                if not key[0] or key in self._patterns or len(self._patterns) >= self.max_patterns:
+                    continue
+                self._patterns.add(key)
+                new_patterns.setdefault(label, []).append(self.nlp.make_doc(name.strip()))
+
+            for label, docs in new_patterns.items():
+                self.matcher.add(label, docs)
+
+        return sum(len(docs) for docs in new_patterns.values())
+
+    def extract(self, text: str) -> List[EntityCandidate]:
+        """
+        Find entities: dictionary matches first, NER on the remaining spans
+
+        Args:
+            text: Input text (already truncated to the pipeline's max_length)
+
+        Returns:
+            Entity candidates in order of appearance
+        """
+        doc = self.nlp.make_doc(text)
+        with self._lock:
+            matches = self.matcher(doc)
+
+        # All-lowercase matches are usually common words ("china", "bengal gram")
+        spans = filter_spans([
+            Span(doc, start, end, label=match_id)
+            for match_id, start, end in matches
+            if not doc[start:end].text.islower()
+        ])
+        candidates = [(span.text, span.label_, span.start_char, span.end_char) for span in spans]
+
+        # Token ranges between the matches that may still contain a name
+        gaps = []
+        position = 0
+        for start, end in [(span.start, span.end) for span in spans] + [(len(doc), len(doc))]:
+            if start > position and any(token.is_alpha and token.text[0].isupper() for token in doc[position:start]):
+                gaps.append(doc[position:start])
+            position = end
+
+        ner_chars = 0
+        for gap, gap_doc in zip(gaps, self.nlp.pipe(gap.text for gap in gaps)):
+            ner_chars += len(gap.text)
+            candidates.extend(
+                (ent.text, ent.label_, gap.start_char + ent.start_char, gap.start_char + ent.end_char)
+                for ent in gap_doc.ents
+            )
+
+        metrics.increment("nlp.matcher.texts")
+        metrics.increment("nlp.matcher.dictionary_entities", len(spans))
+        metrics.increment("nlp.matcher.ner_chars", ner_chars)
+        metrics.increment("nlp.matcher.total_chars", len(text))
+        return sorted(candidates, key=lambda candidate: candidate[2])
@@ -1,57 +1,506 @@
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import os
 from dotenv import load_dotenv
+import asyncio
+import hashlib
 import json
-import re
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from api_key_pool import QUOTA_ERRORS, APIKeyPool, PooledModel
+from analysis_schema import (
+    ANALYSIS_SECTIONS, REQUIRED_SECTIONS, SECTION_DEFAULTS,
+    ANALYSIS_STATUS_OK, ANALYSIS_STATUS_BLOCKED, ANALYSIS_STATUS_INVALID, ANALYSIS_STATUS_ERROR,
+    build_response_schema, validate_section
+)
+from image_preprocessing import preprocess_image_for_ocr
+from json_utils import IncrementalJSONObjectParser, repair_json
+from metrics import metrics
+from model_routing import ModelRouter, ModelTier
 
 load_dotenv()
 
 # Configure Gemini API
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))  # type: ignore
 
+# Map language codes to full names for better AI understanding
+LANGUAGE_NAMES = {
+    "en": "English",
+    "hi": "Hindi (हिंदी)",
+    "es": "Spanish (Español)",
+    "fr": "French (Français)",
+    "de": "German (Deutsch)",
+    "zh": "Chinese (中文)",
+    "ja": "Japanese (日本語)",
+    "ar": "Arabic (العربية)",
+    "bn": "Bengali (বাংলা)",
+    "ta": "Tamil (தமிழ்)",
+    "te": "Telugu (తెలుగు)",
+    "mr": "Marathi (मराठी)",
+}
+
+ANALYSIS_GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+    "response_mime_type": "application/json",
+}
+
+# Output budget when regenerating individual sections that failed validation
+SECTION_REGENERATION_MAX_TOKENS = 2048
+
+# Share of max_output_tokens each section needs (sums to the full 8192 budget),
+# used to scale the budget when only some sections are requested
+SECTION_OUTPUT_TOKENS = {
+    "cultural_origin": 1024,
+    "cross_cultural_connections": 1024,
+    "modern_analogy": 768,
+    "timeline_events": 1536,
+    "geographic_locations": 1280,
+    "key_concepts": 1536,
+    "external_resources": 1024,
+}
+
+# Example JSON for each section, in the order they appear in the prompt
+SECTION_PROMPT_EXAMPLES = {
+    "cultural_origin": '"cultural_origin": "Brief origin and significance"',
+    "cross_cultural_connections": '"cross_cultural_connections": "Key influences and relationships"',
+    "modern_analogy": '"modern_analogy": "Relevant Gen Z/Millennial comparison"',
+    "timeline_events": """"timeline_events": [
+        {
+            "year": "YYYY",
+            "title": "Event title",
+            "description": "Brief context",
+            "significance": "Impact"
+        }
+    ]""",
+    "geographic_locations": """"geographic_locations": [
+        {
+            "name": "Location",
+            "coordinates": {"lat": 0.0, "lng": 0.0},
+            "significance": "Brief importance",
+            "modern_name": "Current name"
+        }
+    ]""",
+    "key_concepts": """"key_concepts": [
+        {
+            "term": "Term",
+            "definition": "Brief definition",
+            "context": "Relevance",
+            "modern_parallel": "Modern example"
+        }
+    ]""",
+    "external_resources": """"external_resources": {
+        "timeline_links": [],
+        "map_links": [],
+        "further_reading": []
+    }""",
+}
+
+# Section-specific rules appended to the prompt
+SECTION_PROMPT_RULES = {
+    "timeline_events": "Include timeline_events only for historical content (3-5 events)",
+    "geographic_locations": "Include geographic_locations only for place-specific content (2-4 locations)",
+    "key_concepts": "Include key_concepts only for complex terms (3-5 terms)",
+    "external_resources": "Use only verified URLs for external_resources",
+    "modern_analogy": "Make modern_analogy specific to current trends",
+}
+
+# What to extract from an image (shared by plain OCR and single-call image analysis)
+OCR_EXTRACTION_RULES = """RULES FOR EXTRACTION:
+1. Extract the primary/main text content (articles, paragraphs, quotes, stories, etc.)
+2. IGNORE irrelevant elements like:
+   - Watermarks, logos, branding
+   - Page numbers, headers, footers
+   - Navigation elements, buttons, menu items
+   - Copyright notices, disclaimers
+   - Advertisement text
+   - Decorative text or background elements
+   - Author names/signatures (unless part of main content)
+   - Publication details (unless essential context)
+
+3. Focus on extracting:
+   - Main body text/paragraphs
+   - Titles and headings (when they're part of the content)
+   - Quotes or important passages
+   - Story or article text
+   - Educational or informational content
+
+4. Preserve structure:
+   - Keep paragraph breaks
+   - Maintain logical text flow
+   - Separate distinct sections with line breaks
+"""
+
+# Sentinel the model returns for images without meaningful text
+NO_TEXT_FOUND = "No relevant text found in image"
+
+# Shorter extractions are rejected (lowered to 15 for short quotes/headlines)
+MIN_EXTRACTED_TEXT_LENGTH = 15
+
+# Transient errors worth retrying: 429 quota/rate limits and 5xx server errors
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServerError,
+)
+
+metrics.register_ratio("gemini.parse_failure_rate", "gemini.parse_failures", "gemini.analyses")
+metrics.register_ratio("gemini.retry_rate", "gemini.retries", "gemini.requests")
+metrics.register_ratio("gemini.hedge_rate", "gemini.hedges", "gemini.requests")
+metrics.register_ratio("gemini.repair_rate", "gemini.repairs", "gemini.parse_failures")
+
+
+class AnalysisBlockedError(Exception):
+    """Raised when Gemini returns a blocked or empty response"""
+
+
+def failure_result(status: str, cultural_origin: str, cross_cultural_connections: str, modern_analogy: str) -> dict:
+    """Build the placeholder analysis returned to the user when analysis fails"""
+    return {
+        "status": status,
+        "cultural_origin": cultural_origin,
+        "cross_cultural_connections": cross_cultural_connections,
+        "modern_analogy": modern_analogy,
+        "timeline_events": [],
+        "geographic_locations": [],
+        "key_concepts": [],
+        "external_resources": {}
+    }
+
+
+BLOCKED_RESULT = failure_result(
+    ANALYSIS_STATUS_BLOCKED,
+    "Unable to analyze this text. The content may have triggered safety filters or the AI couldn't process it.",
+    "Please try rephrasing your text or use a different passage.",
+    "Analysis was blocked or failed."
+)
+
+INVALID_RESULT = failure_result(
+    ANALYSIS_STATUS_INVALID,
+    "Error: The AI returned invalid JSON format. This is usually temporary.",
+    "Please try again. If the issue persists, try simplifying your text.",
+    "The analysis could not be completed due to formatting issues."
+)
+
+
+def output_token_budget(sections: List[str]) -> int:
+    """
+    max_output_tokens for an analysis of the given sections
+    
+    Never below SECTION_REGENERATION_MAX_TOKENS: Gemini 2.5 counts thinking
+    tokens against the same budget.
+    """
+    budget = sum(SECTION_OUTPUT_TOKENS[section] for section in sections)
+    return min(ANALYSIS_GENERATION_CONFIG["max_output_tokens"], max(SECTION_REGENERATION_MAX_TOKENS, budget))
+
+
+class RetryPolicy:
+    """Retry, backoff and hedging settings for Gemini requests"""
+    
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        request_timeout: float = 60.0,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_samples: int = 20
+    ):
+        """
+        Args:
+            max_attempts: Total attempts per request, including the first
+            base_delay: Backoff before the first retry (seconds), doubled per retry
+            max_delay: Upper bound on a single backoff (seconds)
+            request_timeout: Deadline applied when the caller does not pass one (seconds)
+            hedge_enabled: Fire a second attempt when the first is slower than the latency percentile
+            hedge_percentile: Latency percentile that triggers the hedge
+            hedge_min_samples: Latency samples required before hedging kicks in
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.request_timeout = request_timeout
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+    
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """Build a policy from GEMINI_RETRY_* / GEMINI_HEDGE_* environment variables"""
+        return cls(
+            max_attempts=int(os.getenv("GEMINI_RETRY_MAX_ATTEMPTS", "4")),
+            base_delay=float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5")),
+            max_delay=float(os.getenv("GEMINI_RETRY_MAX_DELAY", "8.0")),
+            request_timeout=float(os.getenv("GEMINI_REQUEST_TIMEOUT", "60")),
+            hedge_enabled=os.getenv("GEMINI_HEDGE_ENABLED", "false").lower() == "true",
+            hedge_percentile=float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95")),
+            hedge_min_samples=int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20")),
+        )
+    
+    def backoff(self, retry_number: int) -> float:
+        """Exponential backoff with full jitter for the given retry (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (retry_number - 1))))
+
 
 class GeminiService:
     """Service for interacting with Google Gemini API"""
     
-    def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.5-flash')  # type: ignore
-        self.vision_model = genai.GenerativeModel('gemini-2.5-flash')  # type: ignore
+    def __init__(
+        self,
+        model=None,
+        vision_model=None,
+        retry_policy: Optional[RetryPolicy] = None,
+        router: Optional[ModelRouter] = None,
+        key_pool: Optional[APIKeyPool] = None
+    ):
+        """
+        Args:
+            model: Text model (anything with an async generate_content_async); defaults to
+                Gemini. When given, it is used for every tier and routing only picks parameters
+            vision_model: Vision model; defaults to Gemini
+            retry_policy: Retry/hedging settings; defaults to RetryPolicy.from_env()
+            router: Model tier routing for analyses; defaults to ModelRouter.from_env()
+            key_pool: API keys to spread requests over; defaults to APIKeyPool.from_env()
+        """
+        self.router = router or ModelRouter.from_env()
+        self.key_pool = key_pool or APIKeyPool.from_env()
+        self._model_override = model
+        self._tier_models: Dict[str, Any] = {}
+        self._prompt_version: Optional[str] = None
+        self.model = self._model_for(self.router.default)
+        self.vision_model = vision_model or self._new_model('gemini-2.5-flash')
+        self.retry_policy = retry_policy or RetryPolicy.from_env()
+        
+        # Cap on concurrent Gemini requests across the whole service (multi-page
+        # OCR, long-document chunks and regular requests share it)
+        self.max_concurrency = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    def _new_model(self, model_name: str):
+        """Gemini model spread over the API key pool (or on the default key if the pool is empty)"""
+        if len(self.key_pool):
+            return PooledModel(model_name, self.key_pool)
+        return genai.GenerativeModel(model_name)  # type: ignore
+    
+    def _model_for(self, tier: ModelTier):
+        """Text model for a routing tier, created once per model name"""
+        if self._model_override is not None:
+            return self._model_override
+        if tier.model not in self._tier_models:
+            self._tier_models[tier.model] = self._new_model(tier.model)
+        return self._tier_models[tier.model]
+    
+    def _record_tier_usage(self, tier: ModelTier, response, started: float):
+        """Per-tier latency, token and cost metrics for a completed analysis request"""
+        self.key_pool.record_stream_usage(response)
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        
+        prefix = f"gemini.tier.{tier.name}"
+        metrics.increment(f"{prefix}.requests")
+        metrics.observe(f"{prefix}.latency", time.monotonic() - started)
+        metrics.increment(f"{prefix}.input_tokens", input_tokens)
+        metrics.increment(f"{prefix}.output_tokens", output_tokens)
+        metrics.increment(f"{prefix}.cost_usd", tier.cost(input_tokens, output_tokens))
+    
+    @property
+    def prompt_version(self) -> str:
+        """
+        Fingerprint of everything that shapes an analysis: prompt templates,
+        response schema, generation config and model routing
+        
+        Stored with cached analyses, so that a prompt or model change is
+        detected and old entries are refreshed. ANALYSIS_CACHE_VERSION can be
+        bumped to force a refresh without a code change.
+        """
+        if self._prompt_version is None:
+            fingerprint = json.dumps({
+                "text_prompt": self._build_analysis_prompt("{text}", "en"),
+                "image_prompt": self._build_analysis_prompt(None, "en"),
+                "schema": build_response_schema(ANALYSIS_SECTIONS),
+                "generation_config": ANALYSIS_GENERATION_CONFIG,
+                "routing": self.router.describe(),
+                "salt": os.getenv("ANALYSIS_CACHE_VERSION", ""),
+            }, sort_keys=True, default=str)
+            self._prompt_version = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:12]
+        return self._prompt_version
+    
+    @property
+    def concurrency_limiter(self) -> asyncio.Semaphore:
+        """Service-wide request semaphore, created lazily inside the running event loop"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+    
+    async def _generate(
+        self,
+        model,
+        contents: Any,
+        generation_config: Dict[str, Any],
+        operation: str,
+        stream: bool = False,
+        deadline: Optional[float] = None
+    ):
+        """
+        Call generate_content_async with retries, backoff and optional hedging
+        
+        Retries 429 and 5xx errors with exponential backoff and full jitter,
+        never sleeping past the deadline. For streamed calls the retry covers
+        opening the stream (the SDK waits for the first chunk); errors after
+        sections have been yielded are not retried. Every call waits for a
+        slot of the service-wide GEMINI_MAX_CONCURRENCY semaphore. A quota
+        error on one API key is retried immediately when another key of the
+        pool is not cooling down.
+        
+        Args:
+            model: Gemini model to call
+            contents: Prompt or multimodal content list
+            generation_config: Generation configuration
+            operation: Operation name used for latency metrics (e.g. "analysis", "ocr")
+            stream: Whether to stream the response
+            deadline: Absolute time.monotonic() deadline for the whole request
+        
+        Returns:
+            The Gemini response object
+        """
+        policy = self.retry_policy
+        if deadline is None:
+            deadline = time.monotonic() + policy.request_timeout
+        
+        async def make_call():
+            # Streamed responses hold a slot only until the stream is open
+            limiter = self.concurrency_limiter
+            if limiter.locked():
+                metrics.increment("gemini.concurrency_waits")
+            async with limiter:
+                return await model.generate_content_async(
+                    contents,
+                    generation_config=generation_config,  # type: ignore
+                    stream=stream
+                )
+        
+        attempt = 1
+        while True:
+            metrics.increment("gemini.requests")
+            try:
+                return await self._call_with_hedge(make_call, operation, deadline)
+            except RETRYABLE_ERRORS as e:
+                # A quota error is specific to one key - retry at once if another key is free
+                if isinstance(model, PooledModel) and isinstance(e, QUOTA_ERRORS) and self.key_pool.available_count():
+                    delay = 0.0
+                else:
+                    delay = policy.backoff(attempt)
+                if attempt >= policy.max_attempts or time.monotonic() + delay >= deadline:
+                    metrics.increment("gemini.retries_exhausted")
+                    raise
+                
+                metrics.increment("gemini.retries")
+                print(f"🔁 Gemini {operation} failed ({type(e).__name__}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+    
+    async def _call_with_hedge(
+        self,
+        make_call: Callable[[], Awaitable],
+        operation: str,
+        deadline: float
+    ):
+        """
+        Run one attempt, hedging with a second call if it exceeds the latency percentile
+        
+        Whichever call succeeds first wins and the other is cancelled.
+        """
+        policy = self.retry_policy
+        latency_metric = f"gemini.latency.{operation}"
+        started = time.monotonic()
+        
+        hedge_delay = None
+        if policy.hedge_enabled and metrics.sample_count(latency_metric) >= policy.hedge_min_samples:
+            hedge_delay = metrics.percentile(latency_metric, policy.hedge_percentile)
+        
+        tasks = {asyncio.ensure_future(make_call())}
+        hedge_task = None
+        try:
+            while tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise google_exceptions.DeadlineExceeded(f"Gemini {operation} exceeded its deadline")
+                
+                timeout = remaining
+                if hedge_task is None and hedge_delay is not None:
+                    timeout = min(remaining, max(0.0, started + hedge_delay - time.monotonic()))
+                
+                done, tasks = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                for task in done:
+                    if task.exception() is None:
+                        metrics.observe(latency_metric, time.monotonic() - started)
+                        if task is hedge_task:
+                            metrics.increment("gemini.hedge_wins")
+                        return task.result()
+                    if not tasks:
+                        raise task.exception()  # type: ignore
+                
+                # First attempt is slower than the percentile - fire the hedge
+                if not done and hedge_task is None and hedge_delay is not None and time.monotonic() < deadline:
+                    metrics.increment("gemini.hedges")
+                    hedge_task = asyncio.ensure_future(make_call())
+                    tasks = tasks | {hedge_task}
+            
+            raise google_exceptions.DeadlineExceeded(f"Gemini {operation} exceeded its deadline")
+        finally:
+            for task in tasks:
+                task.cancel()
 
     
-    async def analyze_cultural_context(self, text: str, language: str = "en") -> dict:
+    def _build_analysis_prompt(
+        self, 
+        text: Optional[str], 
+        language: str = "en",
+        sections: Optional[List[str]] = None
+    ) -> str:
         """
-        Analyze text for cultural context using Gemini API
+        Build the cultural analysis prompt for the given text and language
         
         Args:
-            text: The input text to analyze
+            text: The input text to analyze, or None to analyze the text of an
+                attached image (the prompt then also asks for "extracted_text")
             language: Language code (default: en)
+            sections: Analysis sections to request (default: all sections)
         
         Returns:
-            Dictionary with cultural analysis results
+            Prompt string asking Gemini for the structured JSON analysis
         """
+        language_name = LANGUAGE_NAMES.get(language, "English")
+        sections = sections or ANALYSIS_SECTIONS
         
-        # Map language codes to full names for better AI understanding
-        language_names = {
-            "en": "English",
-            "hi": "Hindi (हिंदी)",
-            "es": "Spanish (Español)",
-            "fr": "French (Français)",
-            "de": "German (Deutsch)",
-            "zh": "Chinese (中文)",
-            "ja": "Japanese (日本語)",
-            "ar": "Arabic (العربية)",
-            "bn": "Bengali (বাংলা)",
-            "ta": "Tamil (தமிழ்)",
-            "te": "Telugu (తెలుగు)",
-            "mr": "Marathi (मराठी)",
-        }
+        structure = ",\n".join(f"    {SECTION_PROMPT_EXAMPLES[section]}" for section in sections)
+        section_rules = "".join(
+            f"- {SECTION_PROMPT_RULES[section]}\n" for section in sections if section in SECTION_PROMPT_RULES
+        )
         
-        language_name = language_names.get(language, "English")
+        if text is None:
+            subject = f"""First extract the text content of the attached image.
+
+{OCR_EXTRACTION_RULES}
+Put the extracted text in the "extracted_text" field. If the image contains no meaningful text content (only decorative/irrelevant text), set "extracted_text" to "{NO_TEXT_FOUND}".
+
+Then analyze the extracted text."""
+            structure = '    "extracted_text": "Relevant text extracted from the image",\n' + structure
+            section_rules = f"- extracted_text is the only exception: keep it in the original language of the image\n{section_rules}"
+        else:
+            subject = f'Text to analyze: "{text}"'
         
         prompt = f"""
 You are a cultural expert analyzing the following text. Provide a comprehensive cultural analysis.
 
-Text to analyze: "{text}"
+{subject}
 
 CRITICAL INSTRUCTION - OUTPUT LANGUAGE:
 You MUST provide ALL response text in {language_name} ({language}) language. This includes:
@@ -67,131 +516,308 @@ The analysis should be comprehensive and culturally sensitive, written entirely
 
 Return your response as valid JSON with the following structure:
 {{
-    "cultural_origin": "Brief origin and significance",
-    "cross_cultural_connections": "Key influences and relationships",
-    "modern_analogy": "Relevant Gen Z/Millennial comparison",
-    "timeline_events": [
-        {{
-            "year": "YYYY",
-            "title": "Event title",
-            "description": "Brief context",
-            "significance": "Impact"
-        }}
-    ],
-    "geographic_locations": [
-        {{
-            "name": "Location",
-            "coordinates": {{"lat": 0.0, "lng": 0.0}},
-            "significance": "Brief importance",
-            "modern_name": "Current name"
-        }}
-    ],
-    "key_concepts": [
-        {{
-            "term": "Term",
-            "definition": "Brief definition",
-            "context": "Relevance",
-            "modern_parallel": "Modern example"
-        }}
-    ],
-    "external_resources": {{
-        "timeline_links": [],
-        "map_links": [],
-        "further_reading": []
-    }}
+{structure}
 }}
 
 Rules:
 - ALL text must be in {language_name} ({language}) language - no exceptions
-- Include timeline_events only for historical content (3-5 events)
-- Include geographic_locations only for place-specific content (2-4 locations)
-- Include key_concepts only for complex terms (3-5 terms)
-- Use only verified URLs for external_resources
-- Make modern_analogy specific to current trends
-- Ensure cultural sensitivity and accuracy in the {language_name} language
+{section_rules}- Ensure cultural sensitivity and accuracy in the {language_name} language
 
 Return ONLY valid JSON. Do not include any text before or after the JSON object.
 """
+        return prompt
+    
+    async def _regenerate_sections(
+        self, 
+        text: str, 
+        language: str, 
+        sections: List[str],
+        deadline: Optional[float] = None,
+        tier: Optional[ModelTier] = None
+    ) -> Dict[str, Any]:
+        """
+        Regenerate only the given sections with a smaller, schema-constrained request
+        
+        Args:
+            text: The input text to analyze
+            language: Language code
+            sections: Sections that were missing or failed validation
+            deadline: Absolute time.monotonic() deadline for the request
+            tier: Model tier of the original analysis (default: the router's default tier)
         
+        Returns:
+            Dictionary of the sections that were regenerated successfully
+        """
+        print(f"🔁 Regenerating sections: {', '.join(sections)}")
+        metrics.increment("gemini.sections_regenerated", len(sections))
+        
+        tier = tier or self.router.default
+        started = time.monotonic()
+        response = await self._generate(
+            self._model_for(tier),
+            self._build_analysis_prompt(text, language, sections=sections),
+            generation_config={
+                **ANALYSIS_GENERATION_CONFIG,
+                "temperature": tier.temperature,
+                "max_output_tokens": SECTION_REGENERATION_MAX_TOKENS,
+                "response_schema": build_response_schema(sections),
+            },
+            operation="regeneration",
+            deadline=deadline
+        )
+        self._record_tier_usage(tier, response, started)
+        
+        return self._parse_sections(response, sections)
+    
+    def _parse_sections(self, response, sections: List[str]) -> Dict[str, Any]:
+        """Parse a non-streamed JSON response and keep the valid requested sections"""
         try:
-            # Generate content with safety settings to avoid blocking
-            response = self.model.generate_content(
-                prompt,
-                generation_config={  # type: ignore
-                    "temperature": 0.7,
-                    "top_p": 0.95,
-                    "top_k": 40,
-                    "max_output_tokens": 8192,
-                }
-            )
-            
-            # Check if response was blocked
-            if not response or not response.text:
-                print(f"⚠️ Response blocked or empty. Safety ratings: {response.prompt_feedback if response else 'No response'}")
-                return {
-                    "cultural_origin": "Unable to analyze this text. The content may have triggered safety filters or the AI couldn't process it.",
-                    "cross_cultural_connections": "Please try rephrasing your text or use a different passage.",
-                    "modern_analogy": "Analysis was blocked or failed.",
-                    "timeline_events": [],
-                    "geographic_locations": [],
-                    "key_concepts": [],
-                    "external_resources": {}
-                }
-            
-            result_text = response.text.strip()
-            print(f"🤖 AI Response length: {len(result_text)} characters")
-            
-            # Clean up the response to extract JSON
-            # Remove markdown code blocks if present
-            result_text = re.sub(r'^```json\s*', '', result_text, flags=re.IGNORECASE)
-            result_text = re.sub(r'^```\s*', '', result_text)
-            result_text = re.sub(r'\s*```$', '', result_text)
-            result_text = result_text.strip()
-            
-            # Find the JSON object - extract from first { to last matching }
-            # This handles cases where AI adds text before or after the JSON
-            start_idx = result_text.find('{')
-            if start_idx != -1:
-                # Count braces to find the matching closing brace
-                brace_count = 0
-                end_idx = start_idx
-                for i in range(start_idx, len(result_text)):
-                    if result_text[i] == '{':
-                        brace_count += 1
-                    elif result_text[i] == '}':
-                        brace_count -= 1
-                        if brace_count == 0:
-                            end_idx = i + 1
-                            break
-                
-                if end_idx > start_idx:
-                    result_text = result_text[start_idx:end_idx]
-            
-            print(f"📝 Cleaned JSON length: {len(result_text)} characters")
-            
-            # Parse JSON response
-            analysis = json.loads(result_text)
+            result_text = response.text
+        except ValueError:
+            return {}
+        
+        try:
+            data = json.loads(result_text)
+        except json.JSONDecodeError:
+            data = repair_json(result_text)
+        
+        parsed = {}
+        if isinstance(data, dict):
+            for section in sections:
+                if section not in data:
+                    continue
+                is_valid, value = validate_section(section, data[section])
+                if is_valid:
+                    parsed[section] = value
+        
+        return parsed
+    
+    async def merge_narrative_sections(
+        self,
+        partial_analyses: List[Dict[str, Any]],
+        language: str = "en",
+        deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Reduce step for long documents: merge the narrative sections of chunk analyses
+        
+        Only the short narrative fields of each chunk are sent, so this is far
+        cheaper than re-analyzing the whole document. It runs on the default
+        tier, and its usage is recorded under that tier.
+        
+        Args:
+            partial_analyses: Analyses of consecutive chunks of one document, in order
+            language: Language code
+            deadline: Absolute time.monotonic() deadline for the request
+        
+        Returns:
+            Dictionary with the merged narrative sections that were produced
+        """
+        language_name = LANGUAGE_NAMES.get(language, "English")
+        parts = "\n\n".join(
+            f"Part {index}:\n" + "\n".join(f"- {section}: {analysis.get(section, '')}" for section in REQUIRED_SECTIONS)
+            for index, analysis in enumerate(partial_analyses, start=1)
+        )
+        
+        prompt = f"""
+You are a cultural expert. The following are cultural analyses of consecutive parts of ONE document.
+Combine them into a single coherent analysis of the whole document. Remove repetition and keep the most important points.
+
+{parts}
+
+Write ALL text in {language_name} ({language}).
+
+Return ONLY valid JSON with the fields: {", ".join(REQUIRED_SECTIONS)}.
+"""
+        
+        tier = self.router.default
+        started = time.monotonic()
+        response = await self._generate(
+            self._model_for(tier),
+            prompt,
+            generation_config={
+                **ANALYSIS_GENERATION_CONFIG,
+                "temperature": tier.temperature,
+                "max_output_tokens": SECTION_REGENERATION_MAX_TOKENS,
+                "response_schema": build_response_schema(REQUIRED_SECTIONS),
+            },
+            operation="reduce",
+            deadline=deadline
+        )
+        self._record_tier_usage(tier, response, started)
+        
+        return self._parse_sections(response, REQUIRED_SECTIONS)
+    
+    async def stream_cultural_context(
+        self, 
+        text: str, 
+        language: str = "en",
+        deadline: Optional[float] = None,
+        sections: Optional[List[str]] = None,
+        latency_budget_ms: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream the cultural analysis section by section
+        
+        The Gemini response is consumed as a stream in structured-output mode
+        and parsed incrementally, so each top-level field (cultural_origin,
+        timeline_events, ...) is yielded as soon as its JSON value is complete
+        and valid against the analysis schema.
+        
+        Sections that fail to parse or validate are held back. Once the stream
+        ends, near-valid output (trailing commas, truncation) is repaired
+        locally, and only the sections that are still missing or invalid are
+        regenerated with a follow-up request.
+        
+        The model and generation parameters come from the tier the router
+        picks for the input length, sections and latency budget.
+        
+        Args:
+            text: The input text to analyze
+            language: Language code (default: en)
+            deadline: Absolute time.monotonic() deadline bounding retries
+            sections: Sections to generate (default: all); the output token
+                budget is scaled to the requested sections
+            latency_budget_ms: Caller's latency budget, used for model routing only
+        
+        Yields:
+            (field_name, value) tuples in the order they become available
+        
+        Raises:
+            AnalysisBlockedError: If the response was blocked or empty
+            ValueError: If required sections could not be produced
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.retry_policy.request_timeout
+        
+        sections = [section for section in ANALYSIS_SECTIONS if section in (sections or ANALYSIS_SECTIONS)]
+        required = [section for section in REQUIRED_SECTIONS if section in sections]
+        
+        tier = self.router.route(len(text), sections, latency_budget_ms)
+        print(f"🧭 Routed analysis to {tier.name} tier ({tier.model})")
+        
+        prompt = self._build_analysis_prompt(text, language, sections=sections)
+        metrics.increment("gemini.analyses")
+        
+        started = time.monotonic()
+        response = await self._generate(
+            self._model_for(tier),
+            prompt,
+            generation_config={
+                **ANALYSIS_GENERATION_CONFIG,
+                "temperature": tier.temperature,
+                "max_output_tokens": min(output_token_budget(sections), tier.max_output_tokens),
+                "response_schema": build_response_schema(sections),
+            },
+            operation="analysis",
+            stream=True,
+            deadline=deadline
+        )
+        
+        parser = IncrementalJSONObjectParser()
+        produced: Dict[str, Any] = {}
+        
+        async for chunk in response:
+            try:
+                chunk_text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. safety stops) raise on .text
+                continue
             
-            # Validate required fields
-            required_fields = [
-                "cultural_origin",
-                "cross_cultural_connections", 
-                "modern_analogy"
-            ]
+            for field, value in parser.feed(chunk_text):
+                if field not in sections:
+                    continue
+                is_valid, value = validate_section(field, value)
+                if is_valid:
+                    produced[field] = value
+                    yield field, value
+        
+        # Usage metadata is complete once the stream has been consumed
+        self._record_tier_usage(tier, response, started)
+        
+        # Check if response was blocked
+        if not parser.buffer.strip():
+            raise AnalysisBlockedError(f"Response blocked or empty. Safety ratings: {response.prompt_feedback}")
+        
+        print(f"🤖 AI Response length: {len(parser.buffer)} characters")
+        
+        if parser.complete and not parser.invalid_fields:
+            missing = [section for section in required if section not in produced]
+            if not missing:
+                return
+        
+        # The streamed output was malformed somewhere - repair what we can locally
+        metrics.increment("gemini.parse_failures")
+        print(f"⚠️ Malformed AI response. Preview: {parser.buffer[:500]}...")
+        
+        repaired = repair_json(parser.buffer)
+        if isinstance(repaired, dict):
+            recovered = 0
+            for field, value in repaired.items():
+                if field in produced or field not in sections:
+                    continue
+                is_valid, value = validate_section(field, value, drop_invalid_items=True)
+                if is_valid:
+                    produced[field] = value
+                    recovered += 1
+                    yield field, value
+            if recovered:
+                metrics.increment("gemini.repairs")
+                print(f"🔧 Repaired {recovered} section(s) locally")
+        
+        # Regenerate sections that are required but missing, or present but invalid
+        to_regenerate = [
+            section for section in sections
+            if section not in produced
+            and (section in required or section in parser.invalid_fields)
+        ]
+        if to_regenerate:
+            for field, value in (await self._regenerate_sections(text, language, to_regenerate, deadline, tier)).items():
+                produced[field] = value
+                yield field, value
+        
+        missing = [section for section in required if section not in produced]
+        if missing:
+            raise ValueError(f"Missing required field: {missing[0]}")
+    
+    async def analyze_cultural_context(
+        self, 
+        text: str, 
+        language: str = "en",
+        deadline: Optional[float] = None,
+        sections: Optional[List[str]] = None,
+        latency_budget_ms: Optional[int] = None
+    ) -> dict:
+        """
+        Analyze text for cultural context using Gemini API
+        
+        Transient 429/5xx errors are retried with backoff until the deadline.
+        
+        Args:
+            text: The input text to analyze
+            language: Language code (default: en)
+            deadline: Absolute time.monotonic() deadline (default: now + GEMINI_REQUEST_TIMEOUT)
+            sections: Sections to generate (default: all); only these are returned
+            latency_budget_ms: Caller's latency budget, used to pick a faster model tier
+        
+        Returns:
+            Dictionary with cultural analysis results. The "status" key is
+            ANALYSIS_STATUS_OK on success; failures return a placeholder
+            analysis tagged blocked/invalid/error that must not be cached.
+        """
+        try:
+            analysis = {}
+            async for field, value in self.stream_cultural_context(
+                text, language, deadline, sections, latency_budget_ms
+            ):
+                analysis[field] = value
             
-            for field in required_fields:
-                if field not in analysis:
-                    raise ValueError(f"Missing required field: {field}")
+            # Add default empty values if requested enhanced fields are missing
+            for section, default in SECTION_DEFAULTS.items():
+                if sections is None or section in sections:
+                    analysis.setdefault(section, default)
             
-            # Add default empty arrays if enhanced fields are missing
-            if "timeline_events" not in analysis:
-                analysis["timeline_events"] = []
-            if "geographic_locations" not in analysis:
-                analysis["geographic_locations"] = []
-            if "key_concepts" not in analysis:
-                analysis["key_concepts"] = []
-            if "external_resources" not in analysis:
-                analysis["external_resources"] = {}
+            analysis["status"] = ANALYSIS_STATUS_OK
             
             print(f"✅ Analysis completed successfully")
             print(f"   - Timeline events: {len(analysis.get('timeline_events', []))}")
@@ -200,94 +826,120 @@ Return ONLY valid JSON. Do not include any text before or after the JSON object.
             
             return analysis
             
-        except json.JSONDecodeError as e:
+        except AnalysisBlockedError as e:
+            print(f"⚠️ {e}")
+            return dict(BLOCKED_RESULT)
+        except ValueError as e:
             print(f"❌ JSON parsing error: {e}")
-            print(f"📄 Response text preview: {result_text[:500]}...")
             # Return a structured error response
-            return {
-                "cultural_origin": "Error: The AI returned invalid JSON format. This is usually temporary.",
-                "cross_cultural_connections": "Please try again. If the issue persists, try simplifying your text.",
-                "modern_analogy": "The analysis could not be completed due to formatting issues.",
-                "timeline_events": [],
-                "geographic_locations": [],
-                "key_concepts": [],
-                "external_resources": {}
-            }
+            return dict(INVALID_RESULT)
         except Exception as e:
             print(f"❌ Error in cultural analysis: {e}")
             import traceback
             traceback.print_exc()
+            return failure_result(
+                ANALYSIS_STATUS_ERROR,
+                f"Error: {str(e)}",
+                "Analysis failed. Please check your internet connection and API key.",
+                "Please try again or contact support if the issue persists."
+            )
+    
+    def _prepare_image(self, image_data: bytes, mime_type: str, preprocess: bool = True) -> Dict[str, Any]:
+        """Optionally preprocess an uploaded image and wrap it as a Gemini blob"""
+        if preprocess:
+            # Also validates the image - PIL raises on undecodable data
+            upload_data, upload_mime_type, stats = preprocess_image_for_ocr(image_data)
+            print(
+                f"🖼️  Preprocessed image: {stats['original_size']} -> {stats['processed_size']}, "
+                f"{stats['original_bytes'] // 1024} KB -> {stats['processed_bytes'] // 1024} KB "
+                f"({stats['mime_type']}{', grayscale' if stats['grayscale'] else ''})"
+            )
+        else:
+            upload_data, upload_mime_type = image_data, mime_type
+        
+        metrics.increment("ocr.bytes_received", len(image_data))
+        metrics.increment("ocr.bytes_sent", len(upload_data))
+        return {"mime_type": upload_mime_type, "data": upload_data}
+    
+    def _ocr_result(self, extracted_text: str, mime_type: str) -> dict:
+        """Build the OCR result dict for text extracted by the model"""
+        extracted_text = extracted_text.strip()
+        
+        # Check if no relevant text was found
+        if not extracted_text or extracted_text.lower() == NO_TEXT_FOUND.lower():
             return {
-                "cultural_origin": f"Error: {str(e)}",
-                "cross_cultural_connections": "Analysis failed. Please check your internet connection and API key.",
-                "modern_analogy": "Please try again or contact support if the issue persists.",
-                "timeline_events": [],
-                "geographic_locations": [],
-                "key_concepts": [],
-                "external_resources": {}
+                "success": False,
+                "text": "",
+                "error": "No relevant text could be extracted from the image. The image may only contain decorative elements, watermarks, or irrelevant text."
             }
+        
+        # Validate minimum length for meaningful content
+        if len(extracted_text) < MIN_EXTRACTED_TEXT_LENGTH:
+            return {
+                "success": False,
+                "text": extracted_text,
+                "error": "Extracted text is too short to be meaningful. Please ensure the image contains substantial readable content."
+            }
+        
+        word_count = len(extracted_text.split())
+        character_count = len(extracted_text)
+        
+        print(f"✅ Extracted {character_count} characters ({word_count} words) from image")
+        
+        return {
+            "success": True,
+            "text": extracted_text,
+            "character_count": character_count,
+            "word_count": word_count,
+            "mime_type": mime_type
+        }
     
-    async def extract_text_from_image(self, image_data: bytes, mime_type: str = "image/jpeg") -> dict:
+    async def extract_text_from_image(
+        self, 
+        image_data: bytes, 
+        mime_type: str = "image/jpeg",
+        deadline: Optional[float] = None,
+        preprocess: bool = True
+    ) -> dict:
         """
         Extract text from image using Gemini Vision API
         
         Args:
             image_data: Image file bytes
             mime_type: MIME type of the image (e.g., 'image/jpeg', 'image/png')
+            deadline: Absolute time.monotonic() deadline bounding retries
+            preprocess: Orient, downscale and re-encode the image before upload
+                (see image_preprocessing.py)
         
         Returns:
             Dictionary with extracted text and metadata
         """
         try:
-            import io
-            from PIL import Image
-            
-            # Open image from bytes to validate and convert to PIL Image
-            image = Image.open(io.BytesIO(image_data))
+            # Decoding and re-encoding large photos is CPU-bound - keep it off the event loop
+            image = await asyncio.to_thread(self._prepare_image, image_data, mime_type, preprocess)
             
             # Prompt for text extraction - focus on relevant content
-            prompt = """You are a smart text extraction assistant. Analyze this image and extract ONLY the main, relevant text content.
-
-RULES FOR EXTRACTION:
-1. Extract the primary/main text content (articles, paragraphs, quotes, stories, etc.)
-2. IGNORE irrelevant elements like:
-   - Watermarks, logos, branding
-   - Page numbers, headers, footers
-   - Navigation elements, buttons, menu items
-   - Copyright notices, disclaimers
-   - Advertisement text
-   - Decorative text or background elements
-   - Author names/signatures (unless part of main content)
-   - Publication details (unless essential context)
-
-3. Focus on extracting:
-   - Main body text/paragraphs
-   - Titles and headings (when they're part of the content)
-   - Quotes or important passages
-   - Story or article text
-   - Educational or informational content
-
-4. Preserve structure:
-   - Keep paragraph breaks
-   - Maintain logical text flow
-   - Separate distinct sections with line breaks
+            prompt = f"""You are a smart text extraction assistant. Analyze this image and extract ONLY the main, relevant text content.
 
+{OCR_EXTRACTION_RULES}
 Return ONLY the relevant extracted text. Do not add explanations, comments, or metadata.
-If the image contains no meaningful text content (only decorative/irrelevant text), return: "No relevant text found in image"
+If the image contains no meaningful text content (only decorative/irrelevant text), return: "{NO_TEXT_FOUND}"
 """
 
             print(f"📸 Extracting relevant text from image using Gemini Vision API...")
             
             # Use vision model to extract text with focus on relevance
-            # Pass PIL Image directly - Gemini API handles it
-            response = self.vision_model.generate_content(
+            response = await self._generate(
+                self.vision_model,
                 [prompt, image],
-                generation_config={  # type: ignore
+                generation_config={
                     "temperature": 0.2,  # Slightly higher for smart filtering of relevant vs irrelevant text
                     "top_p": 0.95,
                     "top_k": 40,
                     "max_output_tokens": 4096,
-                }
+                },
+                operation="ocr",
+                deadline=deadline
             )
             
             # Check if response was blocked
@@ -299,45 +951,133 @@ If the image contains no meaningful text content (only decorative/irrelevant tex
                     "error": "Unable to extract text from this image. The content may have triggered safety filters or the image quality is too poor."
                 }
             
-            extracted_text = response.text.strip()
+            return self._ocr_result(response.text, mime_type)
             
-            # Check if no relevant text was found
-            if not extracted_text or extracted_text.lower() == "no relevant text found in image":
-                return {
-                    "success": False,
-                    "text": "",
-                    "error": "No relevant text could be extracted from the image. The image may only contain decorative elements, watermarks, or irrelevant text."
-                }
+        except Exception as e:
+            print(f"❌ Error extracting text from image: {e}")
+            import traceback
+            traceback.print_exc()
+            return {
+                "success": False,
+                "text": "",
+                "error": f"Error extracting text from image: {str(e)}"
+            }
+    
+    async def analyze_image_with_context(
+        self,
+        image_data: bytes,
+        language: str = "en",
+        mime_type: str = "image/jpeg",
+        deadline: Optional[float] = None,
+        preprocess: bool = True
+    ) -> dict:
+        """
+        Extract the text of an image and analyze it in a single multimodal request
+        
+        Saves the second round trip of extract_text_from_image followed by
+        analyze_cultural_context. Required sections missing from the response
+        are regenerated from the extracted text.
+        
+        Args:
+            image_data: Image file bytes
+            language: Language code for the analysis (default: en)
+            mime_type: MIME type of the image
+            deadline: Absolute time.monotonic() deadline bounding retries
+            preprocess: Orient, downscale and re-encode the image before upload
+        
+        Returns:
+            Dictionary with "ocr" (same shape as extract_text_from_image) and
+            "analysis" (same shape as analyze_cultural_context, or None when
+            no usable text was extracted)
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.retry_policy.request_timeout
+        
+        schema = build_response_schema()
+        schema["properties"] = {"extracted_text": {"type": "string"}, **schema["properties"]}
+        schema["required"] = ["extracted_text", *schema["required"]]
+        
+        try:
+            image = await asyncio.to_thread(self._prepare_image, image_data, mime_type, preprocess)
+            
+            print(f"📸 Extracting and analyzing image text in a single Gemini Vision request...")
+            metrics.increment("gemini.analyses")
+            response = await self._generate(
+                self.vision_model,
+                [self._build_analysis_prompt(None, language), image],
+                generation_config={
+                    **ANALYSIS_GENERATION_CONFIG,
+                    "response_schema": schema,
+                },
+                operation="image_analysis",
+                deadline=deadline
+            )
             
-            # Validate minimum length for meaningful content (lowered to 15 for short quotes/headlines)
-            if len(extracted_text) < 15:
+            try:
+                result_text = response.text
+            except ValueError:
+                result_text = ""
+            
+            if not result_text.strip():
+                print(f"⚠️ Response blocked or empty. Safety ratings: {response.prompt_feedback}")
                 return {
-                    "success": False,
-                    "text": extracted_text,
-                    "error": "Extracted text is too short to be meaningful. Please ensure the image contains substantial readable content."
+                    "ocr": {
+                        "success": False,
+                        "text": "",
+                        "error": "Unable to extract text from this image. The content may have triggered safety filters or the image quality is too poor."
+                    },
+                    "analysis": None
                 }
             
-            word_count = len(extracted_text.split())
-            character_count = len(extracted_text)
+            try:
+                data = json.loads(result_text)
+            except json.JSONDecodeError:
+                metrics.increment("gemini.parse_failures")
+                data = repair_json(result_text)
+            if not isinstance(data, dict):
+                data = {}
             
-            print(f"✅ Extracted {character_count} characters ({word_count} words) from image")
+            ocr = self._ocr_result(str(data.get("extracted_text") or ""), mime_type)
+            if not ocr["success"]:
+                return {"ocr": ocr, "analysis": None}
             
-            return {
-                "success": True,
-                "text": extracted_text,
-                "character_count": character_count,
-                "word_count": word_count,
-                "mime_type": mime_type
-            }
+            analysis: Dict[str, Any] = {}
+            for section in ANALYSIS_SECTIONS:
+                if section in data:
+                    is_valid, value = validate_section(section, data[section], drop_invalid_items=True)
+                    if is_valid:
+                        analysis[section] = value
+            
+            missing = [section for section in REQUIRED_SECTIONS if section not in analysis]
+            if missing:
+                try:
+                    analysis.update(await self._regenerate_sections(ocr["text"], language, missing, deadline))
+                except Exception as e:
+                    # Keep the extracted text even if the follow-up request fails
+                    print(f"⚠️ Section regeneration failed: {e}")
+            
+            if any(section not in analysis for section in REQUIRED_SECTIONS):
+                print(f"❌ Single-call image analysis is missing required sections")
+                return {"ocr": ocr, "analysis": dict(INVALID_RESULT)}
+            
+            for section, default in SECTION_DEFAULTS.items():
+                analysis.setdefault(section, default)
+            analysis["status"] = ANALYSIS_STATUS_OK
+            
+            print(f"✅ Single-call image analysis completed successfully")
+            return {"ocr": ocr, "analysis": analysis}
             
         except Exception as e:
-            print(f"❌ Error extracting text from image: {e}")
+            print(f"❌ Error in single-call image analysis: {e}")
             import traceback
             traceback.print_exc()
             return {
-                "success": False,
-                "text": "",
-                "error": f"Error extracting text from image: {str(e)}"
+                "ocr": {
+                    "success": False,
+                    "text": "",
+                    "error": f"Error analyzing image: {str(e)}"
+                },
+                "analysis": None
             }
 
 
@@ -0,0 +1,167 @@
+"""
+Image preprocessing for Gemini Vision OCR
+
+Phone photos arrive at full sensor resolution (often 12+ MP, several MB)
+although text stays legible at a fraction of that. Before an image is sent
+to Gemini it is:
+1. Rotated according to its EXIF orientation
+2. Converted to grayscale when it is effectively colorless (scanned pages, printouts)
+3. Downscaled so the long edge is at most OCR_MAX_LONG_EDGE pixels
+4. Re-encoded adaptively: PNG for screenshots and flat images, otherwise JPEG with the
+   highest quality that fits the byte budget (never below a legibility floor)
+"""
+
+import io
+import os
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image, ImageOps, ImageSequence, ImageStat
+
+# Long edge in pixels - ~2k keeps body text legible for Gemini Vision
+OCR_MAX_LONG_EDGE = int(os.getenv("OCR_MAX_LONG_EDGE", "2048"))
+
+# Byte budget for the re-encoded image
+OCR_TARGET_BYTES = int(os.getenv("OCR_TARGET_BYTES", str(1_500_000)))
+
+# JPEG qualities tried in order; the last one is the legibility floor
+JPEG_QUALITY_LADDER = (85, 75, 65, 60)
+
+# Mean HSV saturation (0-255) below which an image is treated as grayscale
+GRAYSCALE_SATURATION_THRESHOLD = 20
+
+# Images with at most this many distinct colors are encoded as PNG (screenshots, diagrams)
+PNG_MAX_COLORS = 64
+
+# PIL formats Gemini needs a different MIME type for. Phone cameras write
+# multi-picture JPEGs (MPO: the photo plus depth maps or previews), which are
+# valid JPEGs whose first image is the photo
+IMAGE_MIME_TYPES = {"MPO": "image/jpeg"}
+
+
+def image_mime_type(image_format: str, default: str = "image/jpeg") -> str:
+    """MIME type to send Gemini for an image of the given PIL format"""
+    return IMAGE_MIME_TYPES.get(image_format) or Image.MIME.get(image_format, default)
+
+
+def _is_effectively_grayscale(image: Image.Image) -> bool:
+    """Check whether an image carries no meaningful color information"""
+    if image.mode in ("L", "LA", "1"):
+        return True
+    thumbnail = image.convert("RGB").resize((64, 64))
+    saturation = ImageStat.Stat(thumbnail.convert("HSV")).mean[1]
+    return saturation < GRAYSCALE_SATURATION_THRESHOLD
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """Drop alpha/palette modes, compositing transparency onto white"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+    if image.mode not in ("RGB", "L"):
+        return image.convert("RGB")
+    return image
+
+
+def preprocess_image_for_ocr(
+    image_data: bytes,
+    max_long_edge: int = OCR_MAX_LONG_EDGE,
+    target_bytes: int = OCR_TARGET_BYTES
+) -> Tuple[bytes, str, Dict[str, Any]]:
+    """
+    Prepare an uploaded image for Gemini Vision OCR
+
+    Args:
+        image_data: Original image bytes
+        max_long_edge: Maximum length of the longer side in pixels
+        target_bytes: Byte budget for the re-encoded image
+
+    Returns:
+        (image_bytes, mime_type, stats) - stats describe what was changed
+    """
+    image = Image.open(io.BytesIO(image_data))
+    original_format = image.format
+    original_size = image.size
+
+    image = ImageOps.exif_transpose(image)
+
+    grayscale = _is_effectively_grayscale(image)
+    image = _flatten(image)
+    if grayscale and image.mode != "L":
+        image = image.convert("L")
+
+    if max(image.size) > max_long_edge:
+        image.thumbnail((max_long_edge, max_long_edge), Image.Resampling.LANCZOS)
+
+    transformed = image.size != original_size or grayscale
+
+    encoded, mime_type, quality = b"", "", None
+
+    # Flat images (few colors) and lossless screenshots stay sharper as PNG,
+    # as long as that fits the byte budget
+    if original_format == "PNG" or image.getcolors(maxcolors=PNG_MAX_COLORS) is not None:
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=True)
+        if buffer.tell() <= target_bytes:
+            encoded, mime_type = buffer.getvalue(), "image/png"
+
+    if not encoded:
+        for quality in JPEG_QUALITY_LADDER:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+            encoded = buffer.getvalue()
+            if len(encoded) <= target_bytes:
+                break
+        mime_type = "image/jpeg"
+
+    # Re-encoding an already small, untouched image can make it bigger - keep the original then
+    if not transformed and len(encoded) >= len(image_data) and original_format:
+        encoded = image_data
+        mime_type = image_mime_type(original_format, mime_type)
+        quality = None
+
+    stats = {
+        "original_bytes": len(image_data),
+        "processed_bytes": len(encoded),
+        "original_size": original_size,
+        "processed_size": image.size,
+        "grayscale": grayscale,
+        "mime_type": mime_type,
+        "jpeg_quality": quality if mime_type == "image/jpeg" else None,
+    }
+
+    return encoded, mime_type, stats
+
+
+def split_image_frames(image_data: bytes, max_frames: int) -> List[Tuple[bytes, str]]:
+    """
+    Split a multi-frame image (e.g. a multi-page TIFF scan) into single pages
+
+    Single-frame images are returned unchanged. Frames are re-encoded as
+    lossless PNG; preprocess_image_for_ocr downsizes them afterwards.
+
+    Args:
+        image_data: Image bytes
+        max_frames: Maximum number of pages to accept
+
+    Returns:
+        List of (page_bytes, mime_type) in page order
+
+    Raises:
+        ValueError: If the image has more than max_frames frames
+    """
+    image = Image.open(io.BytesIO(image_data))
+    # The extra frames of an MPO photo are not pages
+    frame_count = 1 if image.format == "MPO" else getattr(image, "n_frames", 1)
+    if frame_count == 1:
+        return [(image_data, image_mime_type(image.format or ""))]
+    if frame_count > max_frames:
+        raise ValueError(f"Image has {frame_count} pages; the maximum is {max_frames}")
+
+    pages = []
+    for frame in ImageSequence.Iterator(image):
+        buffer = io.BytesIO()
+        _flatten(frame.copy()).save(buffer, format="PNG")
+        pages.append((buffer.getvalue(), "image/png"))
+    return pages
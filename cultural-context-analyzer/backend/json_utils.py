@@ -0,0 +1,191 @@
+"""
+JSON helpers for Gemini responses
+
+Gemini returns the cultural analysis as a single JSON object, optionally
+wrapped in markdown fences or surrounded by commentary. The incremental
+parser below consumes the response as it streams in, scanning every
+character exactly once, and hands back each top-level field as soon as its
+value is complete.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class IncrementalJSONObjectParser:
+    """Parse the top-level fields of a JSON object while it is still streaming"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.invalid_fields: Dict[str, str] = {}  # field -> raw text that failed to parse
+        self.complete = False
+
+        self._pos = 0            # Next character of the buffer to scan
+        self._started = False    # Seen the opening brace of the object
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+
+    @property
+    def started(self) -> bool:
+        """Whether the opening brace of the JSON object has been seen"""
+        return self._started
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Add a chunk of streamed text and return fields completed by it
+
+        Args:
+            chunk: Next piece of the model response
+
+        Returns:
+            List of (field_name, value) tuples in the order they completed
+        """
+        self.buffer += chunk
+        completed: List[Tuple[str, Any]] = []
+
+        buf = self.buffer
+        i = self._pos
+        end = len(buf)
+
+        while i < end and not self.complete:
+            ch = buf[i]
+
+            # Skip markdown fences and any commentary before the object
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._depth = 1
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None and self._key is None:
+                        self._key = json.loads(buf[self._key_start:i + 1])
+                i += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None and self._value_start is None:
+                    self._key_start = i
+            elif ch == ':' and self._depth == 1 and self._key is not None and self._value_start is None:
+                self._value_start = i + 1
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_field(buf, i, completed)
+                    self.complete = True
+            elif ch == ',' and self._depth == 1:
+                self._finish_field(buf, i, completed)
+
+            i += 1
+
+        self._pos = i
+        return completed
+
+    def _finish_field(self, buf: str, end: int, completed: List[Tuple[str, Any]]):
+        """Decode the value of the current top-level field ending at `end`"""
+        if self._key is not None and self._value_start is not None:
+            raw_value = buf[self._value_start:end].strip()
+            try:
+                value = json.loads(raw_value)
+                self.fields[self._key] = value
+                completed.append((self._key, value))
+            except json.JSONDecodeError:
+                self.invalid_fields[self._key] = raw_value
+
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Repair near-valid JSON returned by the model
+
+    Handles the failure modes Gemini actually produces: markdown fences or
+    commentary around the object, trailing commas, and output truncated at
+    the token limit (the incomplete trailing element is dropped and the open
+    arrays/objects are closed).
+
+    Args:
+        text: Raw model output
+
+    Returns:
+        Parsed JSON value, or None if it could not be repaired
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    # Last point where every element so far is complete: (output length, open containers)
+    safe_point: Optional[Tuple[int, Tuple[str, ...]]] = None
+
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+            out.append(ch)
+        elif ch in '}]':
+            # Drop a trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            if not stack:
+                break
+            out.append(stack.pop())
+            safe_point = (len(out), tuple(stack))
+            if not stack:
+                break
+        elif ch == ',':
+            safe_point = (len(out), tuple(stack))
+            out.append(ch)
+        else:
+            out.append(ch)
+
+    candidate = ''.join(out)
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+
+    # Truncated output: cut back to the last complete element and close containers
+    if safe_point is None:
+        return None
+
+    cut, open_containers = safe_point
+    candidate = ''.join(out[:cut]).rstrip().rstrip(',') + ''.join(reversed(open_containers))
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return None
@@ -1,21 +1,28 @@
 from fastapi import FastAPI, HTTPException, Depends, status, Header, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
+import asyncio
+import json
 import uvicorn
 import bcrypt
 from jose import JWTError, jwt
 
 from database import (
     get_db, init_db, save_analysis, get_analysis, get_all_analyses,
-    get_cached_analysis, save_analysis_cache, get_cache_statistics,
-    create_user, get_user_by_email, get_user_by_id
+    get_cache_statistics, create_user, get_user_by_email, get_user_by_id
 )
+from analysis_schema import ANALYSIS_SECTIONS, UNREQUESTED_SECTION_VALUES
+from analysis_service import analysis_service
 from gemini_service import gemini_service
+from metrics import metrics
 from nlp_service import nlp_service
+from ocr_service import ocr_service, stitch_pages
+from upload_utils import UploadSizeLimitMiddleware, MAX_MULTIPAGE_REQUEST_BYTES, read_image_upload
 
 # JWT Configuration
 SECRET_KEY = "your-secret-key-change-in-production-use-env-variable"  # Change this in production!
@@ -31,9 +38,19 @@ async def lifespan(app: FastAPI):
     # Startup
     init_db()
     print("✅ Database initialized successfully")
+    analysis_service.prewarm_near_duplicate_index()
+    print(f"🏷️ Analysis prompt version: {gemini_service.prompt_version}")
+    eviction_task = asyncio.ensure_future(analysis_service.evict_outdated_versions())
+    nlp_service.prewarm_memory_cache()
+    nlp_service.prewarm_entity_matcher()
+    nlp_service.clear_expired_negative_entries()
+    hit_flush_task = asyncio.ensure_future(nlp_service.flush_hit_counts_periodically())
     print("🚀 Cultural Context Analyzer API is running")
     yield
-    # Shutdown (if needed)
+    # Shutdown
+    eviction_task.cancel()
+    hit_flush_task.cancel()
+    nlp_service.flush_hit_counts()
 
 
 # Initialize FastAPI app
@@ -44,6 +61,13 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Reject oversized uploads before their body is read (added before CORS so
+# the 413 response still carries CORS headers)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    path_limits={"/api/ocr/extract/pages": MAX_MULTIPAGE_REQUEST_BYTES}
+)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -54,10 +78,28 @@ app.add_middleware(
 )
 
 
+def validate_sections(sections: Optional[List[str]]):
+    """Reject unknown analysis section names"""
+    unknown = [section for section in sections or [] if section not in ANALYSIS_SECTIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown analysis section(s): {', '.join(unknown)}. Valid sections: {', '.join(ANALYSIS_SECTIONS)}"
+        )
+
+
+def ndjson_event(payload: Dict[str, Any]) -> str:
+    """Serialize one event of a newline-delimited JSON streaming response"""
+    return json.dumps(payload, default=str) + "\n"
+
+
 # Pydantic models for request/response
 class AnalyzeRequest(BaseModel):
     text: str
     language: Optional[str] = "en"
+    long_document: Optional[bool] = None  # None = automatic map-reduce for long texts
+    sections: Optional[List[str]] = None  # None = all analysis sections
+    latency_budget_ms: Optional[int] = None  # Routes cache misses to a faster model tier
 
 
 class RegisterRequest(BaseModel):
@@ -337,8 +379,12 @@ async def analyze_text(
     
     This endpoint uses Supabase persistent caching to reduce API calls:
     - Check Supabase cache (30-day TTL)
-    - On cache miss, call Gemini API and save to cache
-    - NLP entity detection runs every time for accuracy
+    - On cache miss, call Gemini API and save successful results to cache
+    - Inputs blocked by safety filters are remembered in a short-TTL negative cache
+    - NLP entity results are cached per text and spaCy model version, and
+      re-enriched once older than ENTITY_EXTRACTION_FRESHNESS_HOURS
+    - With "sections", only those sections are generated (missing ones from
+      the per-section cache); the other sections are returned empty
     
     This endpoint:
     1. Identifies the cultural origin
@@ -353,31 +399,22 @@ async def analyze_text(
             status_code=400,
             detail="Text must be at least 10 characters long"
         )
+    validate_sections(request.sections)
     
     try:
-        # Check Supabase persistent cache first
-        print(f"🔍 Checking Supabase cache...")
-        cached_result = get_cached_analysis(request.text, request.language or "en")
-        
-        if cached_result:
-            print(f"🎯 Cache HIT! Skipping Gemini API call...")
-            analysis_result = cached_result
-        else:
-            print(f"❌ Cache MISS. Calling Gemini API...")
-            
-            # Call Gemini API
-            analysis_result = await gemini_service.analyze_cultural_context(
-                text=request.text,
-                language=request.language or "en"
-            )
-            
-            # Save to Supabase cache for future requests
-            print(f"💾 Saving to Supabase cache...")
-            save_analysis_cache(request.text, request.language or "en", analysis_result)
+        # Serve from cache or call Gemini (failures are never cached)
+        analysis_result = await analysis_service.get_or_create_analysis(
+            request.text,
+            request.language or "en",
+            long_document=request.long_document,
+            sections=request.sections,
+            latency_budget_ms=request.latency_budget_ms
+        )
         
-        # Extract and enrich cultural entities with NLP (always runs for accuracy)
+        # Extract and enrich cultural entities with NLP (cached per text and model version)
         print("🔍 Extracting cultural entities with NLP...")
-        entity_analysis = nlp_service.analyze_text_with_entities(
+        entity_analysis = await asyncio.to_thread(
+            nlp_service.analyze_text_with_entities,
             text=request.text,
             enrich_all=True
         )
@@ -413,6 +450,77 @@ async def analyze_text(
         )
 
 
+@app.post("/api/analyze/stream")
+async def analyze_text_stream(
+    request: AnalyzeRequest,
+    current_user: dict = Depends(verify_token)
+):
+    """
+    Analyze text for cultural context, streaming sections as they complete
+    
+    Returns newline-delimited JSON events so the frontend can render each
+    section progressively:
+    - {"event": "section", "section": "<field>", "value": ...} per top-level field
+    - {"event": "complete", "analysis": {...}} with the saved analysis
+    - {"event": "error", "detail": "..."} if the analysis fails
+    
+    Cache hits emit all sections at once; the final analysis is saved and
+    cached exactly like POST /api/analyze. Blocked inputs end with an error
+    event and are not cached.
+    """
+    
+    if not request.text or len(request.text.strip()) < 10:
+        raise HTTPException(
+            status_code=400,
+            detail="Text must be at least 10 characters long"
+        )
+    validate_sections(request.sections)
+    
+    language = request.language or "en"
+    
+    async def generate():
+        try:
+            # Sections that were not requested are saved empty
+            analysis_result = dict(UNREQUESTED_SECTION_VALUES)
+            async for section, value in analysis_service.stream_analysis(
+                request.text, language, request.sections, request.latency_budget_ms
+            ):
+                analysis_result[section] = value
+                yield ndjson_event({"event": "section", "section": section, "value": value})
+            
+            print("🔍 Extracting cultural entities with NLP...")
+            entity_analysis = await asyncio.to_thread(
+                nlp_service.analyze_text_with_entities,
+                text=request.text,
+                enrich_all=True
+            )
+            
+            analysis_data = {
+                'input_text': request.text,
+                'language': request.language,
+                'cultural_origin': analysis_result["cultural_origin"],
+                'cross_cultural_connections': analysis_result["cross_cultural_connections"],
+                'modern_analogy': analysis_result["modern_analogy"],
+                'image_url': None,
+                'timeline_events': analysis_result.get("timeline_events", []),
+                'geographic_locations': analysis_result.get("geographic_locations", []),
+                'key_concepts': analysis_result.get("key_concepts", []),
+                'external_resources': analysis_result.get("external_resources", {}),
+                'detected_entities': entity_analysis.get("detected_entities", []),
+                'created_at': datetime.utcnow().isoformat()
+            }
+            
+            saved_analysis = save_analysis(analysis_data, user_id=current_user['id'])
+            
+            yield ndjson_event({"event": "complete", "analysis": saved_analysis})
+            
+        except Exception as e:
+            print(f"Error in analyze_text_stream: {e}")
+            yield ndjson_event({"event": "error", "detail": f"Error analyzing text: {str(e)}"})
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 class OCRResponse(BaseModel):
     success: bool
     text: str
@@ -437,27 +545,14 @@ async def extract_text_from_image(
         Extracted text and metadata
     """
     
-    # Validate file type
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(
-            status_code=400,
-            detail="File must be an image (JPG, PNG, etc.)"
-        )
-    
-    # Read image data
     try:
-        image_data = await file.read()
+        # Validate the image header and read it with the size limit enforced
+        image_data, image_info = await read_image_upload(file)
         
-        if len(image_data) > 20 * 1024 * 1024:  # 20MB limit for Gemini
-            raise HTTPException(
-                status_code=400,
-                detail="Image file too large. Maximum size is 20MB."
-            )
-        
-        # Extract text using Gemini Vision API
-        result = await gemini_service.extract_text_from_image(
+        # Extract text (OCR cache first, then Gemini Vision API)
+        result = await ocr_service.extract_text(
             image_data, 
-            mime_type=file.content_type or "image/jpeg"
+            mime_type=image_info["mime_type"]
         )
         
         return OCRResponse(**result)
@@ -472,10 +567,78 @@ async def extract_text_from_image(
         )
 
 
+@app.post("/api/ocr/extract/pages")
+async def extract_text_from_pages(
+    files: List[UploadFile] = File(...),
+    current_user: dict = Depends(verify_token)
+):
+    """
+    Extract text from a multi-page document using Gemini Vision API
+    
+    Accepts several page images (in page order) and/or multi-frame TIFF
+    scans. Pages are extracted concurrently and streamed as newline-delimited
+    JSON events as soon as each one completes:
+    - {"event": "page", "page": <n>, "success": ..., "text": "...", ...} per page, in completion order
+    - {"event": "complete", "text": "...", "page_count": <n>, "failed_pages": [...], ...}
+      with the text of all pages stitched in page order, and the named
+      entities of each page (unenriched, offsets within the page text)
+      extracted in one spaCy batch
+    - {"event": "error", "detail": "..."} if extraction fails
+    
+    Args:
+        files: Page images (JPG, PNG, TIFF, etc.)
+    """
+    
+    images = []
+    for file in files:
+        image_data, image_info = await read_image_upload(file)
+        images.append((image_data, image_info["mime_type"]))
+    
+    try:
+        pages = await asyncio.to_thread(ocr_service.split_pages, images)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    print(f"📄 Extracting text from {len(pages)} page(s)...")
+    
+    async def generate():
+        try:
+            page_results = []
+            async for page_result in ocr_service.extract_pages(pages):
+                page_results.append(page_result)
+                yield ndjson_event({"event": "page", **page_result})
+            
+            text = stitch_pages(page_results)
+            extracted = sorted((result for result in page_results if result.get("success")), key=lambda result: result["page"])
+            page_entities = await asyncio.to_thread(
+                nlp_service.extract_entities_batch,
+                [result["text"] for result in extracted]
+            )
+            yield ndjson_event({
+                "event": "complete",
+                "text": text,
+                "page_count": len(pages),
+                "failed_pages": sorted(result["page"] for result in page_results if not result.get("success")),
+                "character_count": len(text),
+                "word_count": len(text.split()),
+                "page_entities": [
+                    {"page": result["page"], "entities": entities}
+                    for result, entities in zip(extracted, page_entities)
+                ]
+            })
+            
+        except Exception as e:
+            print(f"Error in extract_text_from_pages: {e}")
+            yield ndjson_event({"event": "error", "detail": f"Error processing pages: {str(e)}"})
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 @app.post("/api/analyze/image", response_model=AnalysisResponse)
 async def analyze_image(
     file: UploadFile = File(...),
     language: str = Form(default='en'),
+    single_call: Optional[bool] = Form(default=None),
     current_user: dict = Depends(verify_token)
 ):
     """
@@ -484,34 +647,25 @@ async def analyze_image(
     Args:
         file: Image file containing text
         language: Output language for analysis (default: 'en')
+        single_call: Extract and analyze in one multimodal Gemini request
+            (default: IMAGE_ANALYSIS_SINGLE_CALL)
         current_user: Authenticated user (from token)
     
     Returns:
         Cultural analysis of the extracted text
     """
     
-    # Validate file type
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(
-            status_code=400,
-            detail="File must be an image (JPG, PNG, etc.)"
-        )
-    
     try:
-        # Read image data
-        image_data = await file.read()
-        
-        if len(image_data) > 20 * 1024 * 1024:  # 20MB limit for Gemini
-            raise HTTPException(
-                status_code=400,
-                detail="Image file too large. Maximum size is 20MB."
-            )
-        
-        # Extract text using Gemini Vision API
-        print(f"📸 Extracting text from uploaded image using Gemini Vision...")
-        ocr_result = await gemini_service.extract_text_from_image(
-            image_data, 
-            mime_type=file.content_type or "image/jpeg"
+        # Validate the image header and read it with the size limit enforced
+        image_data, image_info = await read_image_upload(file)
+        
+        # Extract text and analyze it (OCR and analysis caches first, then Gemini)
+        print(f"📸 Extracting text from uploaded image...")
+        ocr_result, analysis_result = await analysis_service.analyze_image(
+            image_data,
+            language or "en",
+            mime_type=image_info["mime_type"],
+            single_call=single_call
         )
         
         if not ocr_result.get('success'):
@@ -530,30 +684,10 @@ async def analyze_image(
         
         print(f"✅ Extracted {len(extracted_text)} characters from image")
         
-        # Now analyze the extracted text using the regular analyze endpoint logic
-        # Check Supabase persistent cache first
-        print(f"🔍 Checking Supabase cache...")
-        cached_result = get_cached_analysis(extracted_text, language or "en")
-        
-        if cached_result:
-            print(f"🎯 Cache HIT! Skipping Gemini API call...")
-            analysis_result = cached_result
-        else:
-            print(f"❌ Cache MISS. Calling Gemini API...")
-            
-            # Call Gemini API
-            analysis_result = await gemini_service.analyze_cultural_context(
-                text=extracted_text,
-                language=language or "en"
-            )
-            
-            # Save to Supabase cache for future requests
-            print(f"💾 Saving to Supabase cache...")
-            save_analysis_cache(extracted_text, language or "en", analysis_result)
-        
         # Extract and enrich cultural entities with NLP
         print("🔍 Extracting cultural entities with NLP...")
-        entity_analysis = nlp_service.analyze_text_with_entities(
+        entity_analysis = await asyncio.to_thread(
+            nlp_service.analyze_text_with_entities,
             text=extracted_text,
             enrich_all=True
         )
@@ -721,7 +855,8 @@ async def extract_entities(request: EntityExtractionRequest):
         )
     
     try:
-        result = nlp_service.analyze_text_with_entities(
+        result = await asyncio.to_thread(
+            nlp_service.analyze_text_with_entities,
             text=request.text,
             enrich_all=True
         )
@@ -759,7 +894,7 @@ async def get_entity_highlights(text: str):
         )
     
     try:
-        highlights = nlp_service.get_entity_highlights(text)
+        highlights = await asyncio.to_thread(nlp_service.get_entity_highlights, text)
         
         return {
             "highlights": highlights,
@@ -808,6 +943,26 @@ async def get_cache_stats():
         )
 
 
+@app.get("/api/metrics")
+async def get_metrics(current_user: dict = Depends(verify_token)):
+    """
+    Get in-process service metrics (requires authentication)
+    
+    Returns counters (e.g. Gemini parse failures, local repairs, regenerated
+    sections), timing summaries and derived rates for this process, plus
+    per-API-key usage and cooldown state and the size of the in-memory
+    entity cache (its hits and misses are under entity_cache.memory.*).
+    """
+    return {
+        **metrics.snapshot(),
+        "api_keys": gemini_service.key_pool.snapshot(),
+        "entity_memory_cache": {
+            "entries": len(nlp_service.memory_cache),
+            "bytes": nlp_service.memory_cache.bytes_used
+        }
+    }
+
+
 @app.post("/api/cache/clear")
 async def clear_cache():
     """
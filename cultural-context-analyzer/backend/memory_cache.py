@@ -0,0 +1,101 @@
+"""
+In-memory TTL cache
+
+Process-local LRU cache with per-entry expiry, bounded by entry count and
+optionally by estimated memory. Used for short-lived caches that should not
+outlive the process, and as a hot layer in front of Supabase caches.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from metrics import metrics
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a TTL"""
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl_seconds: float = 300,
+        name: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None
+    ):
+        """
+        Args:
+            maxsize: Maximum number of entries (least recently used are evicted)
+            ttl_seconds: Default time-to-live for entries
+            name: Metrics prefix for hit/miss counters (no metrics if omitted)
+            max_bytes: Maximum total estimated size of the values (requires sizeof)
+            sizeof: Estimated size of a value in bytes
+        """
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self.max_bytes = max_bytes if sizeof else None
+        self.sizeof = sizeof
+        self.bytes_used = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count(self, event: str):
+        if self.name:
+            metrics.increment(f"{self.name}.{event}")
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or `default` if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._count("misses")
+                return default
+
+            value, expires_at, size = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.bytes_used -= size
+                self._count("misses")
+                return default
+
+            self._data.move_to_end(key)
+            self._count("hits")
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        """Store a value, evicting the least recently used entries if full"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.bytes_used -= previous[2]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return  # Would evict everything else
+
+            self._data[key] = (value, time.monotonic() + ttl, size)
+            self.bytes_used += size
+            while len(self._data) > self.maxsize or (self.max_bytes is not None and self.bytes_used > self.max_bytes):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self.bytes_used -= evicted_size
+                self._count("evictions")
+
+    def delete(self, key: Hashable):
+        """Remove an entry if present"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self.bytes_used -= entry[2]
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._data.clear()
+            self.bytes_used = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,90 @@
+"""
+In-process metrics
+
+Lightweight counters and timing windows shared by the services and exposed
+through GET /api/metrics. Counters are per process; they reset on restart.
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+
+class MetricsRegistry:
+    """Thread-safe registry of counters, timings and derived ratios"""
+
+    def __init__(self, window_size: int = 1000):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._timings: Dict[str, Deque[float]] = {}
+        self._ratios: Dict[str, Tuple[str, str]] = {}
+        self.window_size = window_size
+
+    def increment(self, name: str, amount: float = 1):
+        """Increase a counter"""
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, name: str) -> float:
+        """Current value of a counter"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def observe(self, name: str, value: float):
+        """Record a timing sample (kept in a rolling window)"""
+        with self._lock:
+            window = self._timings.get(name)
+            if window is None:
+                window = self._timings[name] = deque(maxlen=self.window_size)
+            window.append(value)
+
+    def percentile(self, name: str, pct: float) -> Optional[float]:
+        """Percentile of the recorded samples, or None without samples"""
+        with self._lock:
+            samples = sorted(self._timings.get(name, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def sample_count(self, name: str) -> int:
+        """Number of samples currently in the timing window"""
+        with self._lock:
+            return len(self._timings.get(name, ()))
+
+    def register_ratio(self, name: str, numerator: str, denominator: str):
+        """Report `numerator / denominator` counters as a derived metric"""
+        self._ratios[name] = (numerator, denominator)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All metrics as a JSON-serializable dict"""
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: sorted(window) for name, window in self._timings.items()}
+
+        timing_summary = {}
+        for name, samples in timings.items():
+            if not samples:
+                continue
+            timing_summary[name] = {
+                "count": len(samples),
+                "avg": round(sum(samples) / len(samples), 4),
+                "p50": samples[int(0.5 * (len(samples) - 1))],
+                "p95": samples[int(0.95 * (len(samples) - 1))],
+                "max": samples[-1],
+            }
+
+        ratios = {}
+        for name, (numerator, denominator) in self._ratios.items():
+            total = counters.get(denominator, 0)
+            ratios[name] = round(counters.get(numerator, 0) / total, 4) if total else 0
+
+        return {
+            "counters": counters,
+            "timings": timing_summary,
+            "ratios": ratios,
+        }
+
+
+# Singleton instance
+metrics = MetricsRegistry()
@@ -0,0 +1,233 @@
+"""
+Model tiering and routing for Gemini analysis requests
+
+A 12-character proverb does not need the same model as a 5,000-word essay.
+The router picks a model tier (model name + generation parameters) for each
+analysis from the input length, the requested sections and the caller's
+latency budget, using an ordered list of rules: the first matching rule
+wins, and requests no rule matches use the default tier.
+
+Tiers and rules are configurable through environment variables holding JSON:
+    GEMINI_MODEL_TIERS='{"lite": {"model": "gemini-2.5-flash-lite"}, "pro": {"model": "gemini-2.5-pro"}}'
+    GEMINI_ROUTING_RULES='[{"tier": "lite", "max_chars": 280}, {"tier": "pro", "min_chars": 20000}]'
+    GEMINI_DEFAULT_TIER=standard
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from analysis_schema import ANALYSIS_SECTIONS
+
+# Built-in tiers; GEMINI_MODEL_TIERS entries are merged over these.
+# Costs are USD per million tokens, used for the per-tier cost metrics.
+DEFAULT_TIERS: Dict[str, Dict[str, Any]] = {
+    "lite": {
+        "model": "gemini-2.5-flash-lite",
+        "temperature": 0.7,
+        "max_output_tokens": 4096,
+        "input_cost_per_million": 0.10,
+        "output_cost_per_million": 0.40,
+    },
+    "standard": {
+        "model": "gemini-2.5-flash",
+        "temperature": 0.7,
+        "max_output_tokens": 8192,
+        "input_cost_per_million": 0.30,
+        "output_cost_per_million": 2.50,
+    },
+}
+
+# Built-in rules, evaluated in order; GEMINI_ROUTING_RULES replaces them
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    # Callers that need an answer fast (e.g. inline tooltips)
+    {"tier": "lite", "max_latency_budget_ms": 5000},
+    # Proverbs, idioms and single sentences
+    {"tier": "lite", "max_chars": 280},
+]
+
+
+class ModelTier:
+    """A Gemini model with its generation parameters and pricing"""
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        temperature: float = 0.7,
+        max_output_tokens: int = 8192,
+        input_cost_per_million: float = 0.0,
+        output_cost_per_million: float = 0.0
+    ):
+        """
+        Args:
+            name: Tier name used in rules and metrics
+            model: Gemini model name
+            temperature: Sampling temperature for analyses on this tier
+            max_output_tokens: Upper bound on the output token budget
+            input_cost_per_million: USD per million prompt tokens
+            output_cost_per_million: USD per million output tokens
+        """
+        self.name = name
+        self.model = model
+        self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
+        self.input_cost_per_million = input_cost_per_million
+        self.output_cost_per_million = output_cost_per_million
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        """Estimated cost of a request in USD"""
+        return (
+            input_tokens * self.input_cost_per_million
+            + output_tokens * self.output_cost_per_million
+        ) / 1_000_000
+
+
+class RoutingRule:
+    """Conditions under which requests go to a tier (all given conditions must hold)"""
+
+    def __init__(
+        self,
+        tier: str,
+        min_chars: Optional[int] = None,
+        max_chars: Optional[int] = None,
+        max_sections: Optional[int] = None,
+        sections_subset: Optional[List[str]] = None,
+        min_latency_budget_ms: Optional[int] = None,
+        max_latency_budget_ms: Optional[int] = None
+    ):
+        """
+        Args:
+            tier: Tier to route matching requests to
+            min_chars: Input length at least this many characters
+            max_chars: Input length at most this many characters
+            max_sections: At most this many sections requested
+            sections_subset: Only sections from this list requested
+            min_latency_budget_ms: Caller's latency budget at least this (requires a budget)
+            max_latency_budget_ms: Caller's latency budget at most this (requires a budget)
+        """
+        self.tier = tier
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.max_sections = max_sections
+        self.sections_subset = set(sections_subset) if sections_subset is not None else None
+        self.min_latency_budget_ms = min_latency_budget_ms
+        self.max_latency_budget_ms = max_latency_budget_ms
+
+    def matches(self, text_length: int, sections: List[str], latency_budget_ms: Optional[int]) -> bool:
+        if self.min_chars is not None and text_length < self.min_chars:
+            return False
+        if self.max_chars is not None and text_length > self.max_chars:
+            return False
+        if self.max_sections is not None and len(sections) > self.max_sections:
+            return False
+        if self.sections_subset is not None and not set(sections) <= self.sections_subset:
+            return False
+        if self.min_latency_budget_ms is not None or self.max_latency_budget_ms is not None:
+            if latency_budget_ms is None:
+                return False
+            if self.min_latency_budget_ms is not None and latency_budget_ms < self.min_latency_budget_ms:
+                return False
+            if self.max_latency_budget_ms is not None and latency_budget_ms > self.max_latency_budget_ms:
+                return False
+        return True
+
+
+class ModelRouter:
+    """Pick a model tier for an analysis request"""
+
+    def __init__(self, tiers: Dict[str, ModelTier], rules: List[RoutingRule], default_tier: str = "standard"):
+        """
+        Args:
+            tiers: Available tiers by name
+            rules: Rules evaluated in order; the first match wins
+            default_tier: Tier for requests no rule matches
+        """
+        unknown = {rule.tier for rule in rules if rule.tier not in tiers} | ({default_tier} - set(tiers))
+        if unknown:
+            raise ValueError(f"Routing refers to unknown tier(s): {', '.join(sorted(unknown))}")
+
+        self.tiers = tiers
+        self.rules = rules
+        self.default = tiers[default_tier]
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        """Build the router from GEMINI_MODEL_TIERS / GEMINI_ROUTING_RULES / GEMINI_DEFAULT_TIER"""
+        tier_configs = {name: dict(config) for name, config in DEFAULT_TIERS.items()}
+        rule_configs = DEFAULT_RULES
+
+        try:
+            for name, overrides in json.loads(os.getenv("GEMINI_MODEL_TIERS", "{}")).items():
+                tier_configs.setdefault(name, {}).update(overrides)
+            if os.getenv("GEMINI_ROUTING_RULES"):
+                rule_configs = json.loads(os.getenv("GEMINI_ROUTING_RULES", "[]"))
+
+            return cls(
+                tiers={name: ModelTier(name=name, **config) for name, config in tier_configs.items()},
+                rules=[RoutingRule(**rule) for rule in rule_configs],
+                default_tier=os.getenv("GEMINI_DEFAULT_TIER", "standard")
+            )
+        except (ValueError, TypeError) as e:
+            print(f"⚠️ Invalid model routing configuration ({e}), using built-in tiers and rules")
+            return cls(
+                tiers={name: ModelTier(name=name, **config) for name, config in DEFAULT_TIERS.items()},
+                rules=[RoutingRule(**rule) for rule in DEFAULT_RULES]
+            )
+
+    def describe(self) -> Dict[str, Any]:
+        """Routing configuration that affects outputs (pricing excluded), for cache versioning"""
+        return {
+            "default": self.default.name,
+            "tiers": {
+                name: [tier.model, tier.temperature, tier.max_output_tokens]
+                for name, tier in sorted(self.tiers.items())
+            },
+            "rules": [
+                {
+                    key: sorted(value) if isinstance(value, set) else value
+                    for key, value in vars(rule).items() if value is not None
+                }
+                for rule in self.rules
+            ],
+        }
+
+    def route(
+        self,
+        text_length: int,
+        sections: Optional[List[str]] = None,
+        latency_budget_ms: Optional[int] = None
+    ) -> ModelTier:
+        """
+        Choose the tier for an analysis request
+
+        Args:
+            text_length: Input length in characters
+            sections: Requested sections (default: all)
+            latency_budget_ms: Caller's latency budget, if any
+
+        Returns:
+            The first matching rule's tier, or the default tier
+        """
+        # No sections means a full analysis - section rules must see all of them
+        sections = sections or ANALYSIS_SECTIONS
+        for rule in self.rules:
+            if rule.matches(text_length, sections, latency_budget_ms):
+                return self.tiers[rule.tier]
+        return self.default
+
+    def is_budget_routed(
+        self,
+        text_length: int,
+        sections: Optional[List[str]] = None,
+        latency_budget_ms: Optional[int] = None
+    ) -> bool:
+        """
+        Whether the latency budget moves a request to another tier than the same request without one
+
+        Such results depend on the caller, not just the text, so they are not
+        cached as the canonical analysis.
+        """
+        if latency_budget_ms is None:
+            return False
+        return self.route(text_length, sections, latency_budget_ms) is not self.route(text_length, sections)
@@ -22,6 +22,9 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Summary reported when no source knows an entity (never cached as a result)
+NO_INFORMATION_SUMMARY = "No information found in authoritative sources"
+
 
 class MultiSourceService:
     """Service for fetching entity information from multiple authoritative sources"""
@@ -59,10 +62,17 @@ class MultiSourceService:
         
         self.last_request_time[service_name] = time.time()
     
+    @staticmethod
+    def _record_failure(errors: Optional[List[str]], source: str):
+        """Note a source that could not be queried (error status, timeout, network error)"""
+        if errors is not None:
+            errors.append(source)
+    
     def get_knowledge_graph_info(
         self, 
         entity_name: str, 
-        entity_type: str = "Thing"
+        entity_type: str = "Thing",
+        errors: Optional[List[str]] = None
     ) -> Optional[Dict[str, Any]]:
         """
         Fetch information from Google Knowledge Graph (most accurate)
@@ -70,6 +80,7 @@ class MultiSourceService:
         Args:
             entity_name: Name of the entity
             entity_type: Type hint for better results
+            errors: List to append the source name to if the request fails
         
         Returns:
             Dictionary with Knowledge Graph data or None
@@ -106,6 +117,7 @@ class MultiSourceService:
             )
             
             if response.status_code != 200:
+                self._record_failure(errors, "Google Knowledge Graph")
                 return None
             
             data = response.json()
@@ -132,14 +144,16 @@ class MultiSourceService:
             
         except Exception as e:
             print(f"❌ Knowledge Graph error for '{entity_name}': {e}")
+            self._record_failure(errors, "Google Knowledge Graph")
             return None
     
-    def get_dbpedia_info(self, entity_name: str) -> Optional[Dict[str, Any]]:
+    def get_dbpedia_info(self, entity_name: str, errors: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
         """
         Fetch structured data from DBpedia (structured Wikipedia)
         
         Args:
             entity_name: Name of the entity
+            errors: List to append the source name to if the request fails
         
         Returns:
             Dictionary with DBpedia data or None
@@ -172,6 +186,7 @@ class MultiSourceService:
             )
             
             if response.status_code != 200:
+                self._record_failure(errors, "DBpedia")
                 return None
             
             data = response.json()
@@ -191,14 +206,16 @@ class MultiSourceService:
             
         except Exception as e:
             print(f"❌ DBpedia error for '{entity_name}': {e}")
+            self._record_failure(errors, "DBpedia")
             return None
     
-    def get_wikidata_enhanced(self, entity_name: str) -> Optional[Dict[str, Any]]:
+    def get_wikidata_enhanced(self, entity_name: str, errors: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
         """
         Enhanced Wikidata lookup with more details
         
         Args:
             entity_name: Name of the entity
+            errors: List to append the source name to if the request fails
         
         Returns:
             Dictionary with enhanced Wikidata information
@@ -222,6 +239,7 @@ class MultiSourceService:
             )
             
             if response.status_code != 200:
+                self._record_failure(errors, "Wikidata")
                 return None
             
             search_data = response.json()
@@ -248,6 +266,7 @@ class MultiSourceService:
             )
             
             if detail_response.status_code != 200:
+                self._record_failure(errors, "Wikidata")
                 return None
             
             entity_data = detail_response.json()
@@ -269,6 +288,7 @@ class MultiSourceService:
             # Debug info (can be removed in production)
             import traceback
             print(f"   Debug: {traceback.format_exc()[:200]}")
+            self._record_failure(errors, "Wikidata")
             return None
     
     def _get_wikipedia_url_from_sitelinks(self, sitelinks: Dict) -> Optional[str]:
@@ -278,12 +298,13 @@ class MultiSourceService:
             return f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}"
         return None
     
-    def get_openlibrary_info(self, work_title: str) -> Optional[Dict[str, Any]]:
+    def get_openlibrary_info(self, work_title: str, errors: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
         """
         Fetch information about literary works from OpenLibrary
         
         Args:
             work_title: Title of the book/work
+            errors: List to append the source name to if the request fails
         
         Returns:
             Dictionary with OpenLibrary data or None
@@ -303,6 +324,7 @@ class MultiSourceService:
             )
             
             if response.status_code != 200:
+                self._record_failure(errors, "OpenLibrary")
                 return None
             
             data = response.json()
@@ -326,13 +348,16 @@ class MultiSourceService:
             
         except Exception as e:
             print(f"❌ OpenLibrary error for '{work_title}': {e}")
+            self._record_failure(errors, "OpenLibrary")
             return None
     
     def get_comprehensive_info(
         self, 
         entity_name: str, 
         entity_type: str = "MISC",
-        parallel: bool = True
+        parallel: bool = True,
+        wikidata: Optional[Dict[str, Any]] = None,
+        wikidata_resolved: bool = False
     ) -> Dict[str, Any]:
         """
         Get comprehensive information by querying multiple sources
@@ -348,19 +373,26 @@ class MultiSourceService:
             entity_name: Name of the entity
             entity_type: Type of entity (PERSON, ORG, GPE, WORK_OF_ART, etc.)
             parallel: If True, queries APIs in parallel (faster). If False, sequential (default: True)
+            wikidata: Result of get_wikidata_enhanced if already looked up
+            wikidata_resolved: Whether `wikidata` is such a result (None then means
+                Wikidata has no match) - skips the Wikidata query
         
         Returns:
-            Combined enriched data from multiple sources
+            Combined enriched data from multiple sources. "failed_sources" lists
+            the sources that could not be queried (errors, rate limits, timeouts),
+            so an empty result is only a definite "not found" when it is empty
         """
         if parallel:
-            return self._get_comprehensive_info_parallel(entity_name, entity_type)
+            return self._get_comprehensive_info_parallel(entity_name, entity_type, wikidata, wikidata_resolved)
         else:
-            return self._get_comprehensive_info_sequential(entity_name, entity_type)
+            return self._get_comprehensive_info_sequential(entity_name, entity_type, wikidata, wikidata_resolved)
     
     def _get_comprehensive_info_parallel(
         self, 
         entity_name: str, 
-        entity_type: str = "MISC"
+        entity_type: str = "MISC",
+        wikidata: Optional[Dict[str, Any]] = None,
+        wikidata_resolved: bool = False
     ) -> Dict[str, Any]:
         """
         Parallel version - queries all APIs simultaneously (FAST!)
@@ -375,10 +407,14 @@ class MultiSourceService:
             "description": None,
             "url": None,
             "sources_consulted": [],
+            "failed_sources": [],
             "confidence": "low",
             "retrieved_at": datetime.utcnow().isoformat()
         }
         
+        # Sources whose request failed (not the same as "not found")
+        failed_sources = combined_data["failed_sources"]
+        
         # Create wrapper functions that make actual API calls without rate limiting
         # (since they're running in parallel, rate limiting doesn't make sense)
         def fetch_kg():
@@ -404,6 +440,7 @@ class MultiSourceService:
                 
                 response = requests.get(self.knowledge_graph_api, params=params, timeout=5)
                 if response.status_code != 200:
+                    failed_sources.append("Google Knowledge Graph")
                     return None
                 
                 data = response.json()
@@ -426,6 +463,7 @@ class MultiSourceService:
                 }
             except Exception as e:
                 print(f"  ⚠️  KG error: {e}")
+                failed_sources.append("Google Knowledge Graph")
                 return None
         
         def fetch_dbpedia():
@@ -448,6 +486,7 @@ class MultiSourceService:
                 )
                 
                 if response.status_code != 200:
+                    failed_sources.append("DBpedia")
                     return None
                 
                 data = response.json()
@@ -464,6 +503,7 @@ class MultiSourceService:
                 }
             except Exception as e:
                 print(f"  ⚠️  DBpedia error: {e}")
+                failed_sources.append("DBpedia")
                 return None
         
         def fetch_wikidata():
@@ -478,6 +518,7 @@ class MultiSourceService:
                 
                 response = requests.get(self.wikidata_api, params=search_params, timeout=5)
                 if response.status_code != 200:
+                    failed_sources.append("Wikidata")
                     return None
                 
                 search_data = response.json()
@@ -497,6 +538,7 @@ class MultiSourceService:
                 
                 detail_response = requests.get(self.wikidata_api, params=entity_params, timeout=5)
                 if detail_response.status_code != 200:
+                    failed_sources.append("Wikidata")
                     return None
                 
                 entity_data = detail_response.json()
@@ -520,6 +562,7 @@ class MultiSourceService:
                 }
             except Exception as e:
                 print(f"  ⚠️  Wikidata error: {e}")
+                failed_sources.append("Wikidata")
                 return None
         
         def fetch_openlibrary():
@@ -531,6 +574,7 @@ class MultiSourceService:
                 )
                 
                 if response.status_code != 200:
+                    failed_sources.append("OpenLibrary")
                     return None
                 
                 data = response.json()
@@ -551,20 +595,24 @@ class MultiSourceService:
                 }
             except Exception as e:
                 print(f"  ⚠️  OpenLibrary error: {e}")
+                failed_sources.append("OpenLibrary")
                 return None
         
         # Execute all tasks in parallel using ThreadPoolExecutor
         tasks = {
             'kg': fetch_kg,
             'dbpedia': fetch_dbpedia,
-            'wikidata': fetch_wikidata,
         }
         
+        # Wikidata may already have been resolved by the caller
+        if not wikidata_resolved:
+            tasks['wikidata'] = fetch_wikidata
+        
         # Add OpenLibrary for literary works
         if entity_type == "WORK_OF_ART" or any(keyword in entity_name.lower() for keyword in ['book', 'novel', 'play']):
             tasks['openlibrary'] = fetch_openlibrary
         
-        results = {}
+        results = {'wikidata': wikidata}
         with ThreadPoolExecutor(max_workers=4) as executor:
             future_to_source = {executor.submit(task): source for source, task in tasks.items()}
             
@@ -574,6 +622,7 @@ class MultiSourceService:
                     results[source] = future.result()
                 except Exception as e:
                     print(f"  ⚠️  Error in {source}: {e}")
+                    failed_sources.append(source)
                     results[source] = None
         
         # Process results (same logic as sequential, but from parallel results)
@@ -633,9 +682,12 @@ class MultiSourceService:
             combined_data["confidence"] = "high"
         
         if num_sources == 0:
-            combined_data["summary"] = "No information found in authoritative sources"
+            combined_data["summary"] = NO_INFORMATION_SUMMARY
             combined_data["confidence"] = "none"
-            print(f"  ❌ Not found in any source")
+            if failed_sources:
+                print(f"  ⚠️  Not found, but {', '.join(failed_sources)} could not be queried")
+            else:
+                print(f"  ❌ Not found in any source")
         
         print(f"  📊 Sources consulted: {num_sources}, Confidence: {combined_data['confidence']}")
         
@@ -644,7 +696,9 @@ class MultiSourceService:
     def _get_comprehensive_info_sequential(
         self, 
         entity_name: str, 
-        entity_type: str = "MISC"
+        entity_type: str = "MISC",
+        wikidata: Optional[Dict[str, Any]] = None,
+        wikidata_resolved: bool = False
     ) -> Dict[str, Any]:
         """
         Sequential version - queries APIs one by one (SLOWER but safer)
@@ -659,12 +713,16 @@ class MultiSourceService:
             "description": None,
             "url": None,
             "sources_consulted": [],
+            "failed_sources": [],
             "confidence": "low",
             "retrieved_at": datetime.utcnow().isoformat()
         }
         
+        # Sources whose request failed (not the same as "not found")
+        failed_sources = combined_data["failed_sources"]
+        
         # 1. Try Google Knowledge Graph first (highest quality)
-        kg_data = self.get_knowledge_graph_info(entity_name, entity_type)
+        kg_data = self.get_knowledge_graph_info(entity_name, entity_type, failed_sources)
         if kg_data:
             combined_data["sources_consulted"].append("Google Knowledge Graph")
             combined_data["summary"] = kg_data.get("detailed_description") or kg_data.get("description")
@@ -676,7 +734,7 @@ class MultiSourceService:
             print(f"  ✅ Found in Knowledge Graph (confidence: {kg_data.get('confidence', 0)})")
         
         # 2. Try DBpedia (structured Wikipedia)
-        dbpedia_data = self.get_dbpedia_info(entity_name)
+        dbpedia_data = self.get_dbpedia_info(entity_name, failed_sources)
         if dbpedia_data:
             combined_data["sources_consulted"].append("DBpedia")
             # Use DBpedia abstract if KG didn't provide detailed description
@@ -688,7 +746,7 @@ class MultiSourceService:
             print(f"  ✅ Found in DBpedia")
         
         # 3. Try Wikidata Enhanced
-        wikidata_data = self.get_wikidata_enhanced(entity_name)
+        wikidata_data = wikidata if wikidata_resolved else self.get_wikidata_enhanced(entity_name, failed_sources)
         if wikidata_data:
             combined_data["sources_consulted"].append("Wikidata")
             # Use Wikidata description if nothing else available
@@ -703,7 +761,7 @@ class MultiSourceService:
         
         # 4. For literary works, try OpenLibrary
         if entity_type == "WORK_OF_ART" or any(keyword in entity_name.lower() for keyword in ['book', 'novel', 'play']):
-            ol_data = self.get_openlibrary_info(entity_name)
+            ol_data = self.get_openlibrary_info(entity_name, failed_sources)
             if ol_data:
                 combined_data["sources_consulted"].append("OpenLibrary")
                 combined_data["literary_info"] = ol_data
@@ -722,9 +780,12 @@ class MultiSourceService:
         
         # If no sources found anything
         if num_sources == 0:
-            combined_data["summary"] = "No information found in authoritative sources"
+            combined_data["summary"] = NO_INFORMATION_SUMMARY
             combined_data["confidence"] = "none"
-            print(f"  ❌ Not found in any source")
+            if failed_sources:
+                print(f"  ⚠️  Not found, but {', '.join(failed_sources)} could not be queried")
+            else:
+                print(f"  ❌ Not found in any source")
         
         print(f"  📊 Sources consulted: {num_sources}, Confidence: {combined_data['confidence']}")
         
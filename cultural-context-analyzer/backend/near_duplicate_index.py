@@ -0,0 +1,162 @@
+"""
+Near-duplicate text index (MinHash + LSH)
+
+Finds a previously analyzed text that is nearly identical to a new one, so
+that e.g. an extra trailing word or a fixed typo in a long passage is served
+from the analysis cache instead of triggering a new Gemini call.
+
+Texts are reduced to word 3-gram shingles of their normalized form. Each
+text gets a MinHash signature whose agreement rate with another signature
+estimates the Jaccard similarity of their shingle sets. Signatures are split
+into bands for locality-sensitive hashing: only texts sharing at least one
+band are compared, so a lookup does not scan the whole index.
+"""
+
+import hashlib
+import random
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from text_normalization import normalize_text
+
+# Universal hashing modulo a Mersenne prime: h_i(x) = (a_i * x + b_i) mod P
+MERSENNE_PRIME = (1 << 61) - 1
+
+SHINGLE_SIZE = 3
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    """Hashed word n-grams of the normalized text"""
+    words = normalize_text(text).split()
+    grams = [" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))] if words else []
+    return {
+        int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "little")
+        for gram in grams
+    }
+
+
+class MinHashLSH:
+    """In-memory MinHash LSH index mapping cache keys to text signatures"""
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        bands: int = 16,
+        max_entries: int = 50000,
+        seed: int = 1
+    ):
+        """
+        Args:
+            threshold: Minimum estimated Jaccard similarity for a match
+            num_perm: Signature length (more = more accurate estimates)
+            bands: LSH bands; num_perm / bands rows per band. 16 bands of 8
+                rows make texts above ~0.7 similarity very likely candidates
+            max_entries: Oldest entries are dropped beyond this size
+            seed: Seed for the hash functions (signatures must be comparable across restarts)
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+
+        rng = random.Random(seed)
+        self._hash_params = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+        self._entries: "OrderedDict[str, Tuple[str, Tuple[int, ...]]]" = OrderedDict()
+        self._buckets: Dict[Tuple, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        """MinHash signature of a text, or None for empty text"""
+        hashes = shingles(text)
+        if not hashes:
+            return None
+        return tuple(
+            min((a * h + b) % MERSENNE_PRIME for h in hashes)
+            for a, b in self._hash_params
+        )
+
+    def _band_keys(self, language: str, signature: Tuple[int, ...]) -> List[Tuple]:
+        return [
+            (language, band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def _remove(self, key: str):
+        language, signature = self._entries.pop(key)
+        for band_key in self._band_keys(language, signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def add(self, key: str, text: str, language: str):
+        """
+        Index a text
+
+        Args:
+            key: Cache key of the text (e.g. its text hash)
+            text: Text to index
+            language: Language code - only texts of the same language match
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (language, signature)
+            for band_key in self._band_keys(language, signature):
+                self._buckets.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def query(self, text: str, language: str) -> Optional[Tuple[str, float]]:
+        """
+        Find the most similar indexed text above the threshold
+
+        Args:
+            text: Text to look up
+            language: Language code
+
+        Returns:
+            (key, estimated_similarity) or None if nothing is similar enough
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return None
+
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(language, signature):
+                candidates |= self._buckets.get(band_key, set())
+
+            best: Optional[Tuple[str, float]] = None
+            for key in candidates:
+                other = self._entries[key][1]
+                similarity = sum(x == y for x, y in zip(signature, other)) / self.num_perm
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (key, similarity)
+
+        return best
+
+    def remove(self, key: str):
+        """Drop a text from the index (e.g. when its cache entry is gone)"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
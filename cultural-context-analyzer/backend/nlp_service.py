@@ -3,15 +3,164 @@ NLP and Cultural Context Enrichment Service
 
 This service coordinates spaCy entity extraction, Wikipedia/Wikidata enrichment,
 and caching to provide interactive cultural context highlights.
+
+Only doc.ents is used, so by default the spaCy model is loaded with just the
+components named entity recognition needs; the tagger, parser, attribute
+ruler and lemmatizer are excluded (SPACY_NER_ONLY).
+
+Entities are enriched concurrently on a shared thread pool. A process-wide
+semaphore caps concurrent outbound knowledge-API lookups, and a request-level
+deadline returns entities whose lookup has not finished unenriched.
+
+Frequently used entities are kept in an in-memory LRU in front of the
+Supabase entity cache, pre-warmed on startup from the most used rows.
+
+Cache keys are canonical aliases of the detected text (entity_canonicalization);
+surface forms of the same Wikidata entity share one cached record. Entities no
+knowledge source knows are remembered in a separate, shorter-lived negative
+cache so that repeats skip the lookup.
+
+Complete entity analyses are cached by exact text hash and spaCy model
+version, so a repeated text skips NER and enrichment; past a freshness window
+the cached entities are re-enriched (without re-running NER).
+
+Short texts go through a dictionary fast path first (entity_matcher): names
+already in the entity cache are found by phrase matching, and NER runs only
+on the remaining spans.
 """
 
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 import spacy
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import re
 
 from wikipedia_service import wikipedia_service
-from database import get_cached_entity, save_entity_cache
+from multi_source_service import NO_INFORMATION_SUMMARY, multi_source_service
+from database import (
+    clear_old_negative_entities,
+    get_cached_entities,
+    get_cached_entity_by_wikidata_id,
+    get_cached_entity_names,
+    get_cached_extraction,
+    get_entity_aliases,
+    get_negative_entities,
+    get_top_cached_entities,
+    increment_entity_hits,
+    save_entity_aliases,
+    save_entity_cache,
+    save_entity_cache_bulk,
+    save_extraction_cache,
+    save_negative_entities,
+)
+from entity_canonicalization import alias_key, canonical_entity_name
+from entity_matcher import EntityPhraseMatcher
+from memory_cache import TTLCache
+from metrics import metrics
+
+# spaCy pipeline
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+SPACY_NER_ONLY = os.getenv("SPACY_NER_ONLY", "true").lower() == "true"
+
+# Components that do not feed NER in the en_core_web_sm/md/lg pipelines (their
+# NER has its own embedding layer, so the shared tok2vec can go as well)
+SPACY_NON_NER_COMPONENTS = [
+    component.strip()
+    for component in os.getenv(
+        "SPACY_EXCLUDE_COMPONENTS", "tok2vec,tagger,parser,attribute_ruler,lemmatizer,senter,morphologizer"
+    ).split(",")
+    if component.strip()
+]
+
+# Longer texts are truncated (spaCy's own default is 1,000,000 characters)
+SPACY_MAX_LENGTH = int(os.getenv("SPACY_MAX_LENGTH", "100000"))
+
+# Documents per batch when several texts are processed together
+SPACY_BATCH_SIZE = int(os.getenv("SPACY_BATCH_SIZE", "64"))
+
+# Worker processes for batches larger than one batch (1 = in-process)
+SPACY_N_PROCESS = int(os.getenv("SPACY_N_PROCESS", "1"))
+
+# Entity enrichment: shared worker threads, process-wide cap on concurrent
+# outbound lookups (each one fans out to several knowledge APIs) and the
+# time a request waits for enrichment
+ENRICHMENT_MAX_WORKERS = int(os.getenv("ENRICHMENT_MAX_WORKERS", "32"))
+ENRICHMENT_MAX_CONCURRENCY = int(os.getenv("ENRICHMENT_MAX_CONCURRENCY", "8"))
+ENRICHMENT_DEADLINE_SECONDS = float(os.getenv("ENRICHMENT_DEADLINE_SECONDS", "8"))
+
+# In-memory hot entity cache (in front of the Supabase entity cache)
+ENTITY_MEMORY_CACHE_SIZE = int(os.getenv("ENTITY_MEMORY_CACHE_SIZE", "5000"))
+ENTITY_MEMORY_CACHE_MAX_BYTES = int(os.getenv("ENTITY_MEMORY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+ENTITY_MEMORY_CACHE_TTL_SECONDS = float(os.getenv("ENTITY_MEMORY_CACHE_TTL_SECONDS", "3600"))
+ENTITY_MEMORY_CACHE_PREWARM = int(os.getenv("ENTITY_MEMORY_CACHE_PREWARM", "1000"))
+# How often entity usage counts are written to Supabase
+ENTITY_HIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("ENTITY_HIT_FLUSH_INTERVAL_SECONDS", "60"))
+
+# Negative cache for entities without knowledge-source matches (Supabase TTL,
+# and a smaller in-memory layer)
+ENTITY_NEGATIVE_CACHE_TTL_HOURS = int(os.getenv("ENTITY_NEGATIVE_CACHE_TTL_HOURS", "24"))
+ENTITY_NEGATIVE_CACHE_MEMORY_SIZE = int(os.getenv("ENTITY_NEGATIVE_CACHE_MEMORY_SIZE", "5000"))
+ENTITY_NEGATIVE_CACHE_MEMORY_TTL_SECONDS = float(os.getenv("ENTITY_NEGATIVE_CACHE_MEMORY_TTL_SECONDS", "3600"))
+
+# Entity analyses cached per text and model version; older ones are re-enriched
+ENTITY_EXTRACTION_CACHE = os.getenv("ENTITY_EXTRACTION_CACHE", "true").lower() == "true"
+ENTITY_EXTRACTION_FRESHNESS_HOURS = float(os.getenv("ENTITY_EXTRACTION_FRESHNESS_HOURS", "24"))
+ENTITY_EXTRACTION_CACHE_MEMORY_SIZE = int(os.getenv("ENTITY_EXTRACTION_CACHE_MEMORY_SIZE", "1000"))
+
+# Part of the extraction cache key; bump when entity extraction or filtering changes
+EXTRACTION_CACHE_VERSION = "2"
+
+# Dictionary fast path (phrase matcher over cached entity names) for texts up
+# to ENTITY_MATCHER_MAX_CHARS; longer texts go straight to NER
+ENTITY_MATCHER = os.getenv("ENTITY_MATCHER", "true").lower() == "true"
+ENTITY_MATCHER_MAX_CHARS = int(os.getenv("ENTITY_MATCHER_MAX_CHARS", "1000"))
+ENTITY_MATCHER_MAX_PATTERNS = int(os.getenv("ENTITY_MATCHER_MAX_PATTERNS", "20000"))
+
+
+def extraction_text_hash(text: str) -> str:
+    """Hash of the exact text (entity offsets depend on it, so no normalization)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def estimated_size(value: Any) -> int:
+    """Rough in-memory size of a cached row (its JSON size in bytes)"""
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
+
+def load_spacy_pipeline(model_name: str = SPACY_MODEL, ner_only: bool = SPACY_NER_ONLY):
+    """
+    Load a spaCy pipeline, optionally with only the components NER needs
+    
+    Args:
+        model_name: Installed spaCy model package
+        ner_only: Exclude the components that entity extraction does not use
+    
+    Returns:
+        spacy.Language
+    
+    Raises:
+        OSError: If the model is not installed
+    """
+    if not ner_only:
+        return spacy.load(model_name)
+    
+    try:
+        nlp = spacy.load(model_name, exclude=SPACY_NON_NER_COMPONENTS)
+        # Pipelines whose NER listens to a shared layer fail on first use - check now
+        nlp("Warm-up in Paris.")
+        return nlp
+    except OSError:
+        raise
+    except Exception as e:
+        print(f"⚠️  NER-only pipeline unavailable for {model_name} ({e}), loading the full pipeline")
+        return spacy.load(model_name)
 
 
 class NLPEnrichmentService:
@@ -19,14 +168,27 @@ class NLPEnrichmentService:
     
     def __init__(self):
         """Initialize spaCy and load language model"""
+        self.max_length = SPACY_MAX_LENGTH
+        self.batch_size = SPACY_BATCH_SIZE
+        self.n_process = SPACY_N_PROCESS
+        
         try:
             # Try to load the model
-            self.nlp = spacy.load("en_core_web_sm")
-            print("✅ spaCy model loaded successfully")
+            self.nlp = load_spacy_pipeline()
+            self.nlp.max_length = self.max_length
+            self.nlp.batch_size = self.batch_size
+            # Texts extracted with and without the dictionary fast path are cached apart
+            extraction_mode = f"matcher-{ENTITY_MATCHER_MAX_CHARS}" if ENTITY_MATCHER else "ner"
+            self.model_version = (
+                f"{self.nlp.meta.get('lang')}_{self.nlp.meta.get('name')}-{self.nlp.meta.get('version')}"
+                f"/spacy-{spacy.__version__}/{self.max_length}/{extraction_mode}/v{EXTRACTION_CACHE_VERSION}"
+            )
+            print(f"✅ spaCy model loaded successfully (pipeline: {', '.join(self.nlp.pipe_names)})")
         except OSError:
-            print("⚠️  spaCy model not found. Installing en_core_web_sm...")
-            print("ℹ️  Run: python -m spacy download en_core_web_sm")
+            print(f"⚠️  spaCy model not found. Installing {SPACY_MODEL}...")
+            print(f"ℹ️  Run: python -m spacy download {SPACY_MODEL}")
             self.nlp = None
+            self.model_version = None
         
         # Define culturally relevant entity types
         self.cultural_entity_types = {
@@ -49,6 +211,101 @@ class NLPEnrichmentService:
             "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", 
             "for", "of", "with", "by", "from", "up", "about", "into"
         }
+        
+        # Shared by all requests. Cache lookups run freely; outbound lookups
+        # wait for the semaphore
+        self.enrichment_executor = ThreadPoolExecutor(
+            max_workers=ENRICHMENT_MAX_WORKERS,
+            thread_name_prefix="entity-enrichment"
+        )
+        self.outbound_limiter = threading.BoundedSemaphore(ENRICHMENT_MAX_CONCURRENCY)
+        self.enrichment_deadline = ENRICHMENT_DEADLINE_SECONDS
+        
+        # Hot entities served without a Supabase round trip
+        self.memory_cache = TTLCache(
+            maxsize=ENTITY_MEMORY_CACHE_SIZE,
+            ttl_seconds=ENTITY_MEMORY_CACHE_TTL_SECONDS,
+            name="entity_cache.memory",
+            max_bytes=ENTITY_MEMORY_CACHE_MAX_BYTES,
+            sizeof=estimated_size
+        )
+        self.hit_flush_interval = ENTITY_HIT_FLUSH_INTERVAL_SECONDS
+        # Entity uses not yet written to entity_cache.hit_count
+        self._pending_hits: "Counter[Tuple[str, str]]" = Counter()
+        self._hits_lock = threading.Lock()
+        
+        # Aliases that no knowledge source knows
+        self.negative_cache = TTLCache(
+            maxsize=ENTITY_NEGATIVE_CACHE_MEMORY_SIZE,
+            ttl_seconds=ENTITY_NEGATIVE_CACHE_MEMORY_TTL_SECONDS,
+            name="entity_cache.negative"
+        )
+        self.negative_ttl_hours = ENTITY_NEGATIVE_CACHE_TTL_HOURS
+        
+        # Complete entity analyses by text hash (in front of entity_extraction_cache)
+        self.extraction_cache_enabled = ENTITY_EXTRACTION_CACHE
+        self.extraction_freshness_hours = ENTITY_EXTRACTION_FRESHNESS_HOURS
+        self.extraction_cache = TTLCache(
+            maxsize=ENTITY_EXTRACTION_CACHE_MEMORY_SIZE,
+            ttl_seconds=ENTITY_EXTRACTION_FRESHNESS_HOURS * 3600,
+            name="nlp.extraction_cache.memory"
+        )
+        
+        # Known entity names, filled on startup and as entities are cached
+        self.matcher_max_chars = ENTITY_MATCHER_MAX_CHARS
+        self.entity_matcher = (
+            EntityPhraseMatcher(self.nlp, max_patterns=ENTITY_MATCHER_MAX_PATTERNS)
+            if self.nlp is not None and ENTITY_MATCHER else None
+        )
+    
+    def _truncate(self, text: str) -> str:
+        """Cut text to max_length (entity offsets stay valid for the prefix)"""
+        if len(text) > self.max_length:
+            print(f"✂️  Text truncated to {self.max_length} characters for entity extraction")
+            return text[:self.max_length]
+        return text
+    
+    def _entities_from_doc(self, doc) -> List[Dict[str, Any]]:
+        """Filter and deduplicate the culturally relevant entities of a processed doc"""
+        return self._select_entities((ent.text, ent.label_, ent.start_char, ent.end_char) for ent in doc.ents)
+    
+    def _select_entities(self, candidates) -> List[Dict[str, Any]]:
+        """Filter and deduplicate culturally relevant (text, label, start_char, end_char) candidates"""
+        entities = []
+        seen_entities = set()  # Deduplicate
+        
+        for text, label, start_char, end_char in candidates:
+            # Filter by relevant entity types
+            if label not in self.cultural_entity_types:
+                continue
+            
+            # Clean entity text
+            entity_text = text.strip()
+            
+            # Skip short or common words
+            if len(entity_text) < self.min_entity_length:
+                continue
+            
+            if entity_text.lower() in self.exclude_words:
+                continue
+            
+            # Deduplicate (case-insensitive)
+            entity_key = (entity_text.lower(), label)
+            if entity_key in seen_entities:
+                continue
+            
+            seen_entities.add(entity_key)
+            
+            # Extract entity with position information
+            entities.append({
+                "text": entity_text,
+                "type": label,
+                "start": start_char,
+                "end": end_char,
+                "confidence": 1.0  # spaCy doesn't provide scores for NER
+            })
+        
+        return entities
     
     def extract_entities(self, text: str) -> List[Dict[str, Any]]:
         """
@@ -60,54 +317,80 @@ class NLPEnrichmentService:
         Returns:
             List of detected entities with metadata
         """
+        entities = self._extract(text)
+        return entities if entities is not None else []
+    
+    def _uses_matcher(self, text: str) -> bool:
+        """Whether the dictionary fast path extracts the entities of a text"""
+        return self.entity_matcher is not None and len(self.entity_matcher) > 0 and len(text) <= self.matcher_max_chars
+    
+    def _extract(self, text: str) -> Optional[List[Dict[str, Any]]]:
+        """extract_entities, but None if extraction failed (so it is not cached)"""
         if not self.nlp:
             print("❌ spaCy model not available")
-            return []
+            return None
         
         try:
-            # Process text with spaCy
-            doc = self.nlp(text)
-            
-            entities = []
-            seen_entities = set()  # Deduplicate
-            
-            for ent in doc.ents:
-                # Filter by relevant entity types
-                if ent.label_ not in self.cultural_entity_types:
-                    continue
-                
-                # Clean entity text
-                entity_text = ent.text.strip()
-                
-                # Skip short or common words
-                if len(entity_text) < self.min_entity_length:
-                    continue
-                
-                if entity_text.lower() in self.exclude_words:
-                    continue
-                
-                # Deduplicate (case-insensitive)
-                entity_key = (entity_text.lower(), ent.label_)
-                if entity_key in seen_entities:
-                    continue
-                
-                seen_entities.add(entity_key)
-                
-                # Extract entity with position information
-                entities.append({
-                    "text": entity_text,
-                    "type": ent.label_,
-                    "start": ent.start_char,
-                    "end": ent.end_char,
-                    "confidence": 1.0  # spaCy doesn't provide scores for NER
-                })
+            text = self._truncate(text)
+            if self._uses_matcher(text):
+                # Known names by dictionary, NER only for the rest
+                entities = self._select_entities(self.entity_matcher.extract(text))
+            else:
+                # Process text with spaCy
+                entities = self._entities_from_doc(self.nlp(text))
             
             print(f"📍 Detected {len(entities)} cultural entities")
             return entities
             
         except Exception as e:
             print(f"❌ Entity extraction error: {e}")
-            return []
+            return None
+    
+    def extract_entities_batch(
+        self,
+        texts: List[str],
+        batch_size: Optional[int] = None,
+        n_process: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Extract entities from several texts at once with nlp.pipe
+        
+        Batching amortizes spaCy's per-call overhead for multi-text workloads
+        (history re-highlighting, batch analysis, multi-page OCR). Results use
+        the same filtering and deduplication as extract_entities.
+        
+        Args:
+            texts: Input texts
+            batch_size: Documents per batch (default: SPACY_BATCH_SIZE)
+            n_process: Worker processes (default: SPACY_N_PROCESS); only used when
+                there is more than one batch, since starting workers is expensive
+        
+        Returns:
+            One entity list per input text, in input order
+        """
+        if not self.nlp:
+            print("❌ spaCy model not available")
+            return [[] for _ in texts]
+        
+        batch_size = batch_size or self.batch_size
+        n_process = n_process or self.n_process
+        if len(texts) <= batch_size:
+            n_process = 1
+        
+        try:
+            docs = self.nlp.pipe(
+                (self._truncate(text) for text in texts),
+                batch_size=batch_size,
+                n_process=n_process
+            )
+            results = [self._entities_from_doc(doc) for doc in docs]
+            
+            print(f"📍 Detected {sum(len(entities) for entities in results)} cultural entities in {len(texts)} texts")
+            return results
+            
+        except Exception as e:
+            print(f"❌ Batch entity extraction error: {e}")
+            return [[] for _ in texts]
     
     def enrich_entity(
         self, 
@@ -126,99 +409,523 @@ class NLPEnrichmentService:
         Returns:
             Enriched entity data
         """
+        entity = {"text": entity_text, "type": entity_type}
+        key = alias_key(entity_text, entity_type)
+        
         # Check cache first
         if use_cache:
-            cached = get_cached_entity(entity_text, entity_type)
+            if self.negative_cache.get(key):
+                metrics.increment("nlp.entity_negative_cache_hits")
+                return self._unenriched(entity)
+            cached = self._get_cached_entities([(entity_text, entity_type)]).get(key)
             if cached:
                 print(f"💾 Using cached data for: {entity_text}")
                 return cached
+            if self._load_negative_entities([key]):
+                metrics.increment("nlp.entity_negative_cache_hits")
+                return self._unenriched(entity)
         
-        # Fetch from Wikipedia
-        enrichment = wikipedia_service.enrich_entity(entity_text, entity_type)
+        result = self._resolve_and_fetch(entity_text, entity_type, use_cache)
+        if not self._has_information(result["enrichment"]):
+            if self._is_confirmed_miss(result["enrichment"]):
+                self._remember_negative([key])
+            return self._unenriched(entity)
         
         # Save to cache if successful
-        if enrichment.get("summary"):
-            cache_data = {
-                "entity_name": entity_text,
-                "entity_type": entity_type,
-                "summary": enrichment.get("summary"),
-                "url": enrichment.get("url"),
-                "categories": enrichment.get("categories", []),
-                "cultural_significance": enrichment.get("cultural_significance", "general"),
-                "wikidata": enrichment.get("wikidata"),
-                "source": enrichment.get("source", "Wikipedia"),
-                "created_at": datetime.utcnow().isoformat()
-            }
+        cache_data, aliases = self._cache_writes(entity, result)
+        if cache_data:
             save_entity_cache(cache_data)
             print(f"✅ Cached enrichment for: {entity_text}")
+        save_entity_aliases(aliases)
         
-        return enrichment
+        return result["enrichment"]
+    
+    def _fetch_enrichment(
+        self,
+        entity_text: str,
+        entity_type: str,
+        wikidata: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Look an entity up in the knowledge sources (bounded across all requests)
+        
+        `wikidata` is the result of the Wikidata lookup already made by
+        _resolve_and_fetch; None means Wikidata has no match and is not queried again.
+        """
+        with self.outbound_limiter:
+            return wikipedia_service.enrich_entity(entity_text, entity_type, wikidata=wikidata, wikidata_resolved=True)
+    
+    def _resolve_and_fetch(self, entity_text: str, entity_type: str, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Enrich an entity that has no cached record under its alias
+        
+        The Wikidata QID is resolved first; if another surface form of the same
+        QID is cached, its record is reused without the knowledge-source
+        fan-out. Otherwise the fan-out runs (reusing the Wikidata result).
+        
+        Args:
+            entity_text: Entity name
+            entity_type: Entity type
+            use_cache: Whether a cached record with the same QID may be reused
+        
+        Returns:
+            Dictionary with the enrichment, the resolved Wikidata info (or None)
+            and whether the enrichment is an existing cached record
+        """
+        wikidata_errors = []
+        with self.outbound_limiter:
+            wikidata = multi_source_service.get_wikidata_enhanced(entity_text, wikidata_errors)
+        
+        wikidata_id = wikidata.get("wikidata_id") if wikidata else None
+        if wikidata_id and use_cache:
+            cached = get_cached_entity_by_wikidata_id(wikidata_id, entity_type)
+            if cached:
+                print(f"💾 Using cached data of {wikidata_id} for: {entity_text}")
+                metrics.increment("nlp.entity_qid_cache_hits")
+                self._count_hits([(cached["entity_name"], cached["entity_type"])])
+                return {"enrichment": cached, "wikidata": wikidata, "cached": True}
+        
+        enrichment = self._fetch_enrichment(entity_text, entity_type, wikidata)
+        enrichment["failed_sources"] = wikidata_errors + enrichment.get("failed_sources", [])
+        return {
+            "enrichment": enrichment,
+            "wikidata": wikidata,
+            "cached": False
+        }
+    
+    @staticmethod
+    def _has_information(enrichment: Dict[str, Any]) -> bool:
+        """Whether an enrichment found anything (the no-match placeholder does not count)"""
+        summary = enrichment.get("summary")
+        return bool(summary) and summary != NO_INFORMATION_SUMMARY
+    
+    @staticmethod
+    def _is_confirmed_miss(enrichment: Dict[str, Any]) -> bool:
+        """
+        Whether an enrichment without information may be negative-cached
+        
+        Only if every source answered "not found": a failed request (timeout,
+        rate limit, network error) says nothing about the entity.
+        """
+        if enrichment.get("failed_sources"):
+            print(f"⚠️  Not negative-caching, lookup failed for: {', '.join(enrichment['failed_sources'])}")
+            metrics.increment("nlp.entity_lookup_failures")
+            return False
+        return True
+    
+    @classmethod
+    def _cache_record(
+        cls,
+        entity_text: str,
+        entity_type: str,
+        enrichment: Dict[str, Any],
+        wikidata: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        entity_cache row for a successful enrichment, or None if there is nothing to cache
+        
+        Entities resolved on Wikidata are stored under their Wikidata label, so
+        all surface forms of the entity share one record.
+        """
+        if not cls._has_information(enrichment):
+            return None
+        wikidata = wikidata or {}
+        return {
+            "entity_name": wikidata.get("label") or entity_text,
+            "entity_type": entity_type,
+            "summary": enrichment.get("summary"),
+            "url": enrichment.get("url"),
+            "categories": enrichment.get("categories", []),
+            "cultural_significance": enrichment.get("cultural_significance", "general"),
+            "wikidata": enrichment.get("wikidata"),
+            "wikidata_id": enrichment.get("wikidata_id") or wikidata.get("wikidata_id"),
+            "source": enrichment.get("source", "Wikipedia"),
+            "created_at": datetime.utcnow().isoformat()
+        }
+    
+    def _cache_writes(
+        self,
+        entity: Dict[str, Any],
+        result: Dict[str, Any]
+    ) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Cache writes for a resolved entity (see _resolve_and_fetch)
+        
+        Keeps the record in memory under the entity's alias and returns the
+        new entity_cache record (None if there is none) and the entity_aliases
+        rows pointing the surface form and the record's own name at it.
+        """
+        if result["cached"]:
+            cache_data, record = None, result["enrichment"]
+        else:
+            cache_data = record = self._cache_record(entity["text"], entity["type"], result["enrichment"], result["wikidata"])
+            if record is None:
+                return None, []
+        
+        self.memory_cache.set(alias_key(entity["text"], entity["type"]), record)
+        if self.entity_matcher is not None:
+            self.entity_matcher.add((name, record["entity_type"]) for name in {entity["text"], record["entity_name"]})
+        created_at = datetime.utcnow().isoformat()
+        aliases = [
+            {
+                "alias": canonical_entity_name(surface),
+                "entity_type": record["entity_type"],
+                "entity_name": record["entity_name"],
+                "wikidata_id": record.get("wikidata_id"),
+                "created_at": created_at
+            }
+            for surface in {entity["text"], record["entity_name"]}
+        ]
+        return cache_data, aliases
+    
+    def _save_late_enrichment(self, entity: Dict[str, Any], future: Future):
+        """Cache a lookup that finished after its request's deadline"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        if not self._has_information(future.result()["enrichment"]):
+            if self._is_confirmed_miss(future.result()["enrichment"]):
+                self._remember_negative([alias_key(entity["text"], entity["type"])])
+            return
+        cache_data, aliases = self._cache_writes(entity, future.result())
+        if cache_data:
+            save_entity_cache(cache_data)
+            print(f"✅ Cached late enrichment for: {entity['text']}")
+        save_entity_aliases(aliases)
+    
+    def _get_cached_entities(self, entities: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        Cached records of (entity text, entity type) pairs, keyed by alias_key
+        
+        Memory first. The rest are resolved through entity_aliases and read
+        from entity_cache in one query, which also matches records stored
+        under the exact surface text.
+        """
+        keys = {alias_key(text, entity_type): (text, entity_type) for text, entity_type in entities}
+        cached = {}
+        for key in keys:
+            row = self.memory_cache.get(key)
+            if row is not None:
+                cached[key] = row
+        
+        missing = [key for key in keys if key not in cached]
+        if missing:
+            aliases = get_entity_aliases(missing)
+            targets = {
+                key: (aliases[key]["entity_name"], key[1]) if key in aliases else keys[key]
+                for key in missing
+            }
+            rows = get_cached_entities(list(set(targets.values()) | {keys[key] for key in missing}))
+            for key in missing:
+                row = rows.get(targets[key]) or rows.get(keys[key])
+                if row:
+                    self.memory_cache.set(key, row)
+                    cached[key] = row
+        
+        self._count_hits([(row["entity_name"], row["entity_type"]) for row in cached.values()])
+        return cached
+    
+    def _load_negative_entities(self, keys: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Aliases with a negative entry in Supabase (one query), kept in memory as well"""
+        if not keys:
+            return []
+        negative = get_negative_entities(keys, self.negative_ttl_hours)
+        for key in negative:
+            self.negative_cache.set(key, True)
+        return negative
+    
+    def _remember_negative(self, keys: List[Tuple[str, str]]):
+        """Negative-cache aliases that no knowledge source knows"""
+        if not keys:
+            return
+        for key in keys:
+            self.negative_cache.set(key, True)
+        save_negative_entities(keys)
+        print(f"🚫 No knowledge-source match for {len(keys)} entities, negative-cached for {self.negative_ttl_hours}h")
+    
+    def clear_expired_negative_entries(self):
+        """Delete negative cache entries past their TTL from Supabase"""
+        clear_old_negative_entities(self.negative_ttl_hours)
+    
+    def _count_hits(self, keys: List[Tuple[str, str]]):
+        """Remember entity uses for the next hit count flush"""
+        with self._hits_lock:
+            self._pending_hits.update(keys)
+    
+    def flush_hit_counts(self) -> int:
+        """
+        Write pending entity uses to entity_cache.hit_count in one call
+        
+        Returns:
+            Number of entities whose count was updated
+        """
+        with self._hits_lock:
+            hits, self._pending_hits = self._pending_hits, Counter()
+        
+        if hits and not increment_entity_hits(dict(hits)):
+            return 0
+        return len(hits)
+    
+    async def flush_hit_counts_periodically(self):
+        """Flush entity usage counts every hit_flush_interval seconds, forever (started on startup)"""
+        while True:
+            await asyncio.sleep(self.hit_flush_interval)
+            self.flush_hit_counts()
+    
+    def prewarm_entity_matcher(self):
+        """Load the most used cached entity names into the phrase matcher (called on startup)"""
+        if self.entity_matcher is None:
+            return
+        
+        self.entity_matcher.add(
+            (row["entity_name"], row["entity_type"])
+            for row in get_cached_entity_names(self.entity_matcher.max_patterns)
+        )
+        print(f"✅ Entity matcher loaded with {len(self.entity_matcher)} names")
+    
+    def prewarm_memory_cache(self, limit: int = ENTITY_MEMORY_CACHE_PREWARM):
+        """Load the most used cached entities into memory (called on startup)"""
+        if limit <= 0:
+            return
+        
+        rows = get_top_cached_entities(limit)
+        # Least used first, so the most used end up most recently used
+        for row in reversed(rows):
+            self.memory_cache.set(alias_key(row["entity_name"], row["entity_type"]), row)
+        print(f"✅ Entity memory cache loaded with {len(self.memory_cache)} entities")
+    
+    @staticmethod
+    def _unenriched(entity: Dict[str, Any]) -> Dict[str, Any]:
+        """Entity without enrichment data"""
+        return {
+            **entity,
+            "summary": None,
+            "url": None,
+            "cultural_significance": "unknown",
+            "source": None
+        }
+    
+    def _get_cached_extraction(self, text_hash: str, max_enrich: int) -> Optional[Dict[str, Any]]:
+        """Cached entity analysis of a text for the current model: memory, then Supabase"""
+        cached = self.extraction_cache.get((text_hash, max_enrich))
+        if cached is None:
+            cached = get_cached_extraction(text_hash, self.model_version, max_enrich)
+            if cached:
+                self.extraction_cache.set((text_hash, max_enrich), cached)
+        return cached
+    
+    def _is_fresh(self, cached: Dict[str, Any]) -> bool:
+        """Whether a cached entity analysis was enriched within the freshness window"""
+        try:
+            enriched_at = datetime.fromisoformat(str(cached.get("enriched_at")).replace("Z", "+00:00"))
+        except ValueError:
+            return False
+        age_hours = (datetime.utcnow() - enriched_at.replace(tzinfo=None)).total_seconds() / 3600
+        return age_hours < self.extraction_freshness_hours
     
     def analyze_text_with_entities(
         self, 
         text: str,
-        enrich_all: bool = True
+        enrich_all: bool = True,
+        deadline_seconds: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         Complete pipeline: extract entities and enrich with cultural context
         
+        Results are cached by exact text hash and spaCy model version. A
+        repeated text is served without NER or enrichment lookups while its
+        enrichment is fresh (ENTITY_EXTRACTION_FRESHNESS_HOURS); after that it
+        is enriched again, from the cached entities if NER alone extracted them
+        (the dictionary fast path is re-run, as its dictionary keeps growing).
+        Results with entities left
+        unenriched by the deadline or by a failed lookup are not cached (their
+        entities are).
+        
         Args:
             text: Input text to analyze
             enrich_all: Whether to enrich all entities (can be slow)
+            deadline_seconds: Time to wait for enrichment (default: ENRICHMENT_DEADLINE_SECONDS)
         
         Returns:
-            Dictionary with detected entities and enrichment data
+            Dictionary with detected entities (in order of appearance) and enrichment data
+        """
+        max_enrich = 10 if enrich_all else 5
+        use_cache = self.extraction_cache_enabled and self.model_version is not None
+        text_hash = extraction_text_hash(text)
+        
+        cached = self._get_cached_extraction(text_hash, max_enrich) if use_cache else None
+        if cached and cached.get("result") and self._is_fresh(cached):
+            metrics.increment("nlp.extraction_cache.hits")
+            print(f"💾 Using cached entity analysis ({cached['result']['total_detected']} entities)")
+            return cached["result"]
+        
+        if cached:
+            metrics.increment("nlp.extraction_cache.refreshes")
+        elif use_cache:
+            metrics.increment("nlp.extraction_cache.misses")
+        
+        if cached and not self._uses_matcher(text):
+            # Plain NER output is deterministic for the model - only enrichment is redone
+            entities = cached["entities"]
+        else:
+            entities = self._extract(text)
+            if entities is None:
+                use_cache = False
+                entities = []
+        
+        result, complete = self._enrich_entities(entities, max_enrich, deadline_seconds)
+        
+        if use_cache:
+            row = {
+                "entities": entities,
+                "result": result if complete else None,
+                "enriched_at": datetime.utcnow().isoformat()
+            }
+            self.extraction_cache.set((text_hash, max_enrich), row)
+            save_extraction_cache(text_hash, self.model_version, max_enrich, row)
+        
+        return result
+    
+    def _enrich_entities(
+        self,
+        entities: List[Dict[str, Any]],
+        max_enrich: int,
+        deadline_seconds: Optional[float] = None
+    ) -> Tuple[Dict[str, Any], bool]:
         """
-        # Extract entities
-        entities = self.extract_entities(text)
+        Enrich the first max_enrich extracted entities
         
+        The entity cache (memory first, then Supabase for the rest) is read
+        for all selected entities at once, by canonical alias. The misses are
+        resolved concurrently (once per alias), and the new enrichments and
+        aliases are written back in one upsert each. Lookups still running at
+        the deadline are returned unenriched; they finish in the background
+        and populate the entity cache for later requests.
+        
+        Args:
+            entities: Extracted entities
+            max_enrich: Number of entities to enrich (the rest are returned unenriched)
+            deadline_seconds: Time to wait for enrichment (default: ENRICHMENT_DEADLINE_SECONDS)
+        
+        Returns:
+            Entity analysis, and whether every lookup finished in time without
+            failing (a lookup that raised or got no answer from a source
+            counts as failed)
+        """
         if not entities:
             return {
                 "detected_entities": [],
                 "enriched_count": 0,
                 "total_detected": 0
-            }
+            }, True
         
         # Enrich entities (limit to avoid long processing times)
-        max_enrich = 10 if enrich_all else 5
-        enriched_entities = []
+        selected = entities[:max_enrich]
+        deadline = time.monotonic() + (deadline_seconds if deadline_seconds is not None else self.enrichment_deadline)
         
-        for i, entity in enumerate(entities[:max_enrich]):
-            enrichment = self.enrich_entity(
-                entity["text"], 
-                entity["type"],
-                use_cache=True
-            )
+        # Known unknowns in memory skip the Supabase lookups entirely
+        keys = [alias_key(entity["text"], entity["type"]) for entity in selected]
+        negative = {key for key in keys if self.negative_cache.get(key)}
+        cached = self._get_cached_entities([
+            (entity["text"], entity["type"]) for entity, key in zip(selected, keys) if key not in negative
+        ])
+        if cached:
+            print(f"💾 Using cached data for {len(cached)} of {len(selected)} entities")
+        negative.update(self._load_negative_entities([
+            key for key in dict.fromkeys(keys) if key not in cached and key not in negative
+        ]))
+        if negative:
+            metrics.increment("nlp.entity_negative_cache_hits", len(negative))
+        
+        futures = {}
+        for entity in selected:
+            key = alias_key(entity["text"], entity["type"])
+            if key not in cached and key not in negative and key not in futures:
+                futures[key] = self.enrichment_executor.submit(self._resolve_and_fetch, entity["text"], entity["type"])
+        if futures:
+            wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+        
+        enriched_entities = []
+        new_cache_records = []
+        new_aliases = []
+        new_negative = []
+        written = set()
+        enriched_count = 0
+        timed_out = 0
+        failed = 0
+        for entity in selected:
+            key = alias_key(entity["text"], entity["type"])
+            enrichment = cached.get(key)
+            if key in negative:
+                enriched_entities.append(self._unenriched(entity))
+                continue
+            if enrichment is None:
+                future = futures[key]
+                if not future.done():
+                    if key not in written:
+                        written.add(key)
+                        future.add_done_callback(lambda done, entity=entity: self._save_late_enrichment(entity, done))
+                    enriched_entities.append(self._unenriched(entity))
+                    timed_out += 1
+                    continue
+                
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"⚠️  Enrichment failed for '{entity['text']}': {e}")
+                    enriched_entities.append(self._unenriched(entity))
+                    failed += 1
+                    continue
+                
+                enrichment = result["enrichment"]
+                if not self._has_information(enrichment):
+                    if key not in written:
+                        written.add(key)
+                        if self._is_confirmed_miss(enrichment):
+                            new_negative.append(key)
+                        else:
+                            # A source failed - the entity may well be known
+                            failed += 1
+                    enriched_entities.append(self._unenriched(entity))
+                    continue
+                if key not in written:
+                    written.add(key)
+                    cache_data, aliases = self._cache_writes(entity, result)
+                    if cache_data:
+                        new_cache_records.append(cache_data)
+                    new_aliases.extend(aliases)
             
             # Combine extraction and enrichment
-            enriched = {
+            enriched_entities.append({
                 **entity,
                 "summary": enrichment.get("summary"),
                 "url": enrichment.get("url"),
                 "cultural_significance": enrichment.get("cultural_significance"),
                 "source": enrichment.get("source")
-            }
-            
-            enriched_entities.append(enriched)
+            })
+            enriched_count += 1
+        
+        if new_cache_records:
+            save_entity_cache_bulk(new_cache_records)
+            print(f"✅ Cached enrichment for {len(new_cache_records)} entities")
+        save_entity_aliases(new_aliases)
+        self._remember_negative(new_negative)
+        
+        if timed_out:
+            print(f"⏱️  Enrichment deadline reached, {timed_out} entities returned unenriched")
+            metrics.increment("nlp.enrichment_deadline_misses", timed_out)
+        if failed:
+            print(f"⚠️  {failed} entity lookups failed, returned unenriched")
         
         # Add remaining entities without full enrichment
-        if len(entities) > max_enrich:
-            for entity in entities[max_enrich:]:
-                enriched_entities.append({
-                    **entity,
-                    "summary": None,
-                    "url": None,
-                    "cultural_significance": "unknown",
-                    "source": None
-                })
-        
-        print(f"✅ Enriched {min(len(entities), max_enrich)} of {len(entities)} entities")
+        enriched_entities.extend(self._unenriched(entity) for entity in entities[max_enrich:])
+        
+        print(f"✅ Enriched {enriched_count} of {len(entities)} entities")
         
         return {
             "detected_entities": enriched_entities,
-            "enriched_count": min(len(entities), max_enrich),
+            "enriched_count": enriched_count,
             "total_detected": len(entities)
-        }
+        }, timed_out == 0 and failed == 0
     
     def get_entity_highlights(self, text: str) -> List[Dict[str, Any]]:
         """
@@ -0,0 +1,289 @@
+"""
+OCR Orchestration
+
+Caches Gemini Vision text extraction for the image endpoints:
+- In-memory LRU of recent results, keyed by SHA-256 of the uploaded bytes
+- Supabase persistent OCR cache (30-day TTL)
+- Perceptual hash (1024-bit dHash) so that a re-encoded, resized or re-uploaded
+  copy of the same page also hits: near matches within a small Hamming
+  distance are found in memory first, then in Supabase (where the distance is
+  computed by a Postgres function)
+- Gemini Vision API on a miss
+
+Only successful extractions are cached. Combined with the analysis cache, an
+image that has been seen before is analyzed without any model calls.
+
+Multi-page documents (several images or a multi-frame TIFF) are OCR'd page by
+page, concurrently under the Gemini service's concurrency limit, with each
+page cached on its own.
+
+Hashing and the Supabase cache calls are blocking; the async entry points run
+them in worker threads so they do not stall the event loop (or serialize the
+pages of a document).
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from database import get_cached_ocr, get_cached_ocr_by_phash, save_ocr_cache
+from gemini_service import gemini_service
+from image_preprocessing import split_image_frames
+from memory_cache import TTLCache
+from metrics import metrics
+
+# dHash grid: (HASH_SIZE + 1) x HASH_SIZE pixels -> HASH_SIZE^2 bits. Text pages
+# look alike at coarse resolution (a 64-bit hash cannot tell two book pages
+# apart), so a fine grid is used
+HASH_SIZE = 32
+
+OCR_RESULT_FIELDS = ("text", "character_count", "word_count", "mime_type")
+
+
+def image_content_hash(image_data: bytes) -> str:
+    """SHA-256 of the raw image bytes"""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def perceptual_hash(image_data: bytes) -> Optional[int]:
+    """
+    Compute a 1024-bit difference hash (dHash) of an image
+
+    Robust to re-encoding, resizing and small brightness changes: copies of
+    the same page differ in a few percent of the bits, different pages of
+    text in well over 10%.
+
+    Args:
+        image_data: Image bytes
+
+    Returns:
+        Hash as an integer, or None if the image cannot be decoded
+    """
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        # JPEG can decode at reduced scale, which is much faster for large photos
+        image.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = ImageOps.exif_transpose(image).convert("L")
+        image = image.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    except Exception as e:
+        print(f"⚠️ Could not compute perceptual hash: {e}")
+        return None
+
+    pixels = image.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def _phash_hex(phash: int) -> str:
+    return f"{phash:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+
+class OCRService:
+    def __init__(self):
+        self.memory_cache = TTLCache(
+            maxsize=int(os.getenv("OCR_CACHE_MEMORY_SIZE", "500")),
+            ttl_seconds=float(os.getenv("OCR_CACHE_MEMORY_TTL_SECONDS", "3600")),
+            name="ocr_cache.memory"
+        )
+        self.persistent_ttl_days = int(os.getenv("OCR_CACHE_TTL_DAYS", "30"))
+        self.perceptual_enabled = os.getenv("OCR_CACHE_PERCEPTUAL", "true").lower() == "true"
+        # Maximum differing bits (out of 1024) for two images to count as the same page
+        self.perceptual_max_distance = int(os.getenv("OCR_CACHE_PERCEPTUAL_MAX_DISTANCE", "64"))
+        
+        # Multi-page documents
+        self.max_pages = int(os.getenv("OCR_MAX_PAGES", "30"))
+
+        # perceptual hash -> content hash of entries in the memory cache
+        self._perceptual_index: "OrderedDict[int, str]" = OrderedDict()
+        self._index_lock = threading.Lock()
+
+    def _remember(self, content_hash: str, phash: Optional[int], result: Dict[str, Any]):
+        """Store a result in the memory tier and the perceptual index"""
+        self.memory_cache.set(content_hash, result)
+        if phash is None:
+            return
+        with self._index_lock:
+            self._perceptual_index[phash] = content_hash
+            self._perceptual_index.move_to_end(phash)
+            while len(self._perceptual_index) > self.memory_cache.maxsize:
+                self._perceptual_index.popitem(last=False)
+
+    def _find_similar(self, phash: int) -> Optional[Dict[str, Any]]:
+        """Find a memory-cached result for a perceptually similar image"""
+        with self._index_lock:
+            candidates = [
+                (bin(phash ^ other).count("1"), content_hash)
+                for other, content_hash in self._perceptual_index.items()
+            ]
+
+        for distance, content_hash in sorted(candidates):
+            if distance > self.perceptual_max_distance:
+                break
+            result = self.memory_cache.get(content_hash)
+            if result is not None:
+                return result
+        return None
+
+    def get_cached(self, image_data: bytes) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached OCR result for an image
+
+        Args:
+            image_data: Uploaded image bytes
+
+        Returns:
+            OCR result dict (same shape as GeminiService.extract_text_from_image)
+            or None on a miss
+        """
+        return self._lookup(image_content_hash(image_data), image_data)[0]
+
+    def _lookup(self, content_hash: str, image_data: bytes):
+        """Check all cache tiers; returns (result, perceptual hash)"""
+        result = self.memory_cache.get(content_hash)
+        if result is not None:
+            metrics.increment("ocr_cache.hits")
+            return result, None
+
+        cached = get_cached_ocr(content_hash, days=self.persistent_ttl_days)
+        phash = None
+        if cached is None and self.perceptual_enabled:
+            phash = perceptual_hash(image_data)
+            if phash is not None:
+                result = self._find_similar(phash)
+                if result is not None:
+                    print("✅ OCR cache hit (similar image)")
+                    metrics.increment("ocr_cache.hits")
+                    metrics.increment("ocr_cache.perceptual_hits")
+                    self.memory_cache.set(content_hash, result)
+                    return result, phash
+                cached = get_cached_ocr_by_phash(
+                    _phash_hex(phash), self.perceptual_max_distance, days=self.persistent_ttl_days
+                )
+                if cached is not None:
+                    metrics.increment("ocr_cache.perceptual_hits")
+
+        if cached is not None:
+            print("✅ OCR cache hit")
+            metrics.increment("ocr_cache.hits")
+            result = {"success": True, **{field: cached.get(field) for field in OCR_RESULT_FIELDS}}
+            self._remember(content_hash, phash, result)
+            return result, phash
+
+        metrics.increment("ocr_cache.misses")
+        return None, phash
+
+    async def extract_text(self, image_data: bytes, mime_type: str = "image/jpeg") -> Dict[str, Any]:
+        """
+        Extract text from an image, using the OCR caches before Gemini Vision
+
+        Args:
+            image_data: Uploaded image bytes
+            mime_type: MIME type of the upload
+
+        Returns:
+            OCR result dict with success, text, counts and mime_type (or error)
+        """
+        content_hash = await asyncio.to_thread(image_content_hash, image_data)
+        result, phash = await asyncio.to_thread(self._lookup, content_hash, image_data)
+        if result is not None:
+            return result
+
+        result = await gemini_service.extract_text_from_image(image_data, mime_type=mime_type)
+        if result.get("success"):
+            await asyncio.to_thread(self.save, image_data, result, phash)
+        return result
+
+    def save(self, image_data: bytes, result: Dict[str, Any], phash: Optional[int] = None):
+        """
+        Store a successful OCR result in both cache tiers
+
+        Args:
+            image_data: Uploaded image bytes
+            result: OCR result dict (e.g. from a single-call image analysis)
+            phash: Perceptual hash, if already computed
+        """
+        content_hash = image_content_hash(image_data)
+        if phash is None and self.perceptual_enabled:
+            phash = perceptual_hash(image_data)
+        self._remember(content_hash, phash, result)
+        save_ocr_cache({
+            "image_hash": content_hash,
+            "perceptual_hash": _phash_hex(phash) if phash is not None else None,
+            **{field: result.get(field) for field in OCR_RESULT_FIELDS}
+        })
+
+
+    def split_pages(self, images: List[Tuple[bytes, str]]) -> List[Tuple[bytes, str]]:
+        """
+        Turn uploaded images into a list of pages, splitting multi-frame TIFFs
+
+        Args:
+            images: (image_bytes, mime_type) per uploaded file, in page order
+
+        Returns:
+            (page_bytes, mime_type) per page, in page order
+
+        Raises:
+            ValueError: If the document has more than OCR_MAX_PAGES pages
+        """
+        pages: List[Tuple[bytes, str]] = []
+        for image_data, mime_type in images:
+            remaining = self.max_pages - len(pages)
+            if remaining <= 0:
+                raise ValueError(f"Too many pages; the maximum is {self.max_pages}")
+            frames = split_image_frames(image_data, max_frames=remaining)
+            # Keep single images as uploaded (and under their sniffed MIME type)
+            pages.extend(frames if len(frames) > 1 else [(image_data, mime_type)])
+        return pages
+
+    async def extract_pages(self, pages: List[Tuple[bytes, str]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        OCR the pages of a document concurrently, yielding each page as it completes
+
+        Concurrency is bounded by the Gemini service's request semaphore, so a
+        long scan cannot starve other requests, and one slow page does not
+        hold back the others.
+
+        Args:
+            pages: (page_bytes, mime_type) in page order
+
+        Yields:
+            OCR result dicts with an added 1-based "page" number, in completion order
+        """
+        async def extract(page: int, image_data: bytes, mime_type: str):
+            return page, await self.extract_text(image_data, mime_type=mime_type)
+
+        tasks = [
+            asyncio.ensure_future(extract(page, image_data, mime_type))
+            for page, (image_data, mime_type) in enumerate(pages, start=1)
+        ]
+        metrics.increment("ocr.pages", len(pages))
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                page, result = await next_done
+                yield {"page": page, **result}
+        finally:
+            # Client disconnected or a page raised - stop the remaining pages
+            for task in tasks:
+                task.cancel()
+
+
+def stitch_pages(page_results: List[Dict[str, Any]]) -> str:
+    """Join the text of successfully extracted pages in page order"""
+    ordered = sorted(page_results, key=lambda result: result["page"])
+    return "\n\n".join(result["text"] for result in ordered if result.get("success"))
+
+
+# Create singleton instance
+ocr_service = OCRService()
@@ -0,0 +1,115 @@
+-- Cache tables used by the backend (run in Supabase SQL Editor)
+
+-- OCR results keyed by image content hash, with a perceptual hash so that
+-- re-encoded or resized copies of the same page also hit
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    image_hash VARCHAR(64) PRIMARY KEY,
+    perceptual_hash VARCHAR(256),
+    text TEXT NOT NULL,
+    character_count INTEGER,
+    word_count INTEGER,
+    mime_type VARCHAR(50),
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ocr_cache_created_at ON ocr_cache (created_at);
+
+-- Closest cached OCR result by perceptual hash: Hamming distance between the
+-- hex-encoded 1024-bit dHashes, at most max_distance bits. Near matches cannot
+-- use an index, so this scans the entries within the TTL window (bit_count
+-- needs Postgres 14+)
+CREATE OR REPLACE FUNCTION match_ocr_perceptual_hash(query_hash TEXT, max_distance INTEGER, cutoff TIMESTAMP)
+RETURNS TABLE (
+    image_hash VARCHAR,
+    text TEXT,
+    character_count INTEGER,
+    word_count INTEGER,
+    mime_type VARCHAR,
+    distance INTEGER
+) AS $$
+    SELECT * FROM (
+        SELECT cached.image_hash, cached.text, cached.character_count, cached.word_count, cached.mime_type,
+               bit_count(('x' || cached.perceptual_hash)::BIT(1024) # ('x' || query_hash)::BIT(1024))::INTEGER AS distance
+        FROM ocr_cache AS cached
+        WHERE cached.perceptual_hash IS NOT NULL
+          AND length(cached.perceptual_hash) = 256
+          AND cached.created_at > cutoff
+    ) AS candidates
+    WHERE candidates.distance <= max_distance
+    ORDER BY candidates.distance, candidates.image_hash
+    LIMIT 1;
+$$ LANGUAGE sql STABLE;
+
+-- Individually cached analysis sections for section-selective requests
+-- (complete analyses are stored in analysis_cache)
+CREATE TABLE IF NOT EXISTS analysis_section_cache (
+    text_hash VARCHAR(64) NOT NULL,
+    language VARCHAR(10) NOT NULL,
+    section VARCHAR(50) NOT NULL,
+    value JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (text_hash, language, section)
+);
+
+-- Fingerprint of the prompt template, model and generation settings that
+-- produced a cached analysis. Entries from an older version are served as
+-- stale while they are regenerated, and evicted gradually
+ALTER TABLE analysis_cache ADD COLUMN IF NOT EXISTS prompt_version VARCHAR(16) NOT NULL DEFAULT 'legacy';
+ALTER TABLE analysis_section_cache ADD COLUMN IF NOT EXISTS prompt_version VARCHAR(16) NOT NULL DEFAULT 'legacy';
+CREATE INDEX IF NOT EXISTS idx_analysis_cache_prompt_version ON analysis_cache (prompt_version, created_at);
+
+-- Usage counts of cached entities, flushed in batches by the backend. The
+-- most used entities are loaded into memory on startup
+ALTER TABLE entity_cache ADD COLUMN IF NOT EXISTS hit_count INTEGER NOT NULL DEFAULT 0;
+CREATE INDEX IF NOT EXISTS idx_entity_cache_hit_count ON entity_cache (hit_count DESC);
+
+CREATE OR REPLACE FUNCTION increment_entity_hits(entity_names TEXT[], entity_types TEXT[], hits INTEGER[])
+RETURNS VOID AS $$
+    UPDATE entity_cache AS cached
+    SET hit_count = cached.hit_count + counted.hits
+    FROM unnest(entity_names, entity_types, hits) AS counted(entity_name, entity_type, hits)
+    WHERE cached.entity_name = counted.entity_name
+      AND cached.entity_type = counted.entity_type;
+$$ LANGUAGE sql;
+
+-- Canonical entity records: surface forms ("Gandhi", "M. K. Gandhi") are
+-- canonicalized (case, punctuation, possessives, leading articles) and mapped
+-- to the entity_cache record of their Wikidata QID
+ALTER TABLE entity_cache ADD COLUMN IF NOT EXISTS wikidata_id VARCHAR(20);
+CREATE INDEX IF NOT EXISTS idx_entity_cache_wikidata_id ON entity_cache (wikidata_id, entity_type);
+
+CREATE TABLE IF NOT EXISTS entity_aliases (
+    alias TEXT NOT NULL,
+    entity_type VARCHAR(50) NOT NULL,
+    entity_name TEXT NOT NULL,
+    wikidata_id VARCHAR(20),
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (alias, entity_type)
+);
+
+-- Entities that no knowledge source knows (misspellings, fictional names,
+-- NER false positives), by canonical alias. Kept apart from entity_cache and
+-- expired much sooner (ENTITY_NEGATIVE_CACHE_TTL_HOURS)
+CREATE TABLE IF NOT EXISTS entity_negative_cache (
+    alias TEXT NOT NULL,
+    entity_type VARCHAR(50) NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (alias, entity_type)
+);
+
+-- Entity analyses per exact text, spaCy model version (including the
+-- extraction mode) and number of enriched entities (max_enrich): the extracted
+-- entities, and the enriched result (NULL when some lookup missed its
+-- deadline or failed). Results older than ENTITY_EXTRACTION_FRESHNESS_HOURS are
+-- re-enriched, from the stored entities unless the dictionary fast path
+-- extracted them
+CREATE TABLE IF NOT EXISTS entity_extraction_cache (
+    text_hash VARCHAR(64) NOT NULL,
+    model_version VARCHAR(128) NOT NULL,
+    entities JSONB NOT NULL,
+    result JSONB,
+    max_enrich INTEGER NOT NULL,
+    enriched_at TIMESTAMP DEFAULT NOW(),
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (text_hash, model_version, max_enrich)
+);
@@ -0,0 +1,170 @@
+"""
+Retry, hedging and repair paths of GeminiService
+
+A scripted fake model is injected through GeminiService(model=...), so no
+API key or network is needed. Each test feeds it one fault and checks the
+analysis result, the calls the service made and the metrics it recorded.
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from analysis_schema import ANALYSIS_STATUS_ERROR, ANALYSIS_STATUS_OK
+from api_key_pool import APIKeyPool
+from gemini_service import GeminiService, RetryPolicy
+from metrics import metrics
+
+TEXT = "Diwali is celebrated across India with lamps and sweets."
+
+ANALYSIS = {
+    "cultural_origin": "Hindu festival of lights with roots in ancient harvest festivals",
+    "cross_cultural_connections": "Shares themes of light over darkness with Hanukkah",
+    "modern_analogy": "Comparable to the New Year season in scale",
+    "timeline_events": [{"year": "500 BCE", "title": "Early harvest festivals"}],
+    "geographic_locations": [{"name": "Ayodhya", "coordinates": {"lat": 26.8, "lng": 82.2}}],
+    "key_concepts": [
+        {"term": "Diya", "definition": "Oil lamp lit during the festival"},
+        {"term": "Rangoli", "definition": "Floor patterns made with coloured powder"},
+    ],
+    "external_resources": {"further_reading": ["https://en.wikipedia.org/wiki/Diwali"]},
+}
+
+TRACKED_METRICS = [
+    "gemini.requests", "gemini.retries", "gemini.retries_exhausted",
+    "gemini.parse_failures", "gemini.repairs", "gemini.hedges", "gemini.hedge_wins",
+]
+
+
+class FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeStream:
+    """Streamed response: yields the body in small chunks, like the SDK"""
+
+    prompt_feedback = None
+    usage_metadata = None
+
+    def __init__(self, body: str, chunk_size: int = 40):
+        self.chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield FakeChunk(chunk)
+
+
+class FakeResponse:
+    """Non-streamed response (section regeneration)"""
+
+    prompt_feedback = None
+    usage_metadata = None
+
+    def __init__(self, body: str):
+        self.text = body
+
+
+class FakeGeminiModel:
+    """
+    Scripted stand-in for a Gemini model
+
+    Each call consumes the next step of the script; once the script is
+    exhausted, calls return the requested sections of ANALYSIS. A step is an
+    exception instance (raised), a string (the response body) or a float
+    (seconds to stall before answering normally).
+    """
+
+    def __init__(self, script: Optional[List[Any]] = None):
+        self.script = list(script or [])
+        self.calls: List[List[str]] = []
+
+    async def generate_content_async(self, contents, generation_config=None, stream: bool = False):
+        sections = list(generation_config["response_schema"]["properties"])
+        self.calls.append(sections)
+
+        step = self.script.pop(0) if self.script else None
+        if isinstance(step, BaseException):
+            raise step
+        if isinstance(step, float):
+            await asyncio.sleep(step)
+            step = None
+        body = step if step is not None else json.dumps({section: ANALYSIS[section] for section in sections})
+
+        return FakeStream(body) if stream else FakeResponse(body)
+
+
+def analyze(model: FakeGeminiModel, **policy_overrides):
+    """Run one analysis against the fake model; returns (result, metric deltas)"""
+    policy = RetryPolicy(**{
+        "max_attempts": 3, "base_delay": 0.01, "max_delay": 0.05, "request_timeout": 10.0,
+        **policy_overrides,
+    })
+    service = GeminiService(model=model, vision_model=model, retry_policy=policy, key_pool=APIKeyPool([]))
+
+    before = {metric: metrics.get(metric) for metric in TRACKED_METRICS}
+    result = asyncio.run(service.analyze_cultural_context(TEXT, "en"))
+    delta = {metric: metrics.get(metric) - before[metric] for metric in TRACKED_METRICS}
+    return result, delta
+
+
+def test_transient_quota_errors_are_retried():
+    model = FakeGeminiModel([google_exceptions.ResourceExhausted("quota"), google_exceptions.TooManyRequests("rate")])
+
+    result, delta = analyze(model)
+
+    assert result["status"] == ANALYSIS_STATUS_OK
+    assert result["cultural_origin"] == ANALYSIS["cultural_origin"]
+    assert len(model.calls) == 3
+    assert delta["gemini.retries"] == 2
+    assert delta["gemini.retries_exhausted"] == 0
+
+
+def test_persistent_server_errors_exhaust_retries():
+    model = FakeGeminiModel([google_exceptions.ServiceUnavailable("unavailable")] * 3)
+
+    result, delta = analyze(model)
+
+    assert result["status"] == ANALYSIS_STATUS_ERROR
+    assert len(model.calls) == 3
+    assert delta["gemini.retries_exhausted"] == 1
+
+
+def test_truncated_stream_is_repaired_locally():
+    body = json.dumps(ANALYSIS)
+    # Cut off inside the second key concept
+    model = FakeGeminiModel([body[:body.index('"Rangoli"') + len('"Rang')]])
+
+    result, delta = analyze(model)
+
+    assert result["status"] == ANALYSIS_STATUS_OK
+    assert [concept["term"] for concept in result["key_concepts"]] == ["Diya"]
+    assert len(model.calls) == 1
+    assert delta["gemini.repairs"] == 1
+
+
+def test_invalid_required_section_is_regenerated_alone():
+    model = FakeGeminiModel([json.dumps(dict(ANALYSIS, cultural_origin=["not", "a", "string"]))])
+
+    result, delta = analyze(model)
+
+    assert result["status"] == ANALYSIS_STATUS_OK
+    assert result["cultural_origin"] == ANALYSIS["cultural_origin"]
+    assert model.calls[1:] == [["cultural_origin"]]
+    assert delta["gemini.parse_failures"] == 1
+
+
+def test_slow_call_is_hedged():
+    # Latency history the hedge percentile is computed from
+    for _ in range(5):
+        metrics.observe("gemini.latency.analysis", 0.05)
+    model = FakeGeminiModel([2.0])
+
+    result, delta = analyze(model, hedge_enabled=True, hedge_min_samples=5)
+
+    assert result["status"] == ANALYSIS_STATUS_OK
+    assert len(model.calls) == 2
+    assert delta["gemini.hedges"] == 1
+    assert delta["gemini.hedge_wins"] == 1
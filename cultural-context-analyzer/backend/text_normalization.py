@@ -0,0 +1,47 @@
+"""
+Canonical text normalization for cache keys
+
+Inputs that differ only in Unicode representation, whitespace, letter case
+or typographic punctuation (curly quotes, dashes, ellipses) should share a
+cache entry. normalize_text maps all of them to one canonical form.
+"""
+
+import re
+import unicodedata
+
+# Typographic punctuation folded to its ASCII equivalent
+PUNCTUATION_FOLDS = str.maketrans({
+    "‘": "'", "’": "'", "‚": "'", "‛": "'", "′": "'",
+    "“": '"', "”": '"', "„": '"', "‟": '"', "″": '"',
+    "«": '"', "»": '"',
+    "‐": "-", "‑": "-", "‒": "-", "–": "-", "—": "-", "―": "-", "−": "-",
+    "­": None,  # soft hyphen
+    "​": None, "‌": None, "‍": None, "﻿": None,  # zero-width characters
+})
+
+WHITESPACE = re.compile(r"\s+")
+
+# Whitespace before closing punctuation ("word ," -> "word,")
+SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+([,.;:!?)\]}])")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text to its canonical form for hashing and comparison
+
+    Applies Unicode NFKC (full-width forms, ligatures, non-breaking spaces),
+    folds typographic quotes/dashes/ellipses to ASCII, collapses whitespace
+    and case-folds.
+
+    Args:
+        text: Input text
+
+    Returns:
+        Canonical text
+    """
+    # NFKC also turns the ellipsis character into "..."
+    text = unicodedata.normalize("NFKC", text)
+    text = text.translate(PUNCTUATION_FOLDS)
+    text = WHITESPACE.sub(" ", text).strip()
+    text = SPACE_BEFORE_PUNCTUATION.sub(r"\1", text)
+    return text.casefold()
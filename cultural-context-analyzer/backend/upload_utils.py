@@ -0,0 +1,236 @@
+"""
+Upload handling for the image endpoints
+
+Oversized uploads are rejected as early as possible so a burst of large
+requests cannot pin memory:
+1. UploadSizeLimitMiddleware checks Content-Length before the body is read
+   and, for requests without one (chunked encoding), aborts once the body
+   exceeds the limit while it streams in
+2. sniff_image reads only the image header (format and dimensions) from the
+   spooled upload, without decoding any pixels
+3. read_upload reads the upload in chunks, enforcing the byte limit as bytes
+   arrive instead of after a single unbounded read
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from image_preprocessing import image_mime_type
+
+# Gemini accepts inline images up to 20MB
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+
+# Whole multipart request: one image plus form fields and multipart framing
+MAX_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(MAX_IMAGE_BYTES + 1024 * 1024)))
+
+# Multi-page OCR requests carry several images
+MAX_MULTIPAGE_REQUEST_BYTES = int(os.getenv("MAX_MULTIPAGE_UPLOAD_REQUEST_BYTES", str(100 * 1024 * 1024)))
+
+# Decoded size guard against decompression bombs (width * height)
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))
+
+# Formats Gemini Vision accepts directly or after preprocessing (MPO is the
+# multi-picture JPEG many phone cameras write). HEIF/HEIC is not supported:
+# Pillow has no decoder for it without the pillow-heif plugin
+ALLOWED_IMAGE_FORMATS = {"JPEG", "MPO", "PNG", "WEBP", "GIF", "BMP", "TIFF"}
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class RequestTooLarge(HTTPException):
+    """
+    Raised while streaming a request body that exceeds the limit
+
+    An HTTPException so that FastAPI's body parsing re-raises it as a 413
+    instead of wrapping it in a generic 400 parsing error.
+    """
+
+    def __init__(self, max_bytes: int):
+        super().__init__(
+            status_code=413,
+            detail=f"Upload too large. Maximum size is {max_bytes // (1024 * 1024)}MB."
+        )
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Image file too large. Maximum size is {max_bytes // (1024 * 1024)}MB."
+    )
+
+
+class UploadSizeLimitMiddleware:
+    """ASGI middleware rejecting multipart uploads larger than the configured limit"""
+
+    def __init__(self, app: ASGIApp, max_bytes: int = MAX_REQUEST_BYTES, path_limits: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            app: Wrapped ASGI application
+            max_bytes: Default limit for multipart request bodies
+            path_limits: Per-path overrides, e.g. for multi-image endpoints
+        """
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+
+        # Cheap early rejection: nothing of the body has been read yet
+        content_length = headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            await self._reject(send, max_bytes)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise RequestTooLarge(max_bytes)
+            return message
+
+        async def tracking_send(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except RequestTooLarge:
+            if not response_started:
+                await self._reject(send, max_bytes)
+
+    async def _reject(self, send: Send, max_bytes: int):
+        body = json.dumps({"detail": RequestTooLarge(max_bytes).detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def sniff_image(file: UploadFile) -> Dict[str, Any]:
+    """
+    Identify an uploaded image from its header without decoding it
+
+    PIL's Image.open is lazy: it parses the header (format, size, mode) and
+    only reads pixel data on load().
+
+    Args:
+        file: Uploaded file (its spooled file is rewound afterwards)
+
+    Returns:
+        Dictionary with format, mime_type, width and height
+
+    Raises:
+        HTTPException: 400 if the upload is not a supported image or is too large to decode
+    """
+    try:
+        with Image.open(file.file) as image:
+            image_format, (width, height) = image.format, image.size
+    except Exception:
+        raise HTTPException(
+            status_code=400,
+            detail="File must be an image (JPG, PNG, etc.)"
+        )
+    finally:
+        file.file.seek(0)
+
+    if image_format not in ALLOWED_IMAGE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported image format: {image_format}. Supported: JPEG, PNG, WebP, GIF, BMP, TIFF."
+        )
+
+    if width * height > MAX_IMAGE_PIXELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Image dimensions too large ({width}x{height})."
+        )
+
+    return {
+        "format": image_format,
+        "mime_type": image_mime_type(image_format, f"image/{image_format.lower()}"),
+        "width": width,
+        "height": height,
+    }
+
+
+async def read_upload(file: UploadFile, max_bytes: int = MAX_IMAGE_BYTES) -> bytes:
+    """
+    Read an uploaded file in chunks, enforcing the size limit as bytes arrive
+
+    Args:
+        file: Uploaded file
+        max_bytes: Maximum accepted size
+
+    Returns:
+        File contents
+
+    Raises:
+        HTTPException: 413 if the file exceeds max_bytes
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    chunks = []
+    total = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise _too_large(max_bytes)
+        chunks.append(chunk)
+
+    return b"".join(chunks)
+
+
+async def read_image_upload(file: UploadFile, max_bytes: int = MAX_IMAGE_BYTES):
+    """
+    Validate and read an uploaded image
+
+    Args:
+        file: Uploaded image file
+        max_bytes: Maximum accepted size
+
+    Returns:
+        (image_bytes, image_info) - image_info as returned by sniff_image
+
+    Raises:
+        HTTPException: 400 for non-images, 413 for oversized uploads
+    """
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(
+            status_code=400,
+            detail="File must be an image (JPG, PNG, etc.)"
+        )
+
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    image_info = sniff_image(file)
+    image_data = await read_upload(file, max_bytes)
+    return image_data, image_info
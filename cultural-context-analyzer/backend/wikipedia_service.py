@@ -48,7 +48,8 @@ class WikipediaService:
     def get_entity_summary(
         self, 
         entity_name: str, 
-        entity_type: str = "MISC"
+        entity_type: str = "MISC",
+        errors: Optional[List[str]] = None
     ) -> Optional[Dict[str, Any]]:
         """
         Fetch summary for a named entity from Wikipedia
@@ -56,6 +57,7 @@ class WikipediaService:
         Args:
             entity_name: Name of the entity to look up
             entity_type: Type of entity (PERSON, ORG, GPE, EVENT, WORK_OF_ART, etc.)
+            errors: List to append "Wikipedia" to if a request fails
         
         Returns:
             Dictionary with entity summary data or None if not found
@@ -71,7 +73,7 @@ class WikipediaService:
             
             if not page.exists():
                 # Try search if direct lookup fails
-                search_results = self._search_wikipedia(clean_name)
+                search_results = self._search_wikipedia(clean_name, errors=errors)
                 if search_results:
                     page = self.wiki.page(search_results[0])
                 else:
@@ -100,15 +102,18 @@ class WikipediaService:
             
         except Exception as e:
             print(f"❌ Error fetching Wikipedia data for '{entity_name}': {e}")
+            if errors is not None:
+                errors.append("Wikipedia")
             return None
     
-    def _search_wikipedia(self, query: str, limit: int = 5) -> List[str]:
+    def _search_wikipedia(self, query: str, limit: int = 5, errors: Optional[List[str]] = None) -> List[str]:
         """
         Search Wikipedia for matching pages
         
         Args:
             query: Search query
             limit: Maximum number of results
+            errors: List to append "Wikipedia" to if the request fails
         
         Returns:
             List of page titles
@@ -133,10 +138,14 @@ class WikipediaService:
                 data = response.json()
                 return data[1] if len(data) > 1 else []
             
+            if errors is not None:
+                errors.append("Wikipedia")
             return []
             
         except Exception as e:
             print(f"❌ Wikipedia search error: {e}")
+            if errors is not None:
+                errors.append("Wikipedia")
             return []
     
     def _extract_summary(self, full_summary: str, max_sentences: int = 3) -> str:
@@ -246,12 +255,13 @@ class WikipediaService:
         
         return "general"
     
-    def get_wikidata_info(self, entity_name: str) -> Optional[Dict[str, Any]]:
+    def get_wikidata_info(self, entity_name: str, errors: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
         """
         Fetch additional structured data from Wikidata
         
         Args:
             entity_name: Name of the entity
+            errors: List to append "Wikidata" to if the request fails
         
         Returns:
             Dictionary with Wikidata information or None
@@ -275,6 +285,8 @@ class WikipediaService:
             )
             
             if response.status_code != 200:
+                if errors is not None:
+                    errors.append("Wikidata")
                 return None
             
             search_data = response.json()
@@ -294,13 +306,17 @@ class WikipediaService:
             
         except Exception as e:
             print(f"❌ Wikidata error for '{entity_name}': {e}")
+            if errors is not None:
+                errors.append("Wikidata")
             return None
     
     def enrich_entity(
         self, 
         entity_name: str, 
         entity_type: str = "MISC",
-        use_multi_source: bool = True
+        use_multi_source: bool = True,
+        wikidata: Optional[Dict[str, Any]] = None,
+        wikidata_resolved: bool = False
     ) -> Dict[str, Any]:
         """
         Comprehensive entity enrichment - now with multi-source verification!
@@ -314,9 +330,12 @@ class WikipediaService:
             entity_name: Name of the entity
             entity_type: Type of entity
             use_multi_source: Whether to use multi-source lookup (default: True)
+            wikidata: Already resolved Wikidata info (from get_wikidata_enhanced)
+            wikidata_resolved: Whether `wikidata` was looked up (None then means no match)
         
         Returns:
-            Combined enriched data dictionary with confidence scores
+            Combined enriched data dictionary with confidence scores. When nothing
+            is found, "failed_sources" lists the sources that could not be queried
         """
         enriched_data = {
             "entity_name": entity_name,
@@ -327,13 +346,16 @@ class WikipediaService:
             "cultural_significance": "unknown",
             "source": None,
             "confidence": "low",
-            "sources_consulted": []
+            "sources_consulted": [],
+            "failed_sources": []
         }
         
         # Try multi-source lookup first (more accurate and up-to-date)
         if use_multi_source:
             try:
-                multi_data = multi_source_service.get_comprehensive_info(entity_name, entity_type)
+                multi_data = multi_source_service.get_comprehensive_info(
+                    entity_name, entity_type, wikidata=wikidata, wikidata_resolved=wikidata_resolved
+                )
                 
                 if multi_data and multi_data.get("sources_consulted"):
                     # Multi-source found data - prioritize this
@@ -358,20 +380,25 @@ class WikipediaService:
                     
                     print(f"✅ Multi-source enrichment successful for '{entity_name}'")
                     return enriched_data
+                
+                enriched_data["failed_sources"].extend(multi_data.get("failed_sources", []) if multi_data else [])
                     
             except Exception as e:
                 print(f"⚠️  Multi-source lookup failed, falling back to Wikipedia: {e}")
+                enriched_data["failed_sources"].append("Multi-Source")
         
         # Fallback to Wikipedia-only approach
-        wiki_data = self.get_entity_summary(entity_name, entity_type)
+        wiki_data = self.get_entity_summary(entity_name, entity_type, errors=enriched_data["failed_sources"])
         
         if wiki_data:
             enriched_data.update(wiki_data)
             enriched_data["sources_consulted"].append("Wikipedia")
             enriched_data["confidence"] = "medium (Wikipedia only)"
         else:
-            # Last resort: try Wikidata only
-            wikidata_info = self.get_wikidata_info(entity_name)
+            # Last resort: try Wikidata only (reusing the caller's lookup if there was one)
+            wikidata_info = wikidata if wikidata_resolved else self.get_wikidata_info(
+                entity_name, errors=enriched_data["failed_sources"]
+            )
             
             if wikidata_info:
                 enriched_data["summary"] = wikidata_info.get("description", "No description available")